@@ -3,13 +3,22 @@
 
 # 应用版本号
 APP_VERSION = "0.1.10"
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, session, make_response, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
 import os
-import json
 import logging
+import threading
 from datetime import datetime
 import re
-from urllib.parse import quote
+import sys
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+
+# 复用后端的存储层（backend/app/storage 不依赖后端应用本身，可作为顶层包导入）
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend', 'app'))
+from storage import (result_cache, icon_cache, create_file_engine, ColumnarTable,
+                     sqlalchemy_engine_options, install_sqlite_tuning, install_generation_tracking, database_generation,
+                     plan_relocation, start_relocation, resume_relocations, get_relocation, pending_source,
+                     send_icon_file, send_cached_icon,
+                     FileValidators, BlobStore, parse_blob_name, icon_mimetype, PrecompressedStore)
 
 # 尝试导入额外依赖，但即使失败也继续运行
 try:
@@ -167,13 +176,49 @@ if not os.path.exists('data'):
 ICONS_DATA_FILE = 'data/icons_metadata.json'
 CATEGORIES_DATA_FILE = 'data/categories.json'
 
+# 文件系统存储引擎：indexed（默认，JSON快照 + 追加日志 + 索引）或 json（整文件读写）
+FILE_STORAGE_ENGINE = os.getenv('FILE_STORAGE_ENGINE', 'indexed')
+icon_engine = create_file_engine(ICONS_DATA_FILE, FILE_STORAGE_ENGINE, index_fields=('category_id', 'category_name'))
+category_engine = create_file_engine(CATEGORIES_DATA_FILE, FILE_STORAGE_ENGINE, index_fields=())
+
+# 图标文件的强ETag（内容的SHA-256，每个文件只计算一次），两种存储方式都保存在数据目录中
+FILE_VALIDATORS_FILE = 'data/file_validators.json'
+file_validators = FileValidators(create_file_engine(FILE_VALIDATORS_FILE, FILE_STORAGE_ENGINE,
+                                                    index_fields=FileValidators.INDEX_FIELDS),
+                                 app.config['ICON_STORAGE_PATH'])
+
+# 删除分类后图标文件迁移任务的进度和移动列表，保存在数据目录中，任何工作进程都可以查询进度、找到尚未移动的文件
+RELOCATIONS_DIR = 'data/relocations'
+
+# 图标文件响应的 Cache-Control，浏览器和CDN在有效期内直接使用缓存，过期后用ETag重新验证
+ICON_CACHE_CONTROL = os.getenv('ICON_CACHE_CONTROL', 'public, max-age=86400')
+
+# 内容寻址存储：开启后相同内容的上传只保存一份，分类目录下的图标文件是指向它的硬链接
+ICON_DEDUP = os.getenv('ICON_DEDUP', 'false').lower() == 'true'
+blob_store = BlobStore(app.config['ICON_STORAGE_PATH'])
+
+# 不可变URL（/blobs/<SHA-256><扩展名>）的 Cache-Control，内容永远不会变化
+ICON_IMMUTABLE_CACHE_CONTROL = os.getenv('ICON_IMMUTABLE_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+
+# SVG/ICO 的 gzip/brotli 预压缩版本，上传后在后台生成，按 Accept-Encoding 发送
+ICON_PRECOMPRESS = os.getenv('ICON_PRECOMPRESS', 'true').lower() == 'true'
+precompressed = PrecompressedStore(app.config['ICON_STORAGE_PATH'], enabled=ICON_PRECOMPRESS)
+
+# 热点图标缓存在每个工作进程内独立保存，通过数据目录中的共享文件同步失效
+icon_cache.share('data/icon_cache.epoch')
+
 # 简化的数据模型类（用于文件系统存储）
 class SimpleCategory:
+    __slots__ = ('id', 'name')
+    
     def __init__(self, id, name):
         self.id = id
         self.name = name
 
 class SimpleIcon:
+    # 使用__slots__代替每个对象的__dict__，大量图标时内存占用更小
+    __slots__ = ('id', 'filename', 'original_filename', 'category_id', 'category_name', 'upload_date', 'is_favorite')
+    
     def __init__(self, id, filename, original_filename, category_id=1, category_name='未分类', **kwargs):
         self.id = id
         self.filename = filename
@@ -199,6 +244,8 @@ if sqlalchemy_available:
         db_path = os.path.join(os.getcwd(), 'data', 'icons.db')
         app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', f'sqlite:///{db_path}')
         app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        # 连接池参数；SQLite 的 PRAGMA（WAL、synchronous、mmap_size 等，见 SQLITE_* 环境变量）对每个连接生效
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlalchemy_engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
         
         # 确保数据库目录有写入权限
         if not os.path.exists('data'):
@@ -212,6 +259,8 @@ if sqlalchemy_available:
         
         # 初始化数据库
         db = SQLAlchemy(app)
+        with app.app_context():
+            install_sqlite_tuning(db.engine)
         
         # 定义数据库模型
         class Category(db.Model):
@@ -242,75 +291,108 @@ if sqlalchemy_available:
         sqlalchemy_available = False
 
 # 文件系统存储函数
-def load_json_data(filename, default_data=None):
-    """从JSON文件加载数据"""
-    if default_data is None:
-        default_data = []
-    
-    try:
-        if os.path.exists(filename):
-            with open(filename, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"加载{filename}失败: {e}")
-    
-    return default_data
-
-def save_json_data(filename, data):
-    """保存数据到JSON文件"""
-    try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2, default=str)
-        return True
-    except Exception as e:
-        print(f"保存{filename}失败: {e}")
-        return False
-
 def get_file_categories():
     """从文件系统获取分类列表"""
-    categories = load_json_data(CATEGORIES_DATA_FILE, [])
+    categories = category_engine.list_all()
     if not categories:
         # 创建默认分类
-        categories = [{'id': 1, 'name': '未分类'}]
-        save_json_data(CATEGORIES_DATA_FILE, categories)
+        categories = [category_engine.insert({'id': 1, 'name': '未分类'})]
     
     # 转换为SimpleCategory对象列表
     return [SimpleCategory(**cat) for cat in categories]
 
-def get_file_icons():
-    """从文件系统获取所有图标"""
-    icons_data = load_json_data(ICONS_DATA_FILE, [])
+def make_simple_icon(icon_data, category_name='未分类'):
+    """将图标记录转换为SimpleIcon对象，数据不完整时返回None"""
+    # 确保有category_name字段（不修改存储中的记录）
+    if icon_data.get('category_name') is None:
+        icon_data = dict(icon_data, category_name=category_name)
+    
+    # 添加额外的安全检查，确保必要字段存在
+    required_fields = ['id', 'filename', 'original_filename']
+    missing_fields = [f for f in required_fields if icon_data.get(f) is None]
+    if missing_fields:
+        print(f"警告: 图标数据缺少必要字段 {missing_fields}, 跳过该图标")
+        return None
+        
+    try:
+        return SimpleIcon(**icon_data)
+    except Exception as e:
+        print(f"创建SimpleIcon对象失败: {e}, 图标数据: {icon_data}")
+        return None
+
+def make_simple_icons(records):
+    """将图标记录转换为SimpleIcon对象列表"""
     categories_dict = {cat.id: cat.name for cat in get_file_categories()}
     
-    # 转换为SimpleIcon对象列表
     icons = []
-    for icon_data in icons_data:
-        # 确保有category_name字段
-        if 'category_name' not in icon_data:
-            icon_data['category_name'] = categories_dict.get(icon_data.get('category_id'), '未分类')
-        
-        # 添加额外的安全检查，确保必要字段存在
-        required_fields = ['id', 'filename', 'original_filename']
-        missing_fields = [f for f in required_fields if f not in icon_data]
-        if missing_fields:
-            print(f"警告: 图标数据缺少必要字段 {missing_fields}, 跳过该图标")
-            continue
-            
-        try:
-            icons.append(SimpleIcon(**icon_data))
-        except Exception as e:
-            print(f"创建SimpleIcon对象失败: {e}, 图标数据: {icon_data}")
+    for icon_data in records:
+        icon = make_simple_icon(icon_data, categories_dict.get(icon_data.get('category_id'), '未分类'))
+        if icon:
+            icons.append(icon)
     
     return icons
 
+# 列式图标表，按存储引擎的数据版本缓存，数据变化后重新构建
+ICON_TABLE_FIELDS = ('id', 'filename', 'original_filename', 'category_id', 'category_name', 'upload_date', 'is_favorite')
+_icon_table_cache = {'generation': None, 'table': None}
+_icon_table_lock = threading.Lock()
+
+def get_file_icon_table():
+    """获取列式图标表（id/category_id 保存在数组中，分类名称字典编码，文件名等字符串连续保存）
+    
+    表通过 icon_engine.scan() 逐条构建，快照中的记录不会因此全部解码并常驻内存。
+    """
+    generation = icon_engine.generation()
+    with _icon_table_lock:
+        if _icon_table_cache['table'] is None or _icon_table_cache['generation'] != generation:
+            _icon_table_cache['table'] = ColumnarTable(
+                icon_engine.scan(), ICON_TABLE_FIELDS,
+                int_fields=('id', 'category_id'),
+                symbol_fields=('category_name', 'is_favorite'),
+                string_fields=('filename', 'original_filename', 'upload_date')
+            )
+            _icon_table_cache['generation'] = generation
+        return _icon_table_cache['table']
+
+def get_file_icons(category_id=None):
+    """从文件系统获取所有图标，可按分类筛选（在列式表上完成）"""
+    table = get_file_icon_table()
+    rows = table.rows_where('category_id', category_id) if category_id is not None else None
+    # 记录中缺少的字段在表中为None，去掉后由SimpleIcon使用默认值
+    return make_simple_icons({field: value for field, value in row.items() if value is not None}
+                             for row in table.rows(rows))
+
+def get_file_icons_page(limit, after=None):
+    """从文件系统按ID顺序分页获取图标，只解析本页的记录
+    
+    Returns:
+        (图标列表, 下一页游标)
+    """
+    records, next_cursor = icon_engine.list_page(limit, after)
+    return make_simple_icons(records), next_cursor
+
+def get_file_icon(icon_id):
+    """从文件系统按ID获取单个图标（主键索引查找）"""
+    icon_data = icon_engine.get(icon_id)
+    if not icon_data:
+        return None
+    
+    category = get_file_category(icon_data.get('category_id'))
+    return make_simple_icon(icon_data, category.name if category else '未分类')
+
+def get_file_category(category_id):
+    """从文件系统按ID获取单个分类，ID可以是字符串形式"""
+    try:
+        category_data = category_engine.get(int(category_id))
+    except (TypeError, ValueError):
+        return None
+    return SimpleCategory(**category_data) if category_data else None
+
 def add_file_category(category_name):
     """添加新分类到文件系统"""
-    categories = load_json_data(CATEGORIES_DATA_FILE, [])
-    
     # 检查分类是否已存在
-    for cat in categories:
-        if cat['name'] == category_name:
-            return False
+    if category_engine.find_first('name', category_name):
+        return False
     
     # 创建新分类目录
     category_path = os.path.join(app.config['ICON_STORAGE_PATH'], category_name)
@@ -318,22 +400,14 @@ def add_file_category(category_name):
         os.makedirs(category_path)
     
     # 添加分类数据
-    new_id = max([cat['id'] for cat in categories], default=0) + 1
-    categories.append({'id': new_id, 'name': category_name})
-    save_json_data(CATEGORIES_DATA_FILE, categories)
+    category_engine.insert({'name': category_name})
     
     return True
 
 def add_file_icon(filename, original_filename, category_id=1, category_name='未分类'):
     """添加新图标到文件系统"""
-    icons = load_json_data(ICONS_DATA_FILE, [])
-    
-    # 生成新ID
-    new_id = max([icon['id'] for icon in icons], default=0) + 1
-    
-    # 添加图标数据
+    # 添加图标数据（ID由存储引擎分配）
     new_icon = {
-        'id': new_id,
         'filename': filename,
         'original_filename': original_filename,
         'category_id': category_id,
@@ -342,36 +416,61 @@ def add_file_icon(filename, original_filename, category_id=1, category_name='未
         'is_favorite': False
     }
     
-    icons.append(new_icon)
-    save_json_data(ICONS_DATA_FILE, icons)
+    return icon_engine.insert(new_icon)['id']
+
+def add_file_icons(entries, category_id=1, category_name='未分类'):
+    """批量添加图标到文件系统，元数据只写入一次
+    
+    Args:
+        entries: (文件名, 原始文件名) 列表
+        category_id: 分类ID
+        category_name: 分类名称
     
-    return new_id
+    Returns:
+        新图标的ID列表（由存储引擎一次分配）
+    """
+    upload_date = str(datetime.utcnow())
+    inserted = icon_engine.insert_many([{
+        'filename': filename,
+        'original_filename': original_filename,
+        'category_id': category_id,
+        'category_name': category_name,
+        'upload_date': upload_date,
+        'is_favorite': False
+    } for filename, original_filename in entries])
+    return [icon['id'] for icon in inserted]
+
+def forget_icon_file(file_path):
+    """图标文件被删除后丢弃它的ETag、内存缓存，以及不再被其他图标使用的预压缩版本"""
+    digest = file_validators.forget(file_path)
+    if digest and not file_validators.in_use(digest):
+        precompressed.discard(digest)
+    icon_cache.invalidate(file_path)
+
+def move_icon_file(old_path, new_path):
+    """图标文件被重命名或移动后把ETag转到新路径，丢弃两个路径的内存缓存（新路径上可能有被覆盖的文件），
+    以及被覆盖的文件不再使用的预压缩版本"""
+    replaced = file_validators.move(old_path, new_path)
+    if replaced and not file_validators.in_use(replaced):
+        precompressed.discard(replaced)
+    icon_cache.invalidate(old_path)
+    icon_cache.invalidate(new_path)
 
 def delete_file_icon(icon_id):
     """从文件系统删除图标"""
-    icons = load_json_data(ICONS_DATA_FILE, [])
-    icon_to_delete = None
-    
-    # 查找要删除的图标
-    for i, icon in enumerate(icons):
-        if icon['id'] == icon_id:
-            icon_to_delete = icon
-            del icons[i]
-            break
-    
+    # 删除图标记录
+    icon_to_delete = icon_engine.delete(icon_id)
     if not icon_to_delete:
         return False
     
-    # 保存更新后的数据
-    save_json_data(ICONS_DATA_FILE, icons)
-    
     # 删除文件
     file_path = os.path.join(app.config['ICON_STORAGE_PATH'], 
                            icon_to_delete.get('category_name', '未分类'), 
                            icon_to_delete['filename'])
     if os.path.exists(file_path):
         try:
-            os.remove(file_path)
+            blob_store.release(file_path)
+            forget_icon_file(file_path)
         except Exception as e:
             print(f"删除文件失败: {e}")
     
@@ -397,6 +496,9 @@ with app.app_context():
             # 使用数据库方式
             db.create_all()
             
+            # 写事务提交时递增共享的数据版本，所有工作进程的查询结果缓存都能随之失效
+            install_generation_tracking(db)
+            
             # 创建默认分类
             default_category = Category.query.filter_by(name='未分类').first()
             if not default_category:
@@ -430,6 +532,28 @@ def generate_secure_filename(filename):
     secure_name = f"icon_{timestamp}.{ext}" if ext else f"icon_{timestamp}"
     return secure_name
 
+def allocate_filenames(category_path, original_filenames):
+    """为一批上传的文件分配分类文件夹中不重复的文件名
+    
+    同一秒内生成的文件名相同，重复的依次追加 _1、_2 ...；
+    只读取一次文件夹内容，不为每个候选文件名检查文件是否存在。
+    """
+    taken = set(os.listdir(category_path))
+    next_number = {}
+    filenames = []
+    for original_filename in original_filenames:
+        filename = generate_secure_filename(original_filename)
+        base, ext = os.path.splitext(filename)
+        number = next_number.get(filename, 0)
+        candidate = filename if number == 0 else f"{base}_{number}{ext}"
+        while candidate in taken:
+            number += 1
+            candidate = f"{base}_{number}{ext}"
+        next_number[filename] = number + 1
+        taken.add(candidate)
+        filenames.append(candidate)
+    return filenames
+
 def create_category_folder(category_name):
     """创建分类文件夹"""
     category_path = os.path.join(app.config['ICON_STORAGE_PATH'], category_name)
@@ -443,32 +567,89 @@ def sanitize_path(path):
     sanitized = re.sub(r'[\\\:\*\?"\<\>\|]', '_', path)
     return sanitized
 
+# 两种存储方式都返回 SimpleCategory/SimpleIcon 对象：不依赖数据库会话，可以放入查询结果缓存跨请求使用
 def get_categories():
     """获取所有分类，兼容两种存储方式"""
     if sqlalchemy_available:
         try:
-            return Category.query.all()
+            return [SimpleCategory(category_id, name)
+                    for category_id, name in db.session.query(Category.id, Category.name).all()]
         except Exception as e:
             print(f"获取数据库分类失败: {e}")
     return get_file_categories()
 
+def query_db_icons():
+    """查询图标及其分类名称的列（同一条查询中连接分类表，不加载模型对象）"""
+    return db.session.query(Icon.id, Icon.filename, Icon.original_filename, Icon.category_id, Category.name,
+                            Icon.upload_date, Icon.is_favorite).outerjoin(Category, Icon.category_id == Category.id)
+
+def make_db_simple_icons(rows):
+    """将 query_db_icons() 的结果行转换为SimpleIcon对象列表"""
+    return [SimpleIcon(icon_id, filename, original_filename, category_id, category_name or '未分类',
+                       upload_date=upload_date, is_favorite=is_favorite)
+            for icon_id, filename, original_filename, category_id, category_name, upload_date, is_favorite in rows]
+
 def get_icons():
     """获取所有图标，兼容两种存储方式"""
     if sqlalchemy_available:
         try:
-            return Icon.query.all()
+            return make_db_simple_icons(query_db_icons().all())
         except Exception as e:
             print(f"获取数据库图标失败: {e}")
     return get_file_icons()
 
+def get_icons_page(limit, after=None):
+    """按ID顺序分页获取图标（键集分页），兼容两种存储方式
+    
+    Returns:
+        (图标列表, 下一页游标)，没有更多图标时游标为None
+    """
+    if sqlalchemy_available:
+        try:
+            query = query_db_icons()
+            if after is not None:
+                query = query.filter(Icon.id > after)
+            icons = make_db_simple_icons(query.order_by(Icon.id).limit(limit + 1).all())
+            if len(icons) > limit:
+                return icons[:limit], icons[limit - 1].id
+            return icons, None
+        except Exception as e:
+            print(f"获取数据库图标失败: {e}")
+    return get_file_icons_page(limit, after)
+
+def data_generation():
+    """当前数据的版本标识，数据库（任何工作进程）或文件存储中的任何写入都会使其改变"""
+    return (database_generation(db) if sqlalchemy_available else 0,
+            icon_engine.generation(), category_engine.generation())
+
+# 首页每页显示的图标数量，0表示一次显示全部图标
+INDEX_PAGE_SIZE = int(os.getenv('INDEX_PAGE_SIZE', '0'))
+
 # 路由定义
 @app.route('/')
 def index():
-    # 获取所有分类和图标，兼容两种存储方式
-    categories = get_categories()
-    icons = get_icons()
+    # 指定了 limit/after 或配置了 INDEX_PAGE_SIZE 时按ID分页
+    limit = request.args.get('limit', INDEX_PAGE_SIZE, type=int)
+    after = request.args.get('after', type=int)
+    if after is not None and limit <= 0:
+        limit = 100
+    
+    def load_index():
+        # 获取所有分类和图标，兼容两种存储方式
+        categories = get_categories()
+        next_cursor = None
+        if limit > 0:
+            icons, next_cursor = get_icons_page(limit, after)
+        else:
+            icons = get_icons()
+        return categories, icons, next_cursor
     
-    return render_template('index.html', categories=categories, icons=icons)
+    # 数据未变化时直接使用缓存的查询结果（页面中有会话相关内容，只缓存数据，不缓存HTML）
+    categories, icons, next_cursor = result_cache.get_or_compute(
+        ('index', limit, after, data_generation()), load_index)
+    
+    return render_template('index.html', categories=categories, icons=icons,
+                           next_cursor=next_cursor, page_limit=limit)
 
 @app.route('/upload', methods=['POST'])
 @login_required
@@ -511,19 +692,18 @@ def upload_icon():
                 category_id = 1
         else:
             # 使用文件系统存储的分类
-            categories = get_file_categories()
-            category_name = '未分类'
-            for cat in categories:
-                if str(cat.id) == category_id:
-                    category_name = cat.name
-                    break
+            category = get_file_category(category_id)
+            category_name = category.name if category else '未分类'
         
         # 创建分类文件夹
         category_path = create_category_folder(category_name)
         
-        # 保存文件
+        # 保存文件（开启去重时相同内容只保存一份）
         file_path = os.path.join(category_path, unique_filename)
-        file.save(file_path)
+        digest = blob_store.save(file.stream, file_path, dedup=ICON_DEDUP)
+        icon_cache.invalidate(file_path)
+        file_validators.remember(file_path, digest)
+        precompressed.schedule(file_path, digest)
         
         # 根据存储方式保存图标信息
         if sqlalchemy_available:
@@ -567,62 +747,74 @@ def serve_icon(filename):
         if not os.path.abspath(file_path).startswith(storage_dir + os.path.sep):
             return jsonify({'error': '无效的文件路径'}), 400
         
+        # 热点图标直接从内存缓存发送，不访问文件系统（SVG/ICO 按协商的编码分别缓存）
+        encoding = precompressed.negotiate(request.environ, file_path)
+        cached = icon_cache.get(file_path, encoding)
+        if cached is not None:
+            return send_cached_icon(request.environ, cached, app.response_class, ICON_CACHE_CONTROL)
+        
+        # 删除分类后图标文件在后台迁移，尚未移动的文件从原位置提供（不缓存）
+        cache = icon_cache
+        if not os.path.isfile(file_path):
+            file_path = pending_source(file_path, RELOCATIONS_DIR) or file_path
+            cache = None
+        
         # 检查文件是否存在且可读
         if os.path.isfile(file_path) and os.access(file_path, os.R_OK):
-            # 读取文件内容并直接返回
-            with open(file_path, 'rb') as f:
-                content = f.read()
-            
-            # 创建响应对象
-            response = make_response(content)
-            
-            # 根据文件扩展名设置MIME类型
-            ext = os.path.splitext(file_path)[1].lower()
-            if ext in ['.png']:
-                response.headers['Content-Type'] = 'image/png'
-            elif ext in ['.jpg', '.jpeg']:
-                response.headers['Content-Type'] = 'image/jpeg'
-            elif ext in ['.svg']:
-                response.headers['Content-Type'] = 'image/svg+xml'
-            elif ext in ['.gif']:
-                response.headers['Content-Type'] = 'image/gif'
-            else:
-                response.headers['Content-Type'] = 'application/octet-stream'
-            
-            return response
+            # 流式发送文件（不读入内存），支持 Range、HEAD 和条件请求（304时不打开文件）
+            return send_icon_file(request.environ, file_path, response_class=app.response_class,
+                                  validators=file_validators, cache_control=ICON_CACHE_CONTROL, cache=cache,
+                                  variants=precompressed, encoding=encoding)
         else:
             # 文件不存在或不可读
             return jsonify({'error': '文件不存在'}), 404
+    except RequestedRangeNotSatisfiable:
+        # 请求的范围超出文件大小，返回416
+        raise
     except:
         # 捕获所有异常，返回404
         return jsonify({'error': '文件不存在'}), 404
 
+@app.route('/cache-stats')
+def cache_stats():
+    """查询结果缓存和热点图标缓存的命中统计"""
+    return jsonify({'result_cache': result_cache.stats(), 'icon_cache': icon_cache.stats()})
+
+@app.route('/blobs/<name>')
+def serve_blob(name):
+    """按内容摘要提供图标文件，URL对应的内容永远不变，可以被永久缓存"""
+    digest = parse_blob_name(name)
+    if digest is None or not blob_store.contains(digest):
+        return jsonify({'error': '文件不存在'}), 404
+    return send_icon_file(request.environ, blob_store.blob_path(digest), mimetype=icon_mimetype(name),
+                          response_class=app.response_class, etag=digest,
+                          cache_control=ICON_IMMUTABLE_CACHE_CONTROL)
+
 # 文件系统存储函数
 def update_file_icon_name(icon_id, new_name):
     """更新文件系统中图标的名称"""
-    icons = load_json_data(ICONS_DATA_FILE, [])
+    icon = icon_engine.get(icon_id)
+    if not icon:
+        return False
     
-    for i, icon in enumerate(icons):
-        if icon['id'] == icon_id:
-            # 获取文件扩展名
-            ext = icon['filename'].rsplit('.', 1)[1].lower() if '.' in icon['filename'] else ''
-            
-            # 清理新名称
-            sanitized_name = sanitize_path(new_name)
-            new_filename = f"{sanitized_name}.{ext}" if ext else sanitized_name
-            
-            # 获取分类文件夹
-            category_folder = icon.get('category_name', '未分类')
-            old_filepath = os.path.join(app.config['ICON_STORAGE_PATH'], category_folder, icon['filename'])
-            new_filepath = os.path.join(app.config['ICON_STORAGE_PATH'], category_folder, new_filename)
-            
-            # 重命名文件
-            if os.path.exists(old_filepath):
-                os.rename(old_filepath, new_filepath)
-                icon['filename'] = new_filename
-                save_json_data(ICONS_DATA_FILE, icons)
-                return True
-            return False
+    # 获取文件扩展名
+    ext = icon['filename'].rsplit('.', 1)[1].lower() if '.' in icon['filename'] else ''
+    
+    # 清理新名称
+    sanitized_name = sanitize_path(new_name)
+    new_filename = f"{sanitized_name}.{ext}" if ext else sanitized_name
+    
+    # 获取分类文件夹
+    category_folder = icon.get('category_name', '未分类')
+    old_filepath = os.path.join(app.config['ICON_STORAGE_PATH'], category_folder, icon['filename'])
+    new_filepath = os.path.join(app.config['ICON_STORAGE_PATH'], category_folder, new_filename)
+    
+    # 重命名文件
+    if os.path.exists(old_filepath):
+        os.rename(old_filepath, new_filepath)
+        move_icon_file(old_filepath, new_filepath)
+        icon_engine.update(icon_id, {'filename': new_filename})
+        return True
     return False
 
 @app.route('/rename/<int:icon_id>', methods=['POST'])
@@ -655,6 +847,7 @@ def rename_icon(icon_id):
             # 重命名文件
             if os.path.exists(old_filepath):
                 os.rename(old_filepath, new_filepath)
+                move_icon_file(old_filepath, new_filepath)
                 icon.filename = new_filename
                 db.session.commit()
                 return jsonify({'success': True, 'new_name': new_filename})
@@ -685,11 +878,7 @@ def copy_icon_url(icon_id):
                 
         if not icon:
             # 从文件系统存储中获取图标
-            icons = get_file_icons()
-            for i in icons:
-                if i.id == icon_id:
-                    icon = i
-                    break
+            icon = get_file_icon(icon_id)
         
         if not icon:
             return jsonify({'success': False, 'message': '图标不存在'})
@@ -702,7 +891,16 @@ def copy_icon_url(icon_id):
             category_folder = '未分类' if not icon.category else icon.category.name
             
         full_url = url_for('serve_icon', filename=os.path.join(category_folder, icon.filename), _external=True)
-        return jsonify({'success': True, 'url': full_url})
+        result = {'success': True, 'url': full_url}
+        
+        # 文件保存在内容寻址存储中时，同时返回内容不变、可永久缓存的URL
+        file_path = os.path.join(app.config['ICON_STORAGE_PATH'], category_folder, icon.filename)
+        if os.path.isfile(file_path) and os.stat(file_path).st_nlink > 1:
+            digest = file_validators.etag(file_path)
+            if blob_store.contains(digest):
+                ext = os.path.splitext(icon.filename)[1].lower()
+                result['immutable_url'] = url_for('serve_blob', name=digest + ext, _external=True)
+        return jsonify(result)
     except Exception as e:
         print(f"复制图标URL失败: {e}")
         return jsonify({'success': False, 'message': '服务器错误'})
@@ -804,92 +1002,118 @@ def update_category():
         return jsonify({'success': False, 'message': f'更新分类时出错: {str(e)}'})
 def update_file_icon_category(icon_id, new_category_name, new_category_id=None):
     """在文件系统存储模式下更新图标的分类"""
-    icons = load_json_data(ICONS_DATA_FILE, [])
+    icon = icon_engine.get(icon_id)
+    if not icon:
+        return False
     
-    for icon in icons:
-        if icon['id'] == icon_id:
-            # 获取旧分类名称
-            old_category_name = icon.get('category_name', '未分类')
-            
-            # 构建文件路径
-            old_file_path = os.path.join(app.config['ICON_STORAGE_PATH'], old_category_name, icon['filename'])
-            new_file_path = os.path.join(app.config['ICON_STORAGE_PATH'], new_category_name, icon['filename'])
-            
-            # 如果文件存在，移动它
-            if os.path.exists(old_file_path):
-                os.rename(old_file_path, new_file_path)
-            
-            # 更新图标信息
-            icon['category_name'] = new_category_name
-            if new_category_id is not None:
-                icon['category_id'] = new_category_id
-            else:
-                # 如果没有提供分类ID，尝试根据名称查找
-                categories = get_file_categories()
-                for cat in categories:
-                    if cat.name == new_category_name:
-                        icon['category_id'] = cat.id
-                        break
-            
-            # 保存更新后的数据
-            save_json_data(ICONS_DATA_FILE, icons)
-            return True
-    return False
+    # 获取旧分类名称
+    old_category_name = icon.get('category_name', '未分类')
+    
+    # 构建文件路径
+    old_file_path = os.path.join(app.config['ICON_STORAGE_PATH'], old_category_name, icon['filename'])
+    new_file_path = os.path.join(app.config['ICON_STORAGE_PATH'], new_category_name, icon['filename'])
+    
+    # 如果文件存在，移动它
+    if os.path.exists(old_file_path):
+        os.rename(old_file_path, new_file_path)
+        move_icon_file(old_file_path, new_file_path)
+    
+    # 更新图标信息
+    changes = {'category_name': new_category_name}
+    if new_category_id is not None:
+        changes['category_id'] = new_category_id
+    else:
+        # 如果没有提供分类ID，尝试根据名称查找
+        categories = get_file_categories()
+        for cat in categories:
+            if cat.name == new_category_name:
+                changes['category_id'] = cat.id
+                break
+    
+    # 保存更新后的数据
+    icon_engine.update(icon_id, changes)
+    return True
 
-def delete_file_category(category_id):
-    """从文件系统删除分类"""
-    categories = load_json_data(CATEGORIES_DATA_FILE, [])
+def relocation_batch_handler(moves, rename_icons):
+    """创建迁移任务的每批回调：ETag记录随文件转到新路径，移动时另选了文件名的图标改名
     
-    # 查找要删除的分类
-    category_to_delete = None
-    category_index = -1
+    Args:
+        moves: plan_relocation() 生成的移动列表
+        rename_icons: 回调 rename_icons({图标ID: 新文件名})，移动时目标文件名被占用、另选了文件名时调用
+    """
+    sources = {icon_id: source for icon_id, source, _ in moves}
+    planned = {icon_id: os.path.basename(target) for icon_id, _, target in moves}
+    
+    def on_batch(moved):
+        renamed = {icon_id: os.path.basename(target) for icon_id, target in moved.items()
+                   if os.path.basename(target) != planned[icon_id]}
+        if renamed:
+            rename_icons(renamed)
+        for icon_id, target in moved.items():
+            file_validators.move(sources[icon_id], target)
+    
+    return on_batch
+
+def start_icon_relocation(moves, category_name, rename_icons):
+    """在后台分批把图标文件移动到新的分类目录
+    
+    图标记录在启动任务前已经改到默认分类，迁移期间尚未移动的文件由 pending_source() 从原位置提供；
+    移动列表保存在 RELOCATIONS_DIR 中，因此其他工作进程也能找到这些文件，
+    任务因重启中断后由 resume_interrupted_relocations() 继续。
     
-    for i, cat in enumerate(categories):
-        if cat['id'] == category_id:
-            category_to_delete = cat
-            category_index = i
-            break
+    Args:
+        moves: plan_relocation() 生成的移动列表
+        category_name: 被删除的分类名称，全部移动后删除其空文件夹
+        rename_icons: 回调 rename_icons({图标ID: 新文件名})，移动时目标文件名被占用、另选了文件名时调用
     
+    Returns:
+        迁移任务的进度字典
+    """
+    return start_relocation(moves, relocation_batch_handler(moves, rename_icons),
+                            cleanup_dirs=[os.path.join(app.config['ICON_STORAGE_PATH'], category_name)],
+                            status_dir=RELOCATIONS_DIR)
+
+def rename_file_icons(renamed):
+    """批量更新文件存储中图标的文件名"""
+    icon_engine.update_many({icon_id: {'filename': filename} for icon_id, filename in renamed.items()})
+
+def delete_file_category(category_id):
+    """从文件系统删除分类
+    
+    Returns:
+        图标文件迁移任务的进度字典，分类不存在或不能删除时返回None
+    """
+    # 查找要删除的分类
+    category_to_delete = category_engine.get(category_id)
     if not category_to_delete:
-        return False
+        return None
     
     # 不能删除默认分类
     if category_id == 1:
-        return False
+        return None
     
     # 获取分类名称
     category_name = category_to_delete['name']
     
-    # 获取该分类下的所有图标
-    icons = load_json_data(ICONS_DATA_FILE, [])
-    has_icons = False
-    
-    for icon in icons:
-        if icon.get('category_id') == category_id or icon.get('category_name') == category_name:
-            # 将图标移到默认分类
-            icon['category_id'] = 1
-            icon['category_name'] = '未分类'
-            has_icons = True
+    # 通过分类索引取出该分类下的图标，生成文件移动计划
+    icons = {icon['id']: icon for icon in icon_engine.list_by_category(category_id) + icon_engine.find('category_name', category_name)}
+    moves, renamed = plan_relocation(
+        ((icon['id'], os.path.join(app.config['ICON_STORAGE_PATH'], icon.get('category_name', '未分类'), icon['filename']))
+         for icon in icons.values()),
+        os.path.join(app.config['ICON_STORAGE_PATH'], '未分类')
+    )
     
-    # 保存更新后的图标数据
-    if has_icons:
-        save_json_data(ICONS_DATA_FILE, icons)
+    # 将图标批量移到默认分类，与默认分类中已有文件重名的图标改名
+    changes = {'category_id': 1, 'category_name': '未分类'}
+    icon_engine.update_where('category_id', category_id, changes)
+    icon_engine.update_where('category_name', category_name, changes)
+    rename_file_icons(renamed)
     
     # 从分类列表中删除
-    del categories[category_index]
-    save_json_data(CATEGORIES_DATA_FILE, categories)
+    category_engine.delete(category_id)
     
-    # 删除分类文件夹（如果存在）
-    category_path = os.path.join(app.config['ICON_STORAGE_PATH'], category_name)
-    if os.path.exists(category_path):
-        try:
-            # 检查文件夹是否为空
-            if not os.listdir(category_path):
-                os.rmdir(category_path)
-        except Exception as e:
-            print(f"删除分类文件夹失败: {e}")
-    
-    return True
+    # 在后台移动图标文件，全部移动后删除空的分类文件夹
+    return start_icon_relocation(moves, category_name, rename_file_icons)
 
 @app.route('/delete-category/<int:category_id>', methods=['POST'])
 def delete_category(category_id):
@@ -911,65 +1135,73 @@ def delete_category(category_id):
                 
                 category_name = category.name
                 
-                # 检查分类下是否有图标
-                if category.icons:
-                    # 获取默认分类
-                    default_category = Category.query.filter_by(name='未分类').first()
-                    if not default_category:
-                        default_category = Category(name='未分类')
-                        db.session.add(default_category)
-                    
-                    # 将所有图标移到默认分类
-                    for icon in category.icons:
-                        # 获取旧文件路径
-                        old_file_path = os.path.join(app.config['ICON_STORAGE_PATH'], category_name, icon.filename)
-                        new_file_path = os.path.join(app.config['ICON_STORAGE_PATH'], '未分类', icon.filename)
-                        
-                        # 移动文件
-                        if os.path.exists(old_file_path):
-                            # 检查新路径是否已存在文件，需要处理文件冲突
-                            if os.path.exists(new_file_path):
-                                base, ext = os.path.splitext(icon.filename)
-                                timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-                                new_filename = f"{base}_{timestamp}{ext}"
-                                new_file_path = os.path.join(app.config['ICON_STORAGE_PATH'], '未分类', new_filename)
-                                os.rename(old_file_path, new_file_path)
-                                icon.filename = new_filename
-                            else:
-                                os.rename(old_file_path, new_file_path)
-                        
-                        # 更新图标分类
-                        icon.category_id = default_category.id
+                # 获取默认分类
+                default_category = Category.query.filter_by(name='未分类').first()
+                if not default_category:
+                    default_category = Category(name='未分类')
+                    db.session.add(default_category)
+                    db.session.flush()
+                
+                # 只查询图标的ID和文件名生成文件移动计划，不加载模型对象
+                icons = db.session.query(Icon.id, Icon.filename).filter(Icon.category_id == category_id).all()
+                moves, renamed = plan_relocation(
+                    ((icon_id, os.path.join(app.config['ICON_STORAGE_PATH'], category_name, filename))
+                     for icon_id, filename in icons),
+                    os.path.join(app.config['ICON_STORAGE_PATH'], default_category.name)
+                )
+                
+                # 一条UPDATE语句把所有图标移到默认分类，与默认分类中已有文件重名的图标改名
+                Icon.query.filter(Icon.category_id == category_id).update(
+                    {Icon.category_id: default_category.id}, synchronize_session=False)
+                if renamed:
+                    db.session.bulk_update_mappings(Icon, [{'id': icon_id, 'filename': filename}
+                                                           for icon_id, filename in renamed.items()])
                 
                 # 删除分类
-                db.session.delete(category)
+                Category.query.filter_by(id=category_id).delete(synchronize_session=False)
                 db.session.commit()
                 
-                # 删除分类文件夹
-                if category_name:
-                    category_path = os.path.join(app.config['ICON_STORAGE_PATH'], category_name)
-                    if os.path.exists(category_path):
-                        try:
-                            os.rmdir(category_path)
-                        except Exception as e:
-                            print(f"删除分类文件夹失败: {e}")
-                            # 文件夹删除失败不影响分类删除
+                # 在后台移动图标文件，全部移动后删除空的分类文件夹
+                relocation = start_icon_relocation(moves, category_name, rename_db_icons)
             except Exception as e:
                 db.session.rollback()
                 print(f"从数据库删除分类失败: {e}")
                 # 尝试从文件系统删除
-                if not delete_file_category(category_id):
+                relocation = delete_file_category(category_id)
+                if relocation is None:
                     return jsonify({'success': False, 'message': '删除分类失败'})
         else:
             # 使用文件系统存储
-            if not delete_file_category(category_id):
+            relocation = delete_file_category(category_id)
+            if relocation is None:
                 return jsonify({'success': False, 'message': '分类不存在或删除失败'})
         
-        return jsonify({'success': True, 'message': '分类已成功删除'})
+        # 图标文件在后台迁移，进度可通过 /relocation-status/<任务ID> 查询
+        return jsonify({'success': True, 'message': '分类已成功删除', 'relocation': relocation})
     except Exception as e:
         print(f"删除分类时出错: {e}")
         return jsonify({'success': False, 'message': f'删除失败: {str(e)}'})
 
+def rename_db_icons(renamed):
+    """在后台线程中批量更新数据库中图标的文件名"""
+    with app.app_context():
+        db.session.bulk_update_mappings(Icon, [{'id': icon_id, 'filename': filename}
+                                               for icon_id, filename in renamed.items()])
+        db.session.commit()
+
+def resume_interrupted_relocations():
+    """继续执行因进程重启而中断的图标文件迁移任务"""
+    rename_icons = rename_db_icons if sqlalchemy_available else rename_file_icons
+    resume_relocations(RELOCATIONS_DIR, lambda moves: relocation_batch_handler(moves, rename_icons))
+
+@app.route('/relocation-status/<job_id>')
+def relocation_status(job_id):
+    """查询删除分类后图标文件迁移的进度"""
+    relocation = get_relocation(job_id, RELOCATIONS_DIR)
+    if relocation is None:
+        return jsonify({'success': False, 'message': '迁移任务不存在'}), 404
+    return jsonify({'success': True, 'relocation': relocation})
+
 @app.route('/update-category/<int:icon_id>', methods=['POST'])
 @login_required
 def update_icon_category(icon_id):
@@ -993,20 +1225,16 @@ def update_icon_category(icon_id):
             except Exception as e:
                 print(f"数据库查询失败: {e}")
                 # 尝试从文件系统获取
-                icons = get_file_icons()
-                for i in icons:
-                    if i.id == icon_id:
-                        old_category_name = i.category_name
-                        filename = i.filename
-                        break
+                file_icon = get_file_icon(icon_id)
+                if file_icon:
+                    old_category_name = file_icon.category_name
+                    filename = file_icon.filename
         else:
             # 使用文件系统存储
-            icons = get_file_icons()
-            for i in icons:
-                if i.id == icon_id:
-                    old_category_name = i.category_name
-                    filename = i.filename
-                    break
+            file_icon = get_file_icon(icon_id)
+            if file_icon:
+                old_category_name = file_icon.category_name
+                filename = file_icon.filename
         
         if not filename:
             return jsonify({'success': False, 'message': '图标不存在'})
@@ -1026,19 +1254,15 @@ def update_icon_category(icon_id):
                 except Exception as e:
                     print(f"获取新分类失败: {e}")
                     # 从文件系统获取
-                    categories = get_file_categories()
-                    for cat in categories:
-                        if str(cat.id) == category_id:
-                            new_category_name = cat.name
-                            new_category_id = cat.id
-                            break
+                    new_category = get_file_category(category_id)
+                    if new_category:
+                        new_category_name = new_category.name
+                        new_category_id = new_category.id
             else:
-                categories = get_file_categories()
-                for cat in categories:
-                    if str(cat.id) == category_id:
-                        new_category_name = cat.name
-                        new_category_id = cat.id
-                        break
+                new_category = get_file_category(category_id)
+                if new_category:
+                    new_category_name = new_category.name
+                    new_category_id = new_category.id
         else:
             # 如果没有选择分类，使用默认分类
             if sqlalchemy_available:
@@ -1073,6 +1297,7 @@ def update_icon_category(icon_id):
                 
                 # 更新文件名
                 os.rename(old_file_path, new_file_path)
+                move_icon_file(old_file_path, new_file_path)
                 
                 # 更新存储中的文件名
                 if sqlalchemy_available and icon:
@@ -1085,6 +1310,7 @@ def update_icon_category(icon_id):
                     update_file_icon_name(icon_id, os.path.splitext(new_filename)[0])
             else:
                 os.rename(old_file_path, new_file_path)
+                move_icon_file(old_file_path, new_file_path)
         
         # 更新存储
         if sqlalchemy_available:
@@ -1135,13 +1361,10 @@ def delete_icon(icon_id):
         else:
             # 使用文件系统存储
             # 查找图标信息
-            icons = get_file_icons()
-            for i in icons:
-                if i.id == icon_id:
-                    icon = i
-                    category_name = i.category_name
-                    filename = i.filename
-                    break
+            icon = get_file_icon(icon_id)
+            if icon:
+                category_name = icon.category_name
+                filename = icon.filename
             
             if not icon:
                 return jsonify({'success': False, 'message': '图标不存在'})
@@ -1157,7 +1380,8 @@ def delete_icon(icon_id):
             # 删除文件
             if os.path.exists(file_path):
                 try:
-                    os.remove(file_path)
+                    blob_store.release(file_path)
+                    forget_icon_file(file_path)
                 except Exception as e:
                     print(f"删除文件失败: {e}")
                     return jsonify({'success': False, 'message': '图标数据已删除，但文件删除失败'})
@@ -1195,13 +1419,11 @@ def batch_upload_icons():
             category_name = '未分类'
     else:
         # 使用文件系统存储的分类
-        categories = get_file_categories()
         if category_id:
-            for cat in categories:
-                if str(cat.id) == category_id:
-                    category_name = cat.name
-                    category_id = cat.id
-                    break
+            category = get_file_category(category_id)
+            if category:
+                category_name = category.name
+                category_id = category.id
         else:
             category_id = 1
             category_name = '未分类'
@@ -1209,42 +1431,46 @@ def batch_upload_icons():
     # 创建分类文件夹（如果不存在）
     category_path = create_category_folder(category_name)
     
-    uploaded_count = 0
-    
-    for file in files:
-        if file and allowed_file(file.filename):
-            try:
-                filename = generate_secure_filename(file.filename)
-                filepath = os.path.join(category_path, filename)
-                file.save(filepath)
-                
-                # 根据存储方式创建图标记录
-                if sqlalchemy_available:
-                    try:
-                        new_icon = Icon(
-                            filename=filename,
-                            original_filename=file.filename,
-                            category_id=category_id
-                        )
-                        db.session.add(new_icon)
-                    except Exception as e:
-                        print(f"保存到数据库失败: {e}")
-                        # 回退到文件系统存储
-                        add_file_icon(filename, file.filename, category_id, category_name)
-                else:
-                    # 使用文件系统存储
-                    add_file_icon(filename, file.filename, category_id, category_name)
-                
-                uploaded_count += 1
-            except Exception as e:
-                print(f"处理文件失败 {file.filename}: {e}")
+    # 先检查全部文件并一次分配文件名，保存文件后再一次性写入元数据
+    files = [file for file in files if file and allowed_file(file.filename)]
+    entries = []
+    for file, filename in zip(files, allocate_filenames(category_path, [file.filename for file in files])):
+        try:
+            file_path = os.path.join(category_path, filename)
+            digest = blob_store.save(file.stream, file_path, dedup=ICON_DEDUP)
+            file_validators.remember(file_path, digest)
+            precompressed.schedule(file_path, digest)
+            entries.append((filename, file.filename))
+        except Exception as e:
+            print(f"处理文件失败 {file.filename}: {e}")
     
-    # 提交数据库更改
-    if sqlalchemy_available:
+    # 根据存储方式批量创建图标记录
+    saved = False
+    if entries and sqlalchemy_available:
         try:
+            # 一个事务内用 executemany 插入全部记录
+            upload_date = datetime.utcnow()
+            db.session.bulk_insert_mappings(Icon, [{
+                'filename': filename,
+                'original_filename': original_filename,
+                'category_id': category_id,
+                'upload_date': upload_date,
+                'is_favorite': False
+            } for filename, original_filename in entries])
             db.session.commit()
+            saved = True
+        except Exception as e:
+            db.session.rollback()
+            print(f"保存到数据库失败: {e}")
+    if entries and not saved:
+        # 使用文件系统存储（或数据库保存失败时回退）
+        try:
+            add_file_icons(entries, category_id, category_name)
         except Exception as e:
-            print(f"数据库提交失败: {e}")
+            print(f"保存图标信息失败: {e}")
+            entries = []
+    
+    uploaded_count = len(entries)
     
     return jsonify({
         'success': True, 
@@ -1252,6 +1478,9 @@ def batch_upload_icons():
         'uploaded_count': uploaded_count
     })
 
+# 继续执行上次运行时中断的文件迁移任务
+resume_interrupted_relocations()
+
 if __name__ == '__main__':
     # 支持直接运行Python文件
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -16,9 +16,53 @@ except ImportError:
 
 # 导入配置
 from app.config import default_config
+from app.storage import metadata_cache, result_cache, icon_cache, create_file_engine, FileValidators, BlobStore, PrecompressedStore, SQLAlchemyEngine, install_sqlite_tuning, install_generation_tracking, resume_relocations
 
 # 全局变量
 app_config = None
+icon_engine = None
+category_engine = None
+file_validators = None
+blob_store = None
+precompressed = None
+
+def create_storage_engines(config, database=None):
+    """创建图标和分类的存储引擎
+    
+    Args:
+        config: 配置对象
+        database: SQLAlchemy数据库实例，为None时使用文件系统存储
+    
+    Returns:
+        (图标存储引擎, 分类存储引擎)
+    """
+    if database is not None:
+        # 延迟导入模型以避免循环引用
+        from app.models.category import Category
+        from app.models.icon import Icon
+        return SQLAlchemyEngine(database, Icon), SQLAlchemyEngine(database, Category)
+    
+    from app.models.base import SimpleCategory
+    icons = create_file_engine(config.ICONS_DATA_FILE, config.FILE_STORAGE_ENGINE, index_fields=('category_id', 'tags'),
+                               full_text=True)
+    categories = create_file_engine(config.CATEGORIES_DATA_FILE, config.FILE_STORAGE_ENGINE,
+                                    default=[SimpleCategory(1, '未分类').to_dict()], index_fields=())
+    return icons, categories
+
+def create_file_validators(config):
+    """创建图标文件验证信息（强ETag）的存储，两种存储方式都保存在数据目录中
+    
+    Args:
+        config: 配置对象
+    
+    Returns:
+        FileValidators 实例
+    """
+    return FileValidators(
+        create_file_engine(config.FILE_VALIDATORS_FILE, config.FILE_STORAGE_ENGINE,
+                           index_fields=FileValidators.INDEX_FIELDS),
+        config.ICON_STORAGE_PATH
+    )
 
 def create_app(config_name='dev'):
     """创建Flask应用实例
@@ -29,7 +73,7 @@ def create_app(config_name='dev'):
     Returns:
         Flask应用实例
     """
-    global app_config, db
+    global app_config, db, SQLALCHEMY_AVAILABLE, icon_engine, category_engine, file_validators, blob_store, precompressed
     
     # 创建应用实例
     app = Flask(__name__)
@@ -40,7 +84,7 @@ def create_app(config_name='dev'):
     
     # Logging configuration
     SAVE_LOGS = os.getenv('SAVE_LOGS', 'false').lower() == 'true'
-LOG_PATH = os.getenv('LOG_PATH', '/app/data/logs')  # 使用/app/data/logs作为默认路径，与docker卷挂载结构一致
+    LOG_PATH = os.getenv('LOG_PATH', '/app/data/logs')  # 使用/app/data/logs作为默认路径，与docker卷挂载结构一致
     
     if SAVE_LOGS:
         # Ensure log directory exists
@@ -79,15 +123,14 @@ LOG_PATH = os.getenv('LOG_PATH', '/app/data/logs')  # 使用/app/data/logs作为
     if SQLALCHEMY_AVAILABLE:
         try:
             db = SQLAlchemy(app)
+            # 在第一个连接建立之前注册SQLite性能参数
+            with app.app_context():
+                install_sqlite_tuning(db.engine)
             print("数据库连接初始化成功")
         except Exception as e:
             print(f"数据库初始化失败: {e}")
             SQLALCHEMY_AVAILABLE = False
     
-    # 注册蓝图
-    from app.api import api_bp
-    app.register_blueprint(api_bp, url_prefix='/api')
-    
     # 初始化数据库模型（如果使用数据库存储）
     with app.app_context():
         if SQLALCHEMY_AVAILABLE:
@@ -99,6 +142,17 @@ LOG_PATH = os.getenv('LOG_PATH', '/app/data/logs')  # 使用/app/data/logs作为
                 # 创建表
                 db.create_all()
                 
+                # 写事务提交时递增共享的数据版本，所有工作进程的查询结果缓存都能随之失效
+                install_generation_tracking(db)
+                
+                # 旧数据库的标签只保存在 tags 列中，回填标签关联表
+                backfilled = Icon.rebuild_tag_index()
+                if backfilled:
+                    print(f"为 {backfilled} 个图标回填标签索引")
+                
+                # SQLite 数据库的全文索引
+                Icon.create_search_index()
+                
                 # 检查是否存在默认分类，如果不存在则创建
                 default_category = Category.query.filter_by(name='未分类').first()
                 if not default_category:
@@ -111,6 +165,22 @@ LOG_PATH = os.getenv('LOG_PATH', '/app/data/logs')  # 使用/app/data/logs作为
                 print(f"数据库模型初始化失败: {e}")
                 SQLALCHEMY_AVAILABLE = False
     
+    # 初始化存储引擎，API路由只通过引擎访问数据
+    icon_engine, category_engine = create_storage_engines(app_config, db if SQLALCHEMY_AVAILABLE else None)
+    file_validators = create_file_validators(app_config)
+    blob_store = BlobStore(app_config.ICON_STORAGE_PATH)
+    precompressed = PrecompressedStore(app_config.ICON_STORAGE_PATH, enabled=app_config.ICON_PRECOMPRESS)
+    # 热点图标缓存在每个工作进程内独立保存，通过数据目录中的共享文件同步失效
+    icon_cache.share(os.path.join(app_config.DATA_DIR, 'icon_cache.epoch'))
+    
+    # 注册蓝图（在存储引擎初始化之后导入）
+    from app.api import api_bp
+    app.register_blueprint(api_bp, url_prefix='/api')
+    
+    # 继续执行上次运行时中断的文件迁移任务
+    from app.api.categories import relocation_callback
+    resume_relocations(app_config.RELOCATIONS_DIR, lambda moves: relocation_callback(app, moves))
+    
     # 添加错误处理
     @app.errorhandler(404)
     def not_found(error):
@@ -130,7 +200,10 @@ LOG_PATH = os.getenv('LOG_PATH', '/app/data/logs')  # 使用/app/data/logs作为
         return jsonify({
             "status": "ok",
             "version": app_config.APP_VERSION,
-            "storage_type": "database" if SQLALCHEMY_AVAILABLE else "file_system"
+            "storage_type": "database" if SQLALCHEMY_AVAILABLE else "file_system",
+            "metadata_cache": metadata_cache.stats(),
+            "result_cache": result_cache.stats(),
+            "icon_cache": icon_cache.stats()
         })
     
     return app
@@ -1,8 +1,23 @@
 # API模块初始化文件
-from flask import Blueprint
+from flask import Blueprint, current_app
+from .. import icon_engine, category_engine
+from ..storage import result_cache
 
 # 创建API蓝图
 api_bp = Blueprint('api', __name__)
 
+def cached_json(key, compute):
+    """返回 compute() 结果的JSON响应，序列化后的响应体按 (key, 图标和分类的数据版本) 缓存
+    
+    任何写入都会改变存储引擎的 generation()，之后的请求使用新的缓存键重新查询。
+    
+    Args:
+        key: 端点及筛选条件组成的元组
+        compute: 无参数的函数，返回要序列化的数据
+    """
+    key = (key, icon_engine.generation(), category_engine.generation())
+    body = result_cache.get_or_compute(key, lambda: current_app.json.response(compute()).get_data())
+    return current_app.response_class(body, mimetype=current_app.json.mimetype)
+
 # 导入各个API路由模块
 from . import auth, categories, icons
@@ -1,70 +1,34 @@
 # 分类相关的API路由
 import os
-import json
-from flask import request, jsonify, send_from_directory
-from .. import app_config, db, SQLALCHEMY_AVAILABLE
-from ..models.category import Category
-from ..models.base import SimpleCategory
-from . import api_bp
+from flask import request, jsonify, current_app
+from .. import app_config, icon_engine, category_engine, file_validators
+from ..storage import plan_relocation, start_relocation, get_relocation, icon_cache
+from . import api_bp, cached_json
 from .auth import login_required
 
-# 初始化文件系统数据存储
-def init_file_storage():
-    """初始化文件系统存储"""
-    # 确保数据目录存在
-    if not os.path.exists(app_config.DATA_DIR):
-        os.makedirs(app_config.DATA_DIR)
-    
-    # 初始化分类数据文件
-    if not os.path.exists(app_config.CATEGORIES_DATA_FILE):
-        with open(app_config.CATEGORIES_DATA_FILE, 'w', encoding='utf-8') as f:
-            default_category = SimpleCategory(1, '未分类')
-            json.dump([default_category.to_dict()], f, ensure_ascii=False, indent=2)
-
-# 文件系统存储的分类操作
-def get_categories_from_file():
-    """从文件系统获取分类列表"""
-    init_file_storage()
-    try:
-        with open(app_config.CATEGORIES_DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return []
-
-def save_categories_to_file(categories):
-    """保存分类列表到文件系统"""
-    init_file_storage()
-    with open(app_config.CATEGORIES_DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(categories, f, ensure_ascii=False, indent=2)
+# 工具函数
+def with_icon_counts(categories):
+    """为分类附加图标数量，数量由图标存储引擎按分类统计（一次查询）"""
+    if all('icon_count' in category for category in categories):
+        # 数据库模型已批量附加了图标数量
+        return categories
+    counts = icon_engine.count_by_category()
+    return [dict(category, icon_count=counts.get(category['id'], 0)) for category in categories]
 
 # 分类API路由
 @api_bp.route('/categories', methods=['GET'])
 def get_categories():
     """获取所有分类"""
-    if SQLALCHEMY_AVAILABLE:
-        # 使用数据库存储
-        categories = Category.query.all()
-        return jsonify([category.to_dict() for category in categories]), 200
-    else:
-        # 使用文件系统存储
-        categories = get_categories_from_file()
-        return jsonify(categories), 200
+    return cached_json(('categories',), lambda: with_icon_counts(category_engine.list_all())), 200
 
 @api_bp.route('/categories/<int:category_id>', methods=['GET'])
 def get_category(category_id):
     """获取单个分类"""
-    if SQLALCHEMY_AVAILABLE:
-        # 使用数据库存储
-        category = Category.query.get_or_404(category_id)
-        return jsonify(category.to_dict()), 200
+    category = category_engine.get(category_id)
+    if category:
+        return jsonify(with_icon_counts([category])[0]), 200
     else:
-        # 使用文件系统存储
-        categories = get_categories_from_file()
-        category = next((c for c in categories if c['id'] == category_id), None)
-        if category:
-            return jsonify(category), 200
-        else:
-            return jsonify({"error": "分类不存在"}), 404
+        return jsonify({"error": "分类不存在"}), 404
 
 @api_bp.route('/categories', methods=['POST'])
 @login_required
@@ -76,48 +40,19 @@ def create_category():
     if not name or name.strip() == '':
         return jsonify({"error": "分类名称不能为空"}), 400
     
-    if SQLALCHEMY_AVAILABLE:
-        # 检查分类名是否已存在
-        existing = Category.query.filter_by(name=name).first()
-        if existing:
-            return jsonify({"error": "分类名称已存在"}), 400
-        
-        # 创建新分类
-        category = Category(name=name)
-        db.session.add(category)
-        db.session.commit()
-        
-        # 确保分类目录存在
-        category_dir = os.path.join(app_config.ICON_STORAGE_PATH, name)
-        if not os.path.exists(category_dir):
-            os.makedirs(category_dir)
-        
-        return jsonify(category.to_dict()), 201
-    else:
-        # 文件系统存储
-        categories = get_categories_from_file()
-        
-        # 检查分类名是否已存在
-        if any(c['name'] == name for c in categories):
-            return jsonify({"error": "分类名称已存在"}), 400
-        
-        # 生成新ID
-        new_id = max([c['id'] for c in categories], default=0) + 1
-        
-        # 创建新分类
-        new_category = {
-            "id": new_id,
-            "name": name
-        }
-        categories.append(new_category)
-        save_categories_to_file(categories)
-        
-        # 确保分类目录存在
-        category_dir = os.path.join(app_config.ICON_STORAGE_PATH, name)
-        if not os.path.exists(category_dir):
-            os.makedirs(category_dir)
-        
-        return jsonify(new_category), 201
+    # 检查分类名是否已存在
+    if category_engine.find_first('name', name):
+        return jsonify({"error": "分类名称已存在"}), 400
+    
+    # 创建新分类（ID由存储引擎分配）
+    new_category = category_engine.insert({"name": name})
+    
+    # 确保分类目录存在
+    category_dir = os.path.join(app_config.ICON_STORAGE_PATH, name)
+    if not os.path.exists(category_dir):
+        os.makedirs(category_dir)
+    
+    return jsonify(new_category), 201
 
 @api_bp.route('/categories/<int:category_id>', methods=['PUT'])
 @login_required
@@ -129,99 +64,95 @@ def update_category(category_id):
     if not new_name or new_name.strip() == '':
         return jsonify({"error": "分类名称不能为空"}), 400
     
-    if SQLALCHEMY_AVAILABLE:
-        # 获取要更新的分类
-        category = Category.query.get_or_404(category_id)
-        
-        # 如果分类名称已更改，检查新名称是否已存在
-        if category.name != new_name:
-            existing = Category.query.filter_by(name=new_name).first()
-            if existing:
-                return jsonify({"error": "分类名称已存在"}), 400
-            
-            # 更新文件系统中的目录名
-            old_dir = os.path.join(app_config.ICON_STORAGE_PATH, category.name)
-            new_dir = os.path.join(app_config.ICON_STORAGE_PATH, new_name)
-            if os.path.exists(old_dir) and old_dir != new_dir:
-                if not os.path.exists(new_dir):
-                    os.rename(old_dir, new_dir)
-        
-        # 更新分类名称
-        category.name = new_name
-        db.session.commit()
-        
-        return jsonify(category.to_dict()), 200
-    else:
-        # 文件系统存储
-        categories = get_categories_from_file()
-        category = next((c for c in categories if c['id'] == category_id), None)
-        
-        if not category:
-            return jsonify({"error": "分类不存在"}), 404
-        
-        # 如果分类名称已更改，检查新名称是否已存在
-        if category['name'] != new_name:
-            if any(c['name'] == new_name and c['id'] != category_id for c in categories):
-                return jsonify({"error": "分类名称已存在"}), 400
-            
-            # 更新文件系统中的目录名
-            old_dir = os.path.join(app_config.ICON_STORAGE_PATH, category['name'])
-            new_dir = os.path.join(app_config.ICON_STORAGE_PATH, new_name)
-            if os.path.exists(old_dir) and old_dir != new_dir:
-                if not os.path.exists(new_dir):
-                    os.rename(old_dir, new_dir)
-        
-        # 更新分类名称
-        category['name'] = new_name
-        save_categories_to_file(categories)
+    category = category_engine.get(category_id)
+    if not category:
+        return jsonify({"error": "分类不存在"}), 404
+    
+    # 如果分类名称已更改，检查新名称是否已存在
+    if category['name'] != new_name:
+        existing = category_engine.find_first('name', new_name)
+        if existing and existing['id'] != category_id:
+            return jsonify({"error": "分类名称已存在"}), 400
         
-        return jsonify(category), 200
+        # 更新文件系统中的目录名
+        old_dir = os.path.join(app_config.ICON_STORAGE_PATH, category['name'])
+        new_dir = os.path.join(app_config.ICON_STORAGE_PATH, new_name)
+        if os.path.exists(old_dir) and old_dir != new_dir:
+            if not os.path.exists(new_dir):
+                os.rename(old_dir, new_dir)
+                icon_cache.invalidate_tree(old_dir)
+                file_validators.move_tree(old_dir, new_dir)
+    
+    # 更新分类名称
+    category = category_engine.update(category_id, {'name': new_name})
+    
+    return jsonify(category), 200
 
 @api_bp.route('/categories/<int:category_id>', methods=['DELETE'])
 @login_required
 def delete_category(category_id):
     """删除分类"""
+    category = category_engine.get(category_id)
+    if not category:
+        return jsonify({"error": "分类不存在"}), 404
+    
     # 不允许删除默认的"未分类"
-    if SQLALCHEMY_AVAILABLE:
-        category = Category.query.get_or_404(category_id)
-        if category.name == '未分类':
-            return jsonify({"error": "不能删除默认的未分类"}), 400
-        
-        # 更新该分类下的所有图标到"未分类"
-        default_category = Category.query.filter_by(name='未分类').first()
-        for icon in category.icons:
-            icon.category_id = default_category.id
-        
-        # 删除分类目录
-        category_dir = os.path.join(app_config.ICON_STORAGE_PATH, category.name)
-        if os.path.exists(category_dir):
-            # 注意：这里只是删除目录，实际应用中可能需要更复杂的逻辑
-            pass
-        
-        # 删除分类
-        db.session.delete(category)
-        db.session.commit()
-        
-        return jsonify({"message": "分类已删除"}), 200
-    else:
-        # 文件系统存储
-        categories = get_categories_from_file()
-        category = next((c for c in categories if c['id'] == category_id), None)
-        
-        if not category:
-            return jsonify({"error": "分类不存在"}), 404
-        
-        if category['name'] == '未分类':
-            return jsonify({"error": "不能删除默认的未分类"}), 400
-        
-        # 删除分类目录
-        category_dir = os.path.join(app_config.ICON_STORAGE_PATH, category['name'])
-        if os.path.exists(category_dir):
-            # 注意：这里只是删除目录，实际应用中可能需要更复杂的逻辑
-            pass
-        
-        # 删除分类
-        categories = [c for c in categories if c['id'] != category_id]
-        save_categories_to_file(categories)
-        
-        return jsonify({"message": "分类已删除"}), 200
+    if category['name'] == '未分类':
+        return jsonify({"error": "不能删除默认的未分类"}), 400
+    
+    # 把该分类下的所有图标移到"未分类"（数据库引擎用一条 UPDATE 语句完成），图标文件在后台分批移动
+    default_category = category_engine.find_first('name', '未分类')
+    relocation = None
+    if default_category:
+        storage_root = os.path.abspath(app_config.ICON_STORAGE_PATH)
+        # 没有文件路径的图标只改分类，不参与文件移动
+        icons = [icon for icon in icon_engine.list_by_category(category_id) if icon.get('path')]
+        moves, _ = plan_relocation(
+            ((icon['id'], os.path.join(storage_root, icon['path'])) for icon in icons),
+            os.path.join(storage_root, default_category['name'])
+        )
+        icon_engine.update_where('category_id', category_id,
+                                 {'category_id': default_category['id'], 'category_name': default_category['name']})
+        # 路径直接指向计划的位置（与"未分类"中已有文件重名的图标改名），尚未移动的文件由 pending_source() 提供
+        icon_engine.update_many({
+            icon_id: {'path': os.path.relpath(target, storage_root), 'filename': os.path.basename(target)}
+            for icon_id, _, target in moves
+        })
+        relocation = start_relocation(moves, relocation_callback(current_app._get_current_object(), moves),
+                                      cleanup_dirs=[os.path.join(storage_root, category['name'])],
+                                      status_dir=app_config.RELOCATIONS_DIR)
+    
+    category_engine.delete(category_id)
+    
+    return jsonify({"message": "分类已删除", "relocation": relocation}), 200
+
+def relocation_callback(app, moves):
+    """创建迁移任务的每批回调：ETag记录随文件转到新路径，移动时另选了文件名的图标更新路径
+    
+    Args:
+        app: Flask应用实例，回调在后台线程中执行
+        moves: plan_relocation() 生成的移动列表
+    """
+    storage_root = os.path.abspath(app_config.ICON_STORAGE_PATH)
+    sources = {icon_id: source for icon_id, source, _ in moves}
+    planned = {icon_id: target for icon_id, _, target in moves}
+    
+    def on_batch(moved):
+        with app.app_context():
+            # 计划之后目标目录中出现了同名文件时，文件被移动到另选的文件名
+            icon_engine.update_many({
+                icon_id: {'path': os.path.relpath(target, storage_root), 'filename': os.path.basename(target)}
+                for icon_id, target in moved.items() if target != planned[icon_id]
+            })
+            for icon_id, target in moved.items():
+                file_validators.move(sources[icon_id], target)
+    
+    return on_batch
+
+@api_bp.route('/categories/relocations/<job_id>', methods=['GET'])
+def get_category_relocation(job_id):
+    """获取删除分类后图标文件迁移的进度"""
+    relocation = get_relocation(job_id, app_config.RELOCATIONS_DIR)
+    if relocation is None:
+        return jsonify({"error": "迁移任务不存在"}), 404
+    return jsonify(relocation), 200
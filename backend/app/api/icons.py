@@ -1,16 +1,13 @@
 # 图标相关的API路由
 import os
-import json
 import shutil
 import re
 from datetime import datetime
-from flask import request, jsonify, send_from_directory, current_app
+from flask import request, jsonify, current_app
 from werkzeug.utils import secure_filename
-from .. import app_config, db, SQLALCHEMY_AVAILABLE
-from ..models.icon import Icon
-from ..models.category import Category
-from ..models.base import SimpleIcon
-from . import api_bp
+from .. import app_config, icon_engine, category_engine, file_validators, blob_store, precompressed
+from ..storage import icon_cache, pending_source, send_icon_file, send_cached_icon, parse_blob_name, icon_mimetype
+from . import api_bp, cached_json
 from .auth import login_required
 
 # 工具函数
@@ -29,82 +26,69 @@ def sanitize_filename(filename):
         name = name[:50] + '_'
     return name + ext
 
-# 初始化文件系统数据存储
-def init_file_storage():
-    """初始化文件系统存储"""
-    # 确保数据目录存在
-    if not os.path.exists(app_config.DATA_DIR):
-        os.makedirs(app_config.DATA_DIR)
-    
-    # 初始化图标元数据文件
-    if not os.path.exists(app_config.ICONS_DATA_FILE):
-        with open(app_config.ICONS_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump([], f, ensure_ascii=False, indent=2)
-
-# 文件系统存储的图标操作
-def get_icons_from_file(category_id=None):
-    """从文件系统获取图标列表"""
-    init_file_storage()
-    try:
-        with open(app_config.ICONS_DATA_FILE, 'r', encoding='utf-8') as f:
-            icons = json.load(f)
-            if category_id is not None:
-                icons = [icon for icon in icons if icon.get('category_id') == category_id]
-            return icons
-    except (json.JSONDecodeError, FileNotFoundError):
-        return []
-
-def get_icon_from_file(icon_id):
-    """从文件系统获取单个图标"""
-    icons = get_icons_from_file()
-    return next((icon for icon in icons if icon.get('id') == icon_id), None)
-
-def save_icons_to_file(icons):
-    """保存图标列表到文件系统"""
-    init_file_storage()
-    with open(app_config.ICONS_DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(icons, f, ensure_ascii=False, indent=2)
-
-def get_next_icon_id():
-    """获取下一个图标ID"""
-    icons = get_icons_from_file()
-    if not icons:
-        return 1
-    return max([icon.get('id', 0) for icon in icons]) + 1
-
 # 图标API路由
 @api_bp.route('/icons', methods=['GET'])
 def get_icons():
-    """获取图标列表，支持按分类筛选"""
+    """获取图标列表，支持按分类和标签筛选
+    
+    标签筛选：?tag=a&tag=b，tag_mode=all（默认，需包含全部标签）或 any（包含任一标签）。
+    传入 limit 或 after 参数时按ID进行键集分页，返回
+    {"items": [...], "next_cursor": 下一页的after值或null}；否则返回全部图标的数组。
+    """
     category_id = request.args.get('category_id', type=int)
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after', type=int)
+    tags = [tag for tag in request.args.getlist('tag') if tag]
+    tag_mode = request.args.get('tag_mode', 'all')
+    if tag_mode not in ('all', 'any'):
+        return jsonify({"error": "tag_mode 只能是 all 或 any"}), 400
     
-    if SQLALCHEMY_AVAILABLE:
-        # 使用数据库存储
-        query = Icon.query
-        if category_id is not None:
-            query = query.filter_by(category_id=category_id)
+    paginated = limit is not None or after is not None
+    if paginated:
+        limit = min(max(limit or app_config.ICONS_PAGE_SIZE, 1), app_config.ICONS_MAX_PAGE_SIZE)
+    
+    def list_icons():
+        if tags:
+            icons, next_cursor = icon_engine.list_tagged(tags, tag_mode, limit if paginated else None,
+                                                         after, category_id)
+            if paginated:
+                return {"items": icons, "next_cursor": next_cursor}
+            return icons
         
-        icons = query.all()
-        return jsonify([icon.to_dict() for icon in icons]), 200
-    else:
-        # 使用文件系统存储
-        icons = get_icons_from_file(category_id)
-        return jsonify(icons), 200
+        if paginated:
+            icons, next_cursor = icon_engine.list_page(limit, after, category_id)
+            return {"items": icons, "next_cursor": next_cursor}
+        
+        if category_id is not None:
+            return icon_engine.list_by_category(category_id)
+        return icon_engine.list_all()
+    
+    # 数据未变化时相同的查询直接返回缓存的响应
+    return cached_json(('icons', category_id, limit if paginated else None, after, tuple(tags), tag_mode),
+                       list_icons), 200
+
+@api_bp.route('/icons/search', methods=['GET'])
+def search_icons():
+    """全文搜索图标的文件名、标签和描述
+    
+    查询参数 q 中的每个词按前缀匹配（多个词需全部匹配），结果按相关度排序，
+    limit 指定最多返回的数量。
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "缺少搜索关键词"}), 400
+    limit = request.args.get('limit', app_config.ICONS_SEARCH_LIMIT, type=int)
+    limit = min(max(limit, 1), app_config.ICONS_MAX_PAGE_SIZE)
+    return jsonify(icon_engine.search(query, limit)), 200
 
 @api_bp.route('/icons/<int:icon_id>', methods=['GET'])
 def get_icon(icon_id):
     """获取单个图标"""
-    if SQLALCHEMY_AVAILABLE:
-        # 使用数据库存储
-        icon = Icon.query.get_or_404(icon_id)
-        return jsonify(icon.to_dict()), 200
+    icon = icon_engine.get(icon_id)
+    if icon:
+        return jsonify(icon), 200
     else:
-        # 使用文件系统存储
-        icon = get_icon_from_file(icon_id)
-        if icon:
-            return jsonify(icon), 200
-        else:
-            return jsonify({"error": "图标不存在"}), 404
+        return jsonify({"error": "图标不存在"}), 404
 
 @api_bp.route('/icons', methods=['POST'])
 @login_required
@@ -133,66 +117,39 @@ def upload_icon():
     filename = sanitize_filename(file.filename)
     
     # 确定存储路径
-    if SQLALCHEMY_AVAILABLE:
-        # 使用数据库存储
-        category = Category.query.get_or_404(category_id)
-        category_name = category.name
+    category = category_engine.get(category_id)
+    if not category:
+        category_name = '未分类'
+        category_id = 1
     else:
-        # 使用文件系统存储
-        from .categories import get_categories_from_file
-        categories = get_categories_from_file()
-        category = next((c for c in categories if c['id'] == category_id), None)
-        if not category:
-            category_name = '未分类'
-            category_id = 1
-        else:
-            category_name = category['name']
+        category_name = category['name']
     
     # 确保分类目录存在
     category_dir = os.path.join(app_config.ICON_STORAGE_PATH, category_name)
     if not os.path.exists(category_dir):
         os.makedirs(category_dir)
     
-    # 保存文件
+    # 保存文件（开启去重时相同内容只保存一份）
     file_path = os.path.join(category_dir, filename)
-    file.save(file_path)
+    digest = blob_store.save(file.stream, file_path, dedup=app_config.ICON_DEDUP)
+    icon_cache.invalidate(file_path)
+    file_validators.remember(file_path, digest)
+    precompressed.schedule(file_path, digest)
     
-    # 保存图标信息
-    if SQLALCHEMY_AVAILABLE:
-        # 使用数据库存储
-        icon = Icon(
-            filename=filename,
-            path=os.path.join(category_name, filename),  # 存储相对路径
-            category_id=category_id,
-            description=description
-        )
-        icon.tags = tags
-        db.session.add(icon)
-        db.session.commit()
-        
-        return jsonify(icon.to_dict()), 201
-    else:
-        # 使用文件系统存储
-        icon_id = get_next_icon_id()
-        now = datetime.now().isoformat()
-        
-        new_icon = {
-            'id': icon_id,
-            'filename': filename,
-            'path': os.path.join(category_name, filename),  # 存储相对路径
-            'category_id': category_id,
-            'category_name': category_name,
-            'tags': tags,
-            'description': description,
-            'created_at': now,
-            'updated_at': now
-        }
-        
-        icons = get_icons_from_file()
-        icons.append(new_icon)
-        save_icons_to_file(icons)
-        
-        return jsonify(new_icon), 201
+    # 保存图标信息（ID由存储引擎分配）
+    now = datetime.now().isoformat()
+    new_icon = icon_engine.insert({
+        'filename': filename,
+        'path': os.path.join(category_name, filename),  # 存储相对路径
+        'category_id': category_id,
+        'category_name': category_name,
+        'tags': tags,
+        'description': description,
+        'created_at': now,
+        'updated_at': now
+    })
+    
+    return jsonify(new_icon), 201
 
 @api_bp.route('/icons/<int:icon_id>', methods=['PUT'])
 @login_required
@@ -200,130 +157,108 @@ def update_icon(icon_id):
     """更新图标信息"""
     data = request.get_json() or {}
     
-    if SQLALCHEMY_AVAILABLE:
-        # 使用数据库存储
-        icon = Icon.query.get_or_404(icon_id)
-        
-        # 更新图标信息
-        if 'category_id' in data:
-            icon.category_id = data['category_id']
-        
-        if 'tags' in data:
-            icon.tags = data['tags']
-        
-        if 'description' in data:
-            icon.description = data['description']
-        
-        db.session.commit()
-        
-        return jsonify(icon.to_dict()), 200
-    else:
-        # 使用文件系统存储
-        icons = get_icons_from_file()
-        icon_index = next((i for i, icon in enumerate(icons) if icon['id'] == icon_id), None)
-        
-        if icon_index is None:
-            return jsonify({"error": "图标不存在"}), 404
-        
-        # 更新图标信息
-        icon = icons[icon_index]
-        
-        if 'category_id' in data:
-            # 如果分类改变，需要移动文件
-            from .categories import get_categories_from_file
-            categories = get_categories_from_file()
+    icon = icon_engine.get(icon_id)
+    if icon is None:
+        return jsonify({"error": "图标不存在"}), 404
+    
+    # 更新图标信息
+    changes = {}
+    
+    if 'category_id' in data:
+        # 如果分类改变，需要移动文件
+        new_category = category_engine.get(data['category_id'])
+        if new_category:
+            old_path = os.path.join(app_config.ICON_STORAGE_PATH, icon['path'])
+            new_rel_path = os.path.join(new_category['name'], icon['filename'])
+            new_path = os.path.join(app_config.ICON_STORAGE_PATH, new_rel_path)
             
-            # 获取新分类信息
-            new_category = next((c for c in categories if c['id'] == data['category_id']), None)
-            if new_category:
-                old_path = os.path.join(app_config.ICON_STORAGE_PATH, icon['path'])
-                new_rel_path = os.path.join(new_category['name'], icon['filename'])
-                new_path = os.path.join(app_config.ICON_STORAGE_PATH, new_rel_path)
+            # 移动文件
+            if os.path.exists(old_path) and old_path != new_path:
+                # 确保新目录存在
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                shutil.move(old_path, new_path)
+                icon_cache.invalidate(old_path)
+                icon_cache.invalidate(new_path)
+                # ETag记录随文件转到新路径，被覆盖的文件的预压缩版本不再使用时删除
+                replaced = file_validators.move(old_path, new_path)
+                if replaced and not file_validators.in_use(replaced):
+                    precompressed.discard(replaced)
                 
-                # 移动文件
-                if os.path.exists(old_path) and old_path != new_path:
-                    # 确保新目录存在
-                    os.makedirs(os.path.dirname(new_path), exist_ok=True)
-                    shutil.move(old_path, new_path)
-                    
-                # 更新图标信息
-                icon['category_id'] = data['category_id']
-                icon['category_name'] = new_category['name']
-                icon['path'] = new_rel_path
-        
-        if 'tags' in data:
-            icon['tags'] = data['tags']
-        
-        if 'description' in data:
-            icon['description'] = data['description']
-        
-        icon['updated_at'] = datetime.now().isoformat()
-        icons[icon_index] = icon
-        save_icons_to_file(icons)
-        
-        return jsonify(icon), 200
+            # 更新图标信息
+            changes['category_id'] = data['category_id']
+            changes['category_name'] = new_category['name']
+            changes['path'] = new_rel_path
+    
+    if 'tags' in data:
+        changes['tags'] = data['tags']
+    
+    if 'description' in data:
+        changes['description'] = data['description']
+    
+    changes['updated_at'] = datetime.now().isoformat()
+    icon = icon_engine.update(icon_id, changes)
+    
+    return jsonify(icon), 200
 
 @api_bp.route('/icons/<int:icon_id>', methods=['DELETE'])
 @login_required
 def delete_icon(icon_id):
     """删除图标"""
-    if SQLALCHEMY_AVAILABLE:
-        # 使用数据库存储
-        icon = Icon.query.get_or_404(icon_id)
-        
-        # 删除文件
-        file_path = os.path.join(app_config.ICON_STORAGE_PATH, icon.path)
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        # 删除数据库记录
-        db.session.delete(icon)
-        db.session.commit()
-        
-        return jsonify({"message": "图标已删除"}), 200
-    else:
-        # 使用文件系统存储
-        icons = get_icons_from_file()
-        icon_index = next((i for i, icon in enumerate(icons) if icon['id'] == icon_id), None)
-        
-        if icon_index is None:
-            return jsonify({"error": "图标不存在"}), 404
-        
-        # 删除文件
-        icon = icons[icon_index]
-        file_path = os.path.join(app_config.ICON_STORAGE_PATH, icon['path'])
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        # 删除图标记录
-        icons.pop(icon_index)
-        save_icons_to_file(icons)
-        
-        return jsonify({"message": "图标已删除"}), 200
+    icon = icon_engine.get(icon_id)
+    if icon is None:
+        return jsonify({"error": "图标不存在"}), 404
+    
+    # 删除文件
+    file_path = os.path.join(app_config.ICON_STORAGE_PATH, icon['path'])
+    if os.path.exists(file_path):
+        blob_store.release(file_path)
+        digest = file_validators.forget(file_path)
+        if digest and not file_validators.in_use(digest):
+            precompressed.discard(digest)
+        icon_cache.invalidate(file_path)
+    
+    # 删除图标记录
+    icon_engine.delete(icon_id)
+    
+    return jsonify({"message": "图标已删除"}), 200
 
 @api_bp.route('/icons/<int:icon_id>/file', methods=['GET'])
 def serve_icon_file(icon_id):
     """提供图标文件下载"""
-    if SQLALCHEMY_AVAILABLE:
-        # 使用数据库存储
-        icon = Icon.query.get_or_404(icon_id)
-        icon_path = icon.path
-    else:
-        # 使用文件系统存储
-        icon = get_icon_from_file(icon_id)
-        if not icon:
-            return jsonify({"error": "图标不存在"}), 404
-        icon_path = icon['path']
+    icon = icon_engine.get(icon_id)
+    if not icon:
+        return jsonify({"error": "图标不存在"}), 404
     
     # 获取文件的完整路径
-    full_path = os.path.join(app_config.ICON_STORAGE_PATH, icon_path)
+    full_path = os.path.join(app_config.ICON_STORAGE_PATH, icon['path'])
     
-    # 检查文件是否存在
+    # 热点图标直接从内存缓存发送，不访问文件系统（SVG/ICO 按协商的编码分别缓存）
+    encoding = precompressed.negotiate(request.environ, full_path)
+    cached = icon_cache.get(full_path, encoding)
+    if cached is not None:
+        return send_cached_icon(request.environ, cached, current_app.response_class, app_config.ICON_CACHE_CONTROL)
+    
+    # 删除分类后图标文件在后台迁移，尚未移动的文件从原位置提供（不缓存）
+    cache = icon_cache
     if not os.path.exists(full_path):
-        return jsonify({"error": "图标文件不存在"}), 404
+        full_path = pending_source(full_path, app_config.RELOCATIONS_DIR)
+        cache = None
     
-    # 提供文件下载
-    directory = os.path.dirname(full_path)
-    filename = os.path.basename(full_path)
+    # 检查文件是否存在
+    if not full_path or not os.path.exists(full_path):
+        return jsonify({"error": "图标文件不存在"}), 404
     
-    return send_from_directory(directory, filename, as_attachment=False)
+    # 流式发送文件（不读入内存），支持 Range、HEAD 和条件请求（304时不打开文件）
+    return send_icon_file(request.environ, full_path, response_class=current_app.response_class,
+                          validators=file_validators, cache_control=app_config.ICON_CACHE_CONTROL,
+                          cache=cache, variants=precompressed, encoding=encoding)
+
+@api_bp.route('/blobs/<name>', methods=['GET'])
+def serve_blob(name):
+    """按内容摘要（图标文件的ETag）提供文件，URL对应的内容永远不变，可以被永久缓存"""
+    digest = parse_blob_name(name)
+    if digest is None or not blob_store.contains(digest):
+        return jsonify({"error": "图标文件不存在"}), 404
+    return send_icon_file(request.environ, blob_store.blob_path(digest), mimetype=icon_mimetype(name),
+                          response_class=current_app.response_class, etag=digest,
+                          cache_control=app_config.ICON_IMMUTABLE_CACHE_CONTROL)
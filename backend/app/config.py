@@ -1,6 +1,7 @@
 # 应用配置文件
 import os
 from datetime import timedelta
+from app.storage.sqlite_tuning import sqlalchemy_engine_options
 
 class Config:
     """基础配置类"""
@@ -31,6 +32,31 @@ class Config:
     DATA_DIR = '../data'
     ICONS_DATA_FILE = os.path.join(DATA_DIR, 'icons_metadata.json')
     CATEGORIES_DATA_FILE = os.path.join(DATA_DIR, 'categories.json')
+    # 图标文件的强ETag（内容哈希），两种存储方式都保存在数据目录中
+    FILE_VALIDATORS_FILE = os.path.join(DATA_DIR, 'file_validators.json')
+    # 删除分类后图标文件迁移任务的进度，任何工作进程都可以查询
+    RELOCATIONS_DIR = os.path.join(DATA_DIR, 'relocations')
+    
+    # 图标文件响应的 Cache-Control，有效期内浏览器和CDN直接使用缓存，过期后用ETag重新验证
+    ICON_CACHE_CONTROL = os.getenv('ICON_CACHE_CONTROL', 'public, max-age=86400')
+    
+    # 内容寻址存储：开启后相同内容的上传只保存一份，分类目录下的图标文件是指向它的硬链接
+    ICON_DEDUP = os.getenv('ICON_DEDUP', 'false').lower() == 'true'
+    # 不可变URL（/api/blobs/<SHA-256><扩展名>）的 Cache-Control
+    ICON_IMMUTABLE_CACHE_CONTROL = os.getenv('ICON_IMMUTABLE_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+    
+    # SVG/ICO 的 gzip/brotli 预压缩版本，上传后在后台生成，按 Accept-Encoding 发送
+    ICON_PRECOMPRESS = os.getenv('ICON_PRECOMPRESS', 'true').lower() == 'true'
+    
+    # 图标列表分页：默认每页数量和允许的最大数量
+    ICONS_PAGE_SIZE = int(os.getenv('ICONS_PAGE_SIZE', '100'))
+    ICONS_MAX_PAGE_SIZE = int(os.getenv('ICONS_MAX_PAGE_SIZE', '1000'))
+    
+    # 搜索接口默认返回的结果数
+    ICONS_SEARCH_LIMIT = int(os.getenv('ICONS_SEARCH_LIMIT', '50'))
+    
+    # 文件系统存储引擎：'indexed'（快照 + 追加日志 + 索引）或 'json'（整文件读写）
+    FILE_STORAGE_ENGINE = os.getenv('FILE_STORAGE_ENGINE', 'indexed')
     
     @staticmethod
     def ensure_directories():
@@ -54,6 +80,8 @@ class DevelopmentConfig(Config):
     # 数据库路径使用绝对路径
     db_path = os.path.join(os.getcwd(), '../data', 'icons.db')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', f'sqlite:///{db_path}')
+    # 连接池参数；SQLite 的 PRAGMA（SQLITE_JOURNAL_MODE 等）在创建应用时对每个连接生效
+    SQLALCHEMY_ENGINE_OPTIONS = sqlalchemy_engine_options(SQLALCHEMY_DATABASE_URI)
 
 class ProductionConfig(Config):
     """生产环境配置"""
@@ -62,6 +90,8 @@ class ProductionConfig(Config):
     # 数据库路径使用绝对路径
     db_path = os.path.join(os.getcwd(), '../data', 'icons.db')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', f'sqlite:///{db_path}')
+    # 连接池参数；SQLite 的 PRAGMA（SQLITE_JOURNAL_MODE 等）在创建应用时对每个连接生效
+    SQLALCHEMY_ENGINE_OPTIONS = sqlalchemy_engine_options(SQLALCHEMY_DATABASE_URI)
 
 # 根据环境变量选择配置
 config_by_name = {
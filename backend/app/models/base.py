@@ -9,6 +9,8 @@ STORAGE_TYPES = {
 # 简单的数据模型类（用于文件系统存储）
 class SimpleCategory:
     """简单的分类模型，用于文件系统存储"""
+    __slots__ = ('id', 'name', 'created_at', 'updated_at')
+    
     def __init__(self, id, name, created_at=None, updated_at=None):
         self.id = id
         self.name = name
@@ -26,6 +28,9 @@ class SimpleCategory:
 
 class SimpleIcon:
     """简单的图标模型，用于文件系统存储"""
+    __slots__ = ('id', 'filename', 'path', 'category_id', 'category_name',
+                 'created_at', 'updated_at', 'tags', 'description')
+    
     def __init__(self, id, filename, path, category_id, category_name=None,
                  created_at=None, updated_at=None, tags=None, description=None):
         self.id = id
@@ -11,17 +11,41 @@ class Category(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # 关系定义
-    icons = db.relationship('Icon', backref='category', lazy=True, cascade='all, delete-orphan')
+    # 关系定义：删除分类时不级联删除图标（图标会先被移到默认分类，外键为 ON DELETE SET NULL）
+    icons = db.relationship('Icon', backref='category', lazy=True, passive_deletes=True)
     
-    def to_dict(self):
-        """转换为字典格式"""
+    @classmethod
+    def icon_counts(cls):
+        """统计每个分类下的图标数量（一次分组聚合查询）
+        
+        Returns:
+            {分类ID: 图标数量} 字典，没有图标的分类不在其中
+        """
+        from .icon import Icon
+        rows = db.session.query(Icon.category_id, db.func.count(Icon.id)).group_by(Icon.category_id).all()
+        return {category_id: count for category_id, count in rows}
+    
+    @classmethod
+    def to_dict_many(cls, categories):
+        """批量转换为字典格式，图标数量只查询一次"""
+        counts = cls.icon_counts() if categories else {}
+        return [category.to_dict(icon_count=counts.get(category.id, 0)) for category in categories]
+    
+    def to_dict(self, icon_count=None):
+        """转换为字典格式
+        
+        Args:
+            icon_count: 已知的图标数量，为None时用一次COUNT查询统计（不加载图标记录）
+        """
+        if icon_count is None:
+            from .icon import Icon
+            icon_count = db.session.query(db.func.count(Icon.id)).filter(Icon.category_id == self.id).scalar()
         return {
             'id': self.id,
             'name': self.name,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'icon_count': len(self.icons)  # 返回该分类下的图标数量
+            'icon_count': icon_count  # 返回该分类下的图标数量
         }
     
     def __repr__(self):
@@ -1,7 +1,40 @@
 # 图标模型文件
 import json
 from datetime import datetime
+from sqlalchemy import select, intersect, text
+from sqlalchemy.exc import OperationalError
 from .. import db
+from ..storage.search import SEARCH_WEIGHTS, FTS5_OPTIONS, search_terms, fts_search_ids
+
+# FTS5 全文索引表，以 icons 表为外部内容，通过触发器与图标的增删改保持同步
+SEARCH_TABLE = 'icons_fts'
+_SEARCH_COLUMNS = ', '.join(SEARCH_WEIGHTS)
+_SEARCH_OLD = ', '.join(f'old.{column}' for column in SEARCH_WEIGHTS)
+_SEARCH_NEW = ', '.join(f'new.{column}' for column in SEARCH_WEIGHTS)
+_SEARCH_SCHEMA = [
+    f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5({_SEARCH_COLUMNS}, content = 'icons', content_rowid = 'id', "
+    f"{FTS5_OPTIONS})",
+    f"CREATE TRIGGER {SEARCH_TABLE}_insert AFTER INSERT ON icons BEGIN "
+    f"INSERT INTO {SEARCH_TABLE} (rowid, {_SEARCH_COLUMNS}) VALUES (new.id, {_SEARCH_NEW}); END",
+    f"CREATE TRIGGER {SEARCH_TABLE}_delete AFTER DELETE ON icons BEGIN "
+    f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, {_SEARCH_COLUMNS}) VALUES ('delete', old.id, {_SEARCH_OLD}); END",
+    f"CREATE TRIGGER {SEARCH_TABLE}_update AFTER UPDATE OF {_SEARCH_COLUMNS} ON icons BEGIN "
+    f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, {_SEARCH_COLUMNS}) VALUES ('delete', old.id, {_SEARCH_OLD}); "
+    f"INSERT INTO {SEARCH_TABLE} (rowid, {_SEARCH_COLUMNS}) VALUES (new.id, {_SEARCH_NEW}); END",
+    # 为已有的图标建立索引
+    f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild')",
+]
+
+class IconTag(db.Model):
+    """图标标签关联表，每个 (标签, 图标) 一行，按标签查询走 (tag, icon_id) 索引"""
+    __tablename__ = 'icon_tags'
+    __table_args__ = (db.Index('ix_icon_tags_tag_icon_id', 'tag', 'icon_id'),)
+    
+    icon_id = db.Column(db.Integer, db.ForeignKey('icons.id', ondelete='CASCADE'), primary_key=True)
+    tag = db.Column(db.String(100), primary_key=True)
+    
+    def __repr__(self):
+        return f'<IconTag(icon_id={self.icon_id}, tag="{self.tag}")>'
 
 class Icon(db.Model):
     """图标数据库模型"""
@@ -18,12 +51,31 @@ class Icon(db.Model):
     _tags = db.Column('tags', db.Text, nullable=True, default='[]')
     description = db.Column(db.Text, nullable=True)
     
+    # 全文索引是否可用（由 create_search_index() 设置）
+    search_enabled = False
+    
+    # 标签关联表中的行，由 tags 属性的setter维护（tags 列保留标签的原始顺序）
+    tag_rows = db.relationship('IconTag', lazy=True, cascade='all, delete-orphan')
+    
+    # 解析后的标签缓存 (tags 列的原始字符串, 标签列表)，原始字符串变化（setter赋值、重新加载）后失效
+    _tags_cache = None
+    
     @property
     def tags(self):
-        """获取标签列表"""
-        if self._tags:
+        """获取标签列表（每个 tags 列的值只解析一次JSON）"""
+        raw = self._tags
+        cache = self._tags_cache
+        if cache is None or cache[0] is not raw:
+            cache = self._tags_cache = (raw, self._parse_tags(raw))
+        # 返回副本，调用方修改列表不会影响缓存
+        return list(cache[1])
+    
+    @staticmethod
+    def _parse_tags(raw):
+        if raw:
             try:
-                return json.loads(self._tags)
+                tags = json.loads(raw)
+                return tags if isinstance(tags, list) else []
             except (json.JSONDecodeError, TypeError):
                 return []
         return []
@@ -32,22 +84,128 @@ class Icon(db.Model):
     def tags(self, value):
         """设置标签列表"""
         if isinstance(value, list):
+            parsed = list(value)
             self._tags = json.dumps(value)
         elif isinstance(value, str):
             # 如果传入的是字符串，则尝试解析为JSON
             try:
                 parsed = json.loads(value)
-                if isinstance(parsed, list):
-                    self._tags = value
-                else:
-                    self._tags = json.dumps([])
             except json.JSONDecodeError:
+                parsed = None
+            if isinstance(parsed, list):
+                self._tags = value
+            else:
+                parsed = []
                 self._tags = json.dumps([])
         else:
+            parsed = []
             self._tags = json.dumps([])
+        self._tags_cache = (self._tags, parsed)
+        self._sync_tag_rows(parsed)
     
-    def to_dict(self):
-        """转换为字典格式"""
+    def _sync_tag_rows(self, tags):
+        """让标签关联表与标签列表一致，未变化的行原样保留"""
+        existing = {row.tag: row for row in self.tag_rows}
+        wanted = dict.fromkeys(tag for tag in tags if isinstance(tag, str))
+        self.tag_rows = [existing.get(tag) or IconTag(tag=tag) for tag in wanted]
+    
+    @classmethod
+    def tagged_ids(cls, tags, match='all'):
+        """通过标签关联表获取带有指定标签的图标ID
+        
+        Args:
+            tags: 标签列表
+            match: 'all' 需要包含全部标签（各标签的图标ID集合求交集），'any' 包含任一标签即可
+        
+        Returns:
+            升序的图标ID列表
+        """
+        tags = list(dict.fromkeys(tags))
+        if not tags:
+            return []
+        if match == 'any':
+            statement = select(IconTag.icon_id).where(IconTag.tag.in_(tags)).distinct()
+        elif len(tags) == 1:
+            statement = select(IconTag.icon_id).where(IconTag.tag == tags[0])
+        else:
+            statement = intersect(*[select(IconTag.icon_id).where(IconTag.tag == tag) for tag in tags])
+        return sorted(row[0] for row in db.session.execute(statement))
+    
+    @classmethod
+    def rebuild_tag_index(cls):
+        """标签关联表为空而已有图标带有标签时（例如从旧版本升级），根据 tags 列回填
+        
+        Returns:
+            回填的图标数量
+        """
+        if db.session.query(IconTag.icon_id).first() is not None:
+            return 0
+        icons = cls.query.filter(cls._tags.isnot(None), cls._tags != '[]', cls._tags != '').all()
+        rows = [IconTag(icon_id=icon.id, tag=tag)
+                for icon in icons for tag in dict.fromkeys(icon.tags) if isinstance(tag, str)]
+        if rows:
+            db.session.add_all(rows)
+            db.session.commit()
+        return len(icons)
+    
+    @classmethod
+    def create_search_index(cls):
+        """SQLite 数据库中创建 FTS5 全文索引表及同步触发器（已存在时不做处理）
+        
+        Returns:
+            全文索引是否可用
+        """
+        cls.search_enabled = False
+        if db.engine.dialect.name != 'sqlite':
+            return False
+        try:
+            exists = db.session.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                                        {'name': SEARCH_TABLE}).first()
+            if not exists:
+                for statement in _SEARCH_SCHEMA:
+                    db.session.execute(text(statement))
+                db.session.commit()
+                print("创建图标全文索引")
+        except OperationalError as e:
+            db.session.rollback()
+            print(f"全文索引不可用（SQLite 可能未编译 FTS5），搜索将逐条匹配: {e}")
+            return False
+        cls.search_enabled = True
+        return True
+    
+    @classmethod
+    def search_ids(cls, query, limit=50):
+        """通过全文索引搜索文件名、标签和描述，每个词按前缀匹配
+        
+        Args:
+            query: 搜索关键词
+            limit: 最多返回的数量
+        
+        Returns:
+            按相关度排序的图标ID列表（见 fts_search_ids）；全文索引不可用时返回None
+        """
+        if not cls.search_enabled:
+            return None
+        return fts_search_ids(lambda sql, params: db.session.execute(text(sql), params),
+                              SEARCH_TABLE, search_terms(query), limit)
+    
+    @classmethod
+    def to_dict_many(cls, icons):
+        """批量转换为字典格式，所有图标的分类名称只用一次查询取得"""
+        from .category import Category
+        category_ids = {icon.category_id for icon in icons if icon.category_id is not None}
+        categories = {}
+        if category_ids:
+            rows = db.session.query(Category.id, Category.name).filter(Category.id.in_(category_ids)).all()
+            categories = {category_id: name for category_id, name in rows}
+        return [icon.to_dict(categories) for icon in icons]
+    
+    def to_dict(self, categories=None):
+        """转换为字典格式
+        
+        Args:
+            categories: 可选的 {分类ID: 分类名称} 字典，提供时不再通过关系逐个加载分类
+        """
         result = {
             'id': self.id,
             'filename': self.filename,
@@ -60,7 +218,10 @@ class Icon(db.Model):
         }
         
         # 如果有关系，则包含分类名称
-        if hasattr(self, 'category') and self.category:
+        if categories is not None:
+            if self.category_id in categories:
+                result['category_name'] = categories[self.category_id]
+        elif hasattr(self, 'category') and self.category:
             result['category_name'] = self.category.name
         
         return result
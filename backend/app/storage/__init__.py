@@ -0,0 +1,19 @@
+# 存储层
+# 该包只使用相对导入、不依赖后端应用本身，
+# 因此根目录的 app.py 也可以把 backend/app 加入 sys.path 后以顶层包 storage 的形式复用它
+from .metadata_cache import MetadataCache, metadata_cache
+from .result_cache import ResultCache, result_cache
+from .icon_cache import CachedIcon, IconCache, icon_cache
+from .locking import FileLock, file_lock, atomic_write, atomic_write_json
+from .journal import JournalStore, open_store
+from .sequence import SequenceAllocator
+from .engine import StorageEngine, JsonFileEngine, IndexedFileEngine, create_file_engine
+from .sqlalchemy_engine import SQLAlchemyEngine, install_generation_tracking, database_generation
+from .sqlite_engine import SQLiteEngine
+from .sqlite_tuning import SQLITE_PRAGMAS, apply_sqlite_pragmas, sqlalchemy_engine_options, install_sqlite_tuning
+from .columnar import ColumnarTable
+from .relocation import plan_relocation, start_relocation, resume_relocations, get_relocation, pending_source
+from .serving import ICON_MIMETYPES, icon_mimetype, send_icon_file, send_cached_icon
+from .validators import FileValidators, file_digest
+from .blobs import BLOB_DIR, BlobStore, parse_blob_name
+from .precompress import PRECOMPRESS_DIR, COMPRESSIBLE_EXTENSIONS, PrecompressedStore, negotiate_encoding
@@ -0,0 +1,150 @@
+# 内容寻址的图标文件存储
+import os
+import re
+import uuid
+import shutil
+import hashlib
+from .locking import file_lock
+from .validators import file_digest
+
+# blob 目录（位于图标存储目录下）
+BLOB_DIR = '.blobs'
+
+# 上传时每次读取的字节数
+_CHUNK_SIZE = 64 * 1024
+
+# 不可变URL中的文件名：SHA-256 加可选的扩展名
+_BLOB_NAME = re.compile(r'^([0-9a-f]{64})(\.[A-Za-z0-9]+)?$')
+
+
+def parse_blob_name(name):
+    """解析不可变URL中的文件名（<SHA-256><扩展名>），格式不对时返回None"""
+    match = _BLOB_NAME.match(name)
+    return match.group(1) if match else None
+
+
+class BlobStore:
+    """内容寻址的文件存储，相同内容只保存一份
+
+    每种内容以SHA-256命名保存在 <图标目录>/.blobs/<前两位>/<摘要>，分类目录下的图标文件是指向它的
+    硬链接，因此现有的URL、重命名、在分类间移动都不受影响。文件的硬链接数就是引用计数：
+    release() 删除图标文件时，如果 blob 只剩自身一个链接就一并删除。
+    文件系统不支持硬链接时退化为复制（该文件不去重），没有被任何图标链接的 blob 不会保留。
+    """
+
+    def __init__(self, root):
+        """初始化
+
+        Args:
+            root: 图标存储目录
+        """
+        self.root = os.path.abspath(root)
+        self.directory = os.path.join(self.root, BLOB_DIR)
+
+    def blob_path(self, digest):
+        """内容摘要对应的 blob 文件路径"""
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def contains(self, digest):
+        return os.path.isfile(self.blob_path(digest))
+
+    def _lock(self):
+        # 保存和释放互斥，避免释放最后一个引用的同时另一个上传链接到同一个 blob
+        return file_lock(self.directory).exclusive()
+
+    def save(self, stream, path, dedup=True):
+        """把上传的数据流保存为 path，写入临时文件的同时计算SHA-256
+
+        无论是否去重，目标文件都通过替换目录项写入，不会改写已有文件的内容
+        （已有文件可能是其他图标共享的 blob 链接）。
+
+        Args:
+            stream: 可读的二进制流（例如 FileStorage.stream）
+            path: 图标文件路径
+            dedup: True 时内容保存到 blob 并在 path 创建硬链接，False 时直接保存为普通文件
+
+        Returns:
+            内容的SHA-256（十六进制）
+        """
+        # 临时文件与最终位置在同一目录树中，保证可以原子替换
+        if dedup:
+            os.makedirs(self.directory, exist_ok=True)
+            temp = os.path.join(self.directory, f'.upload-{uuid.uuid4().hex}')
+        else:
+            temp = f'{path}.{uuid.uuid4().hex}.tmp'
+        digest = hashlib.sha256()
+        try:
+            with open(temp, 'wb') as f:
+                for chunk in iter(lambda: stream.read(_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    f.write(chunk)
+            digest = digest.hexdigest()
+
+            if not dedup:
+                os.replace(temp, path)
+                return digest
+
+            blob = self.blob_path(digest)
+            with self._lock():
+                if os.path.exists(blob):
+                    # 已有相同内容，丢弃本次写入的数据
+                    os.remove(temp)
+                else:
+                    os.makedirs(os.path.dirname(blob), exist_ok=True)
+                    os.replace(temp, blob)
+                self._link(blob, path)
+            return digest
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def _link(self, blob, path):
+        """在 path 创建指向 blob 的硬链接（替换已有文件），需在 _lock() 内调用
+
+        不能创建硬链接（例如跨文件系统）时复制一份；复制的文件是普通文件，release() 不会释放 blob，
+        因此此时没有任何图标链接到的 blob（例如本次上传才创建的）随即删除。
+        """
+        temp = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            try:
+                os.link(blob, temp)
+            except OSError:
+                shutil.copyfile(blob, temp)
+            os.replace(temp, path)
+        except OSError:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        finally:
+            if os.stat(blob).st_nlink == 1:
+                os.remove(blob)
+
+    def release(self, path):
+        """删除图标文件，它是某个 blob 的最后一个引用时同时删除该 blob
+
+        不是 blob 链接的普通文件直接删除，因此关闭去重之后仍可用于删除图标。
+
+        Returns:
+            是否删除了 blob
+        """
+        if os.stat(path).st_nlink == 1:
+            # 普通文件，不涉及 blob
+            os.remove(path)
+            return False
+
+        with self._lock():
+            stat = os.stat(path)
+            blob = None
+            if stat.st_nlink == 2:
+                # 只剩 blob 自身和这个图标文件两个链接
+                candidate = self.blob_path(file_digest(path))
+                try:
+                    if os.stat(candidate).st_ino == stat.st_ino:
+                        blob = candidate
+                except OSError:
+                    pass
+            os.remove(path)
+            if blob is not None:
+                os.remove(blob)
+                return True
+            return False
@@ -0,0 +1,258 @@
+# 列式内存表
+import bisect
+from array import array
+
+# 整数列中表示“没有值”的哨兵
+_NULL = -(2 ** 63)
+
+
+class _SymbolColumn:
+    """字典编码的列：每行只保存一个整数编码，相同的值（例如分类名称）只保存一份"""
+
+    __slots__ = ('codes', 'symbols', 'index')
+
+    def __init__(self):
+        self.codes = array('I')
+        self.symbols = []
+        self.index = {}
+
+    def append(self, value):
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.symbols)
+            self.symbols.append(value)
+        self.codes.append(code)
+
+    def __getitem__(self, row):
+        return self.symbols[self.codes[row]]
+
+    def rows_where(self, value):
+        code = self.index.get(value)
+        if code is None:
+            return []
+        return [row for row, row_code in enumerate(self.codes) if row_code == code]
+
+    def counts(self):
+        counts = [0] * len(self.symbols)
+        for code in self.codes:
+            counts[code] += 1
+        return {symbol: count for symbol, count in zip(self.symbols, counts) if count}
+
+
+class _IntColumn:
+    """整数列，使用 array('q') 紧凑保存；出现非整数值时退化为普通列表"""
+
+    __slots__ = ('values',)
+
+    def __init__(self):
+        self.values = array('q')
+
+    def append(self, value):
+        if isinstance(self.values, array):
+            if value is None:
+                self.values.append(_NULL)
+                return
+            if type(value) is int and value != _NULL:
+                self.values.append(value)
+                return
+            self.values = [self[row] for row in range(len(self.values))]
+        self.values.append(value)
+
+    def __getitem__(self, row):
+        value = self.values[row]
+        if value == _NULL and isinstance(self.values, array):
+            return None
+        return value
+
+    def rows_where(self, value):
+        if isinstance(self.values, array):
+            if value is None:
+                value = _NULL
+            elif type(value) is not int:
+                return []
+        return [row for row, row_value in enumerate(self.values) if row_value == value]
+
+    def counts(self):
+        counts = {}
+        for row in range(len(self.values)):
+            value = self[row]
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+
+class _StringColumn:
+    """字符串列：全部值以UTF-8编码连续保存在一个 bytearray 中，每行只额外占用8字节的结束偏移
+
+    读取时才解码为 str，避免每个值一个 Python 字符串对象；出现非字符串值时退化为普通列表。
+    """
+
+    __slots__ = ('data', 'ends', 'nulls', 'values')
+
+    def __init__(self):
+        self.data = bytearray()
+        self.ends = array('Q')
+        self.nulls = set()
+        self.values = None
+
+    def append(self, value):
+        if self.values is not None:
+            self.values.append(value)
+            return
+        if value is None:
+            self.nulls.add(len(self.ends))
+        elif type(value) is str:
+            self.data += value.encode('utf-8')
+        else:
+            self.values = [self[row] for row in range(len(self.ends))]
+            self.values.append(value)
+            self.data, self.ends, self.nulls = bytearray(), array('Q'), set()
+            return
+        self.ends.append(len(self.data))
+
+    def __getitem__(self, row):
+        if self.values is not None:
+            return self.values[row]
+        if row in self.nulls:
+            return None
+        start = self.ends[row - 1] if row else 0
+        return self.data[start:self.ends[row]].decode('utf-8')
+
+    def __len__(self):
+        return len(self.values) if self.values is not None else len(self.ends)
+
+    def rows_where(self, value):
+        return [row for row in range(len(self)) if self[row] == value]
+
+    def counts(self):
+        counts = {}
+        for row in range(len(self)):
+            value = self[row]
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+
+class _ObjectColumn:
+    """普通列，直接引用原始值"""
+
+    __slots__ = ('values',)
+
+    def __init__(self):
+        self.values = []
+
+    def append(self, value):
+        self.values.append(value)
+
+    def __getitem__(self, row):
+        return self.values[row]
+
+    def rows_where(self, value):
+        return [row for row, row_value in enumerate(self.values) if row_value == value]
+
+    def counts(self):
+        counts = {}
+        for value in self.values:
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+
+class ColumnarTable:
+    """列式内存表
+
+    按列保存记录：int_fields（例如 id、category_id）保存在 array 中，每行8字节；
+    symbol_fields（例如分类名称）做字典编码，每行4字节，不同的值只保存一份；
+    string_fields（例如文件名）按UTF-8连续保存在一块内存中；其余字段保存在列表中，直接引用原始值。
+    相比每条记录一个字典，整张表的内存占用小得多，按列筛选和统计只需要扫描一列。
+
+    表是只读快照，数据变化后应重新构建（参见 StorageEngine.generation()）。
+    """
+
+    def __init__(self, records, fields, int_fields=(), symbol_fields=(), string_fields=()):
+        """构建表
+
+        Args:
+            records: 记录字典的可迭代对象
+            fields: 需要保存的字段，记录中缺少的字段保存为None
+            int_fields: 整数字段
+            symbol_fields: 重复值很多的字段
+            string_fields: 取值各不相同的字符串字段
+        """
+        self.fields = tuple(fields)
+        self._columns = {}
+        for field in self.fields:
+            if field in int_fields:
+                self._columns[field] = _IntColumn()
+            elif field in symbol_fields:
+                self._columns[field] = _SymbolColumn()
+            elif field in string_fields:
+                self._columns[field] = _StringColumn()
+            else:
+                self._columns[field] = _ObjectColumn()
+        self._length = 0
+        self._orders = {}
+
+        # records 可以是逐条产生记录的迭代器（例如 StorageEngine.scan()），表中不保留对记录的引用
+        columns = [(field, self._columns[field]) for field in self.fields]
+        for record in records:
+            for field, column in columns:
+                column.append(record.get(field))
+            self._length += 1
+
+    def __len__(self):
+        return self._length
+
+    def value(self, row, field):
+        """获取某一行某个字段的值"""
+        return self._columns[field][row]
+
+    def row(self, row):
+        """把某一行还原为字典"""
+        return {field: self._columns[field][row] for field in self.fields}
+
+    def rows(self, row_numbers=None):
+        """按行号依次还原为字典，未指定行号时返回全部行"""
+        if row_numbers is None:
+            row_numbers = range(self._length)
+        for row in row_numbers:
+            yield self.row(row)
+
+    def rows_where(self, field, value):
+        """获取字段等于指定值的行号列表（按行号排序）"""
+        return self._columns[field].rows_where(value)
+
+    def counts(self, field):
+        """统计字段每个取值出现的行数"""
+        return self._columns[field].counts()
+
+    def _order(self, field):
+        """按字段值排序的 (字段值列表, 行号列表)，首次使用时构建并缓存，值为None的行不参与排序"""
+        order = self._orders.get(field)
+        if order is None:
+            column = self._columns[field]
+            pairs = sorted((column[row], row) for row in range(self._length) if column[row] is not None)
+            order = self._orders[field] = ([value for value, _ in pairs], [row for _, row in pairs])
+        return order
+
+    def page(self, field, limit, after=None, rows=None):
+        """键集分页：按字段值升序返回字段值大于 after 的前 limit 行
+
+        Args:
+            field: 排序字段（值需唯一，例如 id）
+            limit: 每页行数
+            after: 游标，即上一页最后一行的字段值
+            rows: 可选的候选行号（例如 rows_where 的结果）
+
+        Returns:
+            (行号列表, 下一页游标)，没有更多行时游标为None
+        """
+        if rows is None:
+            values, ordered_rows = self._order(field)
+            start = bisect.bisect_right(values, after) if after is not None else 0
+            selected = ordered_rows[start:start + limit + 1]
+        else:
+            column = self._columns[field]
+            selected = sorted((row for row in rows
+                               if column[row] is not None and (after is None or column[row] > after)),
+                              key=column.__getitem__)[:limit + 1]
+        if len(selected) > limit:
+            return selected[:limit], self.value(selected[limit - 1], field)
+        return selected, None
@@ -0,0 +1,422 @@
+# 存储引擎接口及文件系统实现
+import os
+import json
+import bisect
+from contextlib import nullcontext
+from .metadata_cache import metadata_cache
+from .locking import file_lock, atomic_write_json
+from .journal import open_store
+from .search import search_terms, scan_search
+
+
+def _with_id(record, record_id):
+    """返回以 'id' 作为第一个字段的记录副本，保持与原有JSON输出的字段顺序一致"""
+    result = {'id': record_id}
+    result.update((key, value) for key, value in record.items() if key != 'id')
+    return result
+
+
+# 按标签筛选并同时按分类筛选时，每批读取的记录数
+_TAG_BATCH_SIZE = 500
+
+
+def _page(records, limit):
+    """截取一页记录，多取的一条用于判断是否还有下一页"""
+    if len(records) > limit:
+        return records[:limit], records[limit - 1]['id']
+    return records, None
+
+
+class StorageEngine:
+    """存储引擎接口
+
+    一个引擎实例对应一张“表”（图标或分类），记录统一使用字典表示，
+    字段与各接口返回给前端的JSON保持一致。子类只需实现批量操作，
+    单条操作由基类转换为批量操作完成。
+    """
+
+    # 按分类筛选时使用的字段
+    category_field = 'category_id'
+    # 按标签筛选时使用的字段（值为标签列表）
+    tag_field = 'tags'
+
+    # ---- 读取 ----
+
+    def get_many(self, record_ids):
+        """按ID批量获取记录（保持传入顺序，忽略不存在的记录）"""
+        raise NotImplementedError
+
+    def list_all(self):
+        """获取全部记录"""
+        raise NotImplementedError
+
+    def find(self, field, value):
+        """获取字段等于指定值的记录"""
+        raise NotImplementedError
+
+    def scan(self):
+        """逐条遍历全部记录，用于一次性构建派生数据
+
+        默认实现基于 list_all()；子类可以避免把全部记录同时保存在内存中。
+        """
+        return iter(self.list_all())
+
+    def count_by_category(self):
+        """统计每个分类下的记录数，返回 {分类ID: 数量}"""
+        raise NotImplementedError
+
+    def generation(self):
+        """返回数据版本标识，数据被修改后会变为不同的值
+
+        用于判断基于这些数据构建的缓存（例如 app.py 中的列式图标表）是否仍然有效。
+        """
+        raise NotImplementedError
+
+    def get(self, record_id):
+        """按ID获取单条记录，不存在时返回None"""
+        records = self.get_many([record_id])
+        return records[0] if records else None
+
+    def list_by_category(self, category_id):
+        """获取指定分类下的记录"""
+        return self.find(self.category_field, category_id)
+
+    def list_page(self, limit, after=None, category_id=None):
+        """按ID升序的键集分页
+
+        Args:
+            limit: 每页记录数
+            after: 游标，只返回ID大于该值的记录；为None时从头开始
+            category_id: 可选的分类ID
+
+        Returns:
+            (记录列表, 下一页游标)，没有更多记录时游标为None
+        """
+        records = self.list_all() if category_id is None else self.list_by_category(category_id)
+        records = sorted((record for record in records if after is None or record['id'] > after),
+                         key=lambda record: record['id'])
+        return _page(records, limit)
+
+    def tagged_ids(self, tags, match='all'):
+        """获取带有指定标签的记录ID（升序）
+
+        Args:
+            tags: 标签列表
+            match: 'all' 需要包含全部标签，'any' 包含任一标签即可
+        """
+        wanted = set(tags)
+        ids = []
+        for record in self.list_all():
+            record_tags = record.get(self.tag_field) or []
+            if wanted.issubset(record_tags) if match == 'all' else not wanted.isdisjoint(record_tags):
+                ids.append(record['id'])
+        return sorted(ids)
+
+    def list_tagged(self, tags, match='all', limit=None, after=None, category_id=None):
+        """按标签筛选记录，可以同时按分类筛选并按ID键集分页
+
+        Args:
+            tags: 标签列表
+            match: 'all' 或 'any'，见 tagged_ids()
+            limit: 每页记录数，为None时返回全部匹配的记录
+            after: 游标，只返回ID大于该值的记录
+            category_id: 可选的分类ID
+
+        Returns:
+            (记录列表, 下一页游标)，没有更多记录或未分页时游标为None
+        """
+        ids = self.tagged_ids(tags, match)
+        if after is not None:
+            ids = ids[bisect.bisect_right(ids, after):]
+        if category_id is None:
+            records = self.get_many(ids if limit is None else ids[:limit + 1])
+        else:
+            # 分批读取并按分类过滤，凑够一页即停止
+            records = []
+            for start in range(0, len(ids), _TAG_BATCH_SIZE):
+                records.extend(record for record in self.get_many(ids[start:start + _TAG_BATCH_SIZE])
+                               if record.get(self.category_field) == category_id)
+                if limit is not None and len(records) > limit:
+                    break
+        if limit is None:
+            return records, None
+        return _page(records, limit)
+
+    def search(self, query, limit=50):
+        """全文搜索文件名、标签和描述，每个词按前缀匹配
+
+        Args:
+            query: 用户输入的搜索关键词
+            limit: 最多返回的记录数
+
+        Returns:
+            按相关度排序的记录列表
+        """
+        return scan_search(self.list_all(), search_terms(query), limit)
+
+    def find_first(self, field, value):
+        """获取第一条字段等于指定值的记录，不存在时返回None"""
+        records = self.find(field, value)
+        return records[0] if records else None
+
+    # ---- 写入 ----
+
+    def insert_many(self, records):
+        """批量插入记录，没有 'id' 的记录由引擎分配ID
+
+        Returns:
+            插入后的记录列表（包含分配的ID）
+        """
+        raise NotImplementedError
+
+    def update_many(self, changes_by_id):
+        """批量更新记录的部分字段，不存在的记录会被忽略
+
+        Args:
+            changes_by_id: {记录ID: 要更新的字段} 字典
+
+        Returns:
+            更新后的记录列表
+        """
+        raise NotImplementedError
+
+    def delete_many(self, record_ids):
+        """批量删除记录，不存在的记录会被忽略
+
+        Returns:
+            被删除的记录列表
+        """
+        raise NotImplementedError
+
+    def update_where(self, field, value, changes):
+        """把字段等于指定值的全部记录更新为相同的字段值（例如删除分类时把图标移到默认分类）
+
+        数据库引擎用一条 UPDATE 语句完成，不需要逐条读取记录。
+
+        Args:
+            field: 筛选字段
+            value: 筛选值
+            changes: 要更新的字段
+
+        Returns:
+            更新的记录数
+        """
+        return len(self.update_many({record['id']: dict(changes) for record in self.find(field, value)}))
+
+    def exclusive(self):
+        """持有写锁执行一组读写操作（例如先查找再插入），期间其他线程和进程不能写入
+
+        文件和SQLite引擎在锁内调用的读写方法可以重入；默认实现不加锁。
+        """
+        return nullcontext()
+
+    def upsert(self, field, value, values):
+        """插入或更新字段等于指定值的唯一一条记录，已有的重复记录只保留第一条
+
+        查找和写入在 exclusive() 内完成，多个进程同时写入同一个值时也不会产生重复记录。
+
+        Args:
+            field: 作为唯一键的字段
+            value: 唯一键的值
+            values: 要写入的字段
+
+        Returns:
+            写入后的记录
+        """
+        with self.exclusive():
+            records = self.find(field, value)
+            if not records:
+                return self.insert(dict(values, **{field: value}))
+            if len(records) > 1:
+                self.delete_many([record['id'] for record in records[1:]])
+            return self.update(records[0]['id'], values)
+
+    def insert(self, record):
+        """插入单条记录"""
+        return self.insert_many([record])[0]
+
+    def update(self, record_id, changes):
+        """更新单条记录，不存在时返回None"""
+        records = self.update_many({record_id: changes})
+        return records[0] if records else None
+
+    def delete(self, record_id):
+        """删除单条记录，返回被删除的记录，不存在时返回None"""
+        records = self.delete_many([record_id])
+        return records[0] if records else None
+
+
+class JsonFileEngine(StorageEngine):
+    """整文件JSON存储引擎
+
+    与最初的实现相同：读取整个JSON文件（借助元数据缓存避免重复解析），
+    写入时在排他锁内重新读取、修改并原子替换整个文件。适合数据量很小的场景。
+    """
+
+    def __init__(self, path, default=None):
+        self.path = os.path.abspath(path)
+        self.default = default or []
+
+    def _load(self):
+        try:
+            records = metadata_cache.load(self.path)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"加载{self.path}失败: {e}")
+            records = None
+        if records is None:
+            records = [dict(record) for record in self.default]
+        return records
+
+    def _save(self, records):
+        atomic_write_json(self.path, records, ensure_ascii=False, indent=2, default=str)
+        metadata_cache.invalidate(self.path)
+
+    def generation(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def exclusive(self):
+        return file_lock(self.path).exclusive()
+
+    def get_many(self, record_ids):
+        records = {record.get('id'): record for record in self._load()}
+        return [records[record_id] for record_id in record_ids if record_id in records]
+
+    def list_all(self):
+        return list(self._load())
+
+    def find(self, field, value):
+        return [record for record in self._load() if record.get(field) == value]
+
+    def count_by_category(self):
+        counts = {}
+        for record in self._load():
+            value = record.get(self.category_field)
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+    def insert_many(self, records):
+        with file_lock(self.path).exclusive():
+            existing = list(self._load())
+            next_id = max([record.get('id', 0) for record in existing], default=0) + 1
+            inserted = []
+            for record in records:
+                if record.get('id') is None:
+                    record = _with_id(record, next_id)
+                    next_id += 1
+                inserted.append(dict(record))
+            self._save(existing + inserted)
+            return inserted
+
+    def update_many(self, changes_by_id):
+        with file_lock(self.path).exclusive():
+            records = [dict(record) for record in self._load()]
+            updated = []
+            for record in records:
+                changes = changes_by_id.get(record.get('id'))
+                if changes is not None:
+                    record.update(changes)
+                    updated.append(record)
+            if updated:
+                self._save(records)
+            return updated
+
+    def delete_many(self, record_ids):
+        record_ids = set(record_ids)
+        with file_lock(self.path).exclusive():
+            records = self._load()
+            deleted = [record for record in records if record.get('id') in record_ids]
+            if deleted:
+                self._save([record for record in records if record.get('id') not in record_ids])
+            return deleted
+
+
+class IndexedFileEngine(StorageEngine):
+    """带索引的文件存储引擎
+
+    基于 JournalStore：JSON快照 + 追加日志，内存中维护主键索引和二级索引，
+    写入只追加日志，按ID和按分类的查询不需要扫描全部记录。
+    index_fields 包含 tags 时维护 标签 -> id列表 的倒排索引，按标签筛选只对id列表求交集/并集。
+    """
+
+    def __init__(self, path, default=None, index_fields=('category_id',)):
+        self.store = open_store(path, default=default, index_fields=index_fields)
+
+    def generation(self):
+        return self.store.generation()
+
+    def exclusive(self):
+        return self.store.exclusive()
+
+    def get_many(self, record_ids):
+        return self.store.get_many(record_ids)
+
+    def list_all(self):
+        return self.store.all()
+
+    def scan(self):
+        return self.store.scan()
+
+    def list_page(self, limit, after=None, category_id=None):
+        if category_id is not None and not self.store.has_index(self.category_field):
+            return super().list_page(limit, after, category_id)
+        field = self.category_field if category_id is not None else None
+        return _page(self.store.page(limit + 1, after, field, category_id), limit)
+
+    def tagged_ids(self, tags, match='all'):
+        if self.store.has_index(self.tag_field):
+            return self.store.match(self.tag_field, tags, match)
+        return super().tagged_ids(tags, match)
+
+    def find(self, field, value):
+        if self.store.has_index(field):
+            return self.store.find(field, value)
+        return [record for record in self.store.all() if record.get(field) == value]
+
+    def count_by_category(self):
+        if self.store.has_index(self.category_field):
+            return self.store.counts(self.category_field)
+        counts = {}
+        for record in self.store.all():
+            value = record.get(self.category_field)
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+    def insert_many(self, records):
+        missing = sum(1 for record in records if record.get('id') is None)
+        # 一次分配整块ID，分配的ID放在记录的第一个字段
+        record_ids = iter(self.store.allocate_ids(missing))
+        records = [dict(record) if record.get('id') is not None else _with_id(record, next(record_ids))
+                   for record in records]
+        return self.store.insert_many(records)
+
+    def update_many(self, changes_by_id):
+        return list(self.store.update_many(changes_by_id).values())
+
+    def delete_many(self, record_ids):
+        return self.store.delete_many(record_ids)
+
+
+def create_file_engine(path, engine_type='indexed', default=None, index_fields=('category_id',), full_text=False):
+    """创建文件系统存储引擎
+
+    Args:
+        path: JSON数据文件路径
+        engine_type: 'indexed'（默认，快照 + 日志 + 索引）、'json'（整文件读写）
+            或 'sqlite'（标准库sqlite3，数据保存在同目录的 metadata.sqlite3 中，表名取JSON文件名）
+        default: 数据文件不存在时的初始记录
+        index_fields: indexed/sqlite 引擎需要建立索引的字段
+        full_text: sqlite 引擎是否建立 FTS5 全文索引（其他引擎的 search() 逐条匹配）
+    """
+    if engine_type == 'json':
+        return JsonFileEngine(path, default=default)
+    if engine_type == 'sqlite':
+        from .sqlite_engine import SQLiteEngine
+        db_path = os.path.join(os.path.dirname(os.path.abspath(path)), 'metadata.sqlite3')
+        table = os.path.splitext(os.path.basename(path))[0]
+        return SQLiteEngine(db_path, table, index_fields=index_fields, default=default, import_path=path,
+                            full_text=full_text)
+    return IndexedFileEngine(path, default=default, index_fields=index_fields)
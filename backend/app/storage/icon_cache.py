@@ -0,0 +1,225 @@
+# 热点图标的内存缓存
+import os
+import time
+import threading
+from collections import OrderedDict, namedtuple
+from .locking import atomic_write, file_lock
+
+# 缓存条目：文件内容及发送时需要的响应头，headers 为其余响应头 ((名称, 值), ...)，例如 Content-Encoding
+CachedIcon = namedtuple('CachedIcon', ['body', 'content_type', 'etag', 'last_modified', 'headers'])
+
+# 共享失效文件超过该大小时换成新的空文件
+_EPOCH_FILE_LIMIT = 1024 * 1024
+
+# 检查共享失效文件的最短间隔（秒）
+DEFAULT_SYNC_INTERVAL = float(os.getenv('ICON_CACHE_SYNC_INTERVAL', '1'))
+
+
+class IconCache:
+    """按文件路径（和协商的内容编码）缓存小图标内容的LRU缓存，总大小以字节为上限
+
+    命中时直接用内存中的内容和响应头发送，不访问文件系统（没有 stat/open/read），
+    因此文件被删除、重命名或移动时必须调用 invalidate()/invalidate_tree() 主动失效。
+    失效操作会使进行中的读取结果作废，避免读取与移动交错时把旧路径重新放入缓存。
+
+    缓存在每个进程内独立保存。多个工作进程时需调用 share() 指定共享的失效文件：
+    每次失效向该文件追加一个字节；命中时最多每 sync_interval 秒 stat 一次该文件（未命中时总是检查），
+    发现其他进程做过失效时清空本进程的缓存。因此其他进程失效的文件最多还会被本进程提供 sync_interval 秒，
+    其余命中不产生系统调用。
+    """
+
+    def __init__(self, max_bytes=0, max_file_size=64 * 1024, sync_interval=None):
+        """初始化
+
+        Args:
+            max_bytes: 缓存内容的总字节数上限，为0时不缓存
+            max_file_size: 单个文件的字节数上限，更大的文件不缓存
+            sync_interval: 命中时检查共享失效文件的最短间隔（秒）
+        """
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.sync_interval = DEFAULT_SYNC_INTERVAL if sync_interval is None else sync_interval
+        self._next_sync = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.epoch_path = None
+        self._shared = None
+        self.hits = 0
+        self.misses = 0
+
+    def share(self, epoch_path):
+        """与共用同一文件的其他进程同步失效（多个工作进程时在启动时调用）
+
+        Args:
+            epoch_path: 共享的失效文件路径，通常位于数据目录中
+        """
+        self.epoch_path = os.path.abspath(epoch_path)
+        os.makedirs(os.path.dirname(self.epoch_path), exist_ok=True)
+        with self._lock:
+            self._shared = self._shared_signature()
+
+    def _shared_signature(self):
+        try:
+            stat = os.stat(self.epoch_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size)
+
+    def _sync(self, force=False):
+        """其他进程做过失效时清空本进程的缓存（不知道失效的是哪些文件）
+
+        Args:
+            force: 为False时距离上次检查不足 sync_interval 秒则不检查
+        """
+        if self.epoch_path is None:
+            return
+        now = time.monotonic()
+        if not force and now < self._next_sync:
+            return
+        self._next_sync = now + self.sync_interval
+        signature = self._shared_signature()
+        with self._lock:
+            if signature != self._shared:
+                self._shared = signature
+                self._epoch += 1
+                self._entries.clear()
+                self._size = 0
+
+    def _publish(self):
+        """通知其他进程本进程做了失效
+
+        追加和换成新文件都持有该文件的排他锁，换文件时不会丢失其他进程同时追加的失效。
+        """
+        if self.epoch_path is None or not self.enabled:
+            return
+        rotated = None
+        with file_lock(self.epoch_path).exclusive():
+            fd = os.open(self.epoch_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+            try:
+                os.write(fd, b'.')
+                stat = os.fstat(fd)
+            finally:
+                os.close(fd)
+            if stat.st_size > _EPOCH_FILE_LIMIT:
+                atomic_write(self.epoch_path, b'')
+                rotated = self._shared_signature()
+        with self._lock:
+            # 期间没有其他进程写入时记下新的状态，本进程的缓存不必清空
+            previous = self._shared or (stat.st_ino, 0)
+            if previous == (stat.st_ino, stat.st_size - 1):
+                self._shared = rotated or (stat.st_ino, stat.st_size)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def accepts(self, size):
+        """大小为 size 的文件是否可以缓存"""
+        return self.enabled and size <= min(self.max_file_size, self.max_bytes)
+
+    def get(self, path, encoding=None):
+        """获取缓存的图标，未命中或未启用时返回None
+
+        Args:
+            path: 文件路径
+            encoding: 根据 Accept-Encoding 协商出的内容编码，同一文件的不同编码分别缓存
+        """
+        if not self.enabled:
+            return None
+        self._sync()
+        key = (os.path.abspath(path), encoding)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def load(self, path, size, content_type, etag, last_modified, encoding=None, headers=(), source=None):
+        """读取文件内容并放入缓存
+
+        Args:
+            path: 文件路径
+            size: 实际读取的文件的大小
+            content_type: Content-Type 响应头
+            etag: 强ETag，没有时为None
+            last_modified: Last-Modified 时间戳
+            encoding: 协商出的内容编码，与 get() 相同
+            headers: 其余响应头
+            source: 实际读取的文件（例如预压缩版本），默认为 path
+
+        Returns:
+            缓存条目；文件在读取期间发生变化时返回None（不缓存）
+        """
+        key = (os.path.abspath(path), encoding)
+        self._sync(force=True)
+        with self._lock:
+            epoch = self._epoch
+        with open(source or path, 'rb') as f:
+            body = f.read(size + 1)
+        if len(body) != size:
+            return None
+
+        entry = CachedIcon(body, content_type, etag, last_modified, tuple(headers))
+        self._sync(force=True)
+        with self._lock:
+            # 读取期间有文件被失效时丢弃本次结果
+            if self._epoch != epoch:
+                return entry
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous.body)
+            self._entries[key] = entry
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+        return entry
+
+    def invalidate(self, path):
+        """文件被删除、重命名、移动或覆盖后丢弃它的缓存"""
+        target = os.path.abspath(path)
+        self._discard(lambda name: name == target)
+
+    def invalidate_tree(self, directory):
+        """目录被重命名或删除后丢弃其中所有文件的缓存"""
+        prefix = os.path.join(os.path.abspath(directory), '')
+        self._discard(lambda name: name.startswith(prefix))
+
+    def _discard(self, match):
+        # 删除路径满足 match 的所有条目（包括各种编码）
+        with self._lock:
+            self._epoch += 1
+            for key in [key for key in self._entries if match(key[0])]:
+                self._size -= len(self._entries.pop(key).body)
+        self._publish()
+
+    def clear(self):
+        """清空全部缓存"""
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._size = 0
+        self._publish()
+
+    def stats(self):
+        """返回缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# 进程内共享的缓存实例，默认关闭：ICON_CACHE_MB 设置总大小（MB），ICON_CACHE_MAX_FILE_KB 设置单个文件上限
+icon_cache = IconCache(int(float(os.getenv('ICON_CACHE_MB', '0')) * 1024 * 1024),
+                       int(os.getenv('ICON_CACHE_MAX_FILE_KB', '64')) * 1024)
@@ -0,0 +1,507 @@
+# 追加日志存储引擎
+import os
+import json
+import bisect
+import threading
+from contextlib import contextmanager
+from .sequence import SequenceAllocator
+from .locking import file_lock
+from .snapshot import write_snapshot, load_snapshot, index_keys, LazyRecords
+
+# 日志条数超过该阈值时自动合并为新的快照
+DEFAULT_COMPACT_THRESHOLD = int(os.getenv('JOURNAL_COMPACT_THRESHOLD', '1000'))
+
+
+class JournalStore:
+    """快照 + 追加日志的记录存储
+
+    原有的JSON文件（例如 icons_metadata.json）作为快照，仍是合法的JSON数组，可用于导入/导出；
+    每次写入只向 <快照路径>.journal 追加一行紧凑的操作记录（insert/update/delete），
+    因此单次写入的I/O与记录总数无关。加载时先读取快照再重放日志，日志过长时自动合并。
+    合并时快照按每条记录一行写入并生成偏移表（见 snapshot.py），之后加载快照不需要解析全部记录。
+
+    记录是带有 'id' 字段的字典，内存中以 id -> 记录 的字典保存（同时充当主键索引）。
+    index_fields 中的字段另外维护 字段值 -> 有序id列表 的二级索引，供 find()/count() 使用；
+    值为列表的字段（例如 tags）按每个元素建立索引，可用 match() 做多个值的交集/并集查询。
+    all()/get()/find() 返回的是内存中的记录本身，调用方不应直接修改，而应通过 update() 写入。
+
+    多进程（例如多个gunicorn worker）共享同一份数据时，读操作持有共享文件锁，
+    写操作持有排他文件锁，并在写入前先重放其他进程追加的日志，不会丢失更新。
+    """
+
+    def __init__(self, path, default=None, compact_threshold=None, fsync=True, index_fields=None):
+        """初始化
+
+        Args:
+            path: 快照JSON文件路径
+            default: 快照和日志都不存在时的初始记录列表
+            compact_threshold: 自动合并的日志条数阈值
+            fsync: 每次追加后是否调用fsync，保证断电后日志不丢失
+            index_fields: 需要建立二级索引的字段，例如 ('category_id',)
+        """
+        self.path = os.path.abspath(path)
+        self.journal_path = self.path + '.journal'
+        self.default = default or []
+        self.compact_threshold = compact_threshold or DEFAULT_COMPACT_THRESHOLD
+        self.fsync = fsync
+
+        self._lock = threading.RLock()
+        self._file_lock = file_lock(self.path)
+        self._records = {}
+        self._ids = []
+        self._indexes = {field: {} for field in (index_fields or ())}
+        self._max_id = 0
+        self._sequence = SequenceAllocator(self.path + '.seq')
+        self._snapshot_signature = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._loaded = False
+
+    # ---- 加载与重放 ----
+
+    @staticmethod
+    def _signature(path):
+        """获取文件签名，文件不存在时返回None"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _load_snapshot(self):
+        """读取快照文件，重建内存中的记录
+
+        快照带有有效的偏移表时只加载偏移表和索引，记录在被访问时才逐条解码；
+        否则（旧格式或手工修改过的快照）整体解析。
+        """
+        self._snapshot_signature = self._signature(self.path)
+        self._journal_offset = 0
+        self._journal_entries = 0
+
+        lazy = load_snapshot(self.path) if self._snapshot_signature is not None else None
+        if lazy is not None:
+            self._records, indexes, max_id = lazy
+            self._ids = sorted(self._records)
+            self._track_id(max_id)
+            self._rebuild_indexes(indexes)
+            return
+
+        if self._snapshot_signature is None:
+            records = [dict(record) for record in self.default]
+        else:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    records = json.load(f) or []
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"加载快照{self.path}失败: {e}")
+                records = []
+
+        self._records = {}
+        for record in records:
+            if isinstance(record, dict) and 'id' in record:
+                self._records[record['id']] = record
+                self._track_id(record['id'])
+        self._ids = sorted(self._records)
+        self._rebuild_indexes()
+
+    # ---- 二级索引 ----
+
+    def _rebuild_indexes(self, prebuilt=None):
+        """根据当前记录重建全部二级索引
+
+        Args:
+            prebuilt: 偏移表中已有的索引，这些字段不需要解码记录
+        """
+        for field in self._indexes:
+            if prebuilt and field in prebuilt:
+                self._indexes[field] = prebuilt[field]
+                continue
+            index = self._indexes[field] = {}
+            for record_id in sorted(self._records):
+                for key in index_keys(self._records[record_id].get(field)):
+                    index.setdefault(key, []).append(record_id)
+
+    def _index_add(self, record_id, record):
+        for field, index in self._indexes.items():
+            for key in index_keys(record.get(field)):
+                bisect.insort(index.setdefault(key, []), record_id)
+
+    def _index_remove(self, record_id, record):
+        for field, index in self._indexes.items():
+            for key in index_keys(record.get(field)):
+                ids = index.get(key)
+                if not ids:
+                    continue
+                position = bisect.bisect_left(ids, record_id)
+                if position < len(ids) and ids[position] == record_id:
+                    del ids[position]
+                if not ids:
+                    del index[key]
+
+    def _track_id(self, record_id):
+        """记录见过的最大ID，分配新ID时不会低于它"""
+        if isinstance(record_id, int) and record_id > self._max_id:
+            self._max_id = record_id
+
+    def _apply(self, entry):
+        """将一条日志应用到内存记录和索引上（所有操作都是幂等的）"""
+        op = entry.get('op')
+        record_id = entry.get('id')
+        if op == 'insert':
+            old_record = self._records.get(record_id)
+            if old_record is not None:
+                self._index_remove(record_id, old_record)
+            else:
+                bisect.insort(self._ids, record_id)
+            self._records[record_id] = entry['data']
+            self._index_add(record_id, entry['data'])
+            self._track_id(record_id)
+        elif op == 'update':
+            record = self._records.get(record_id)
+            if record is not None:
+                changes = entry['data']
+                reindex = any(field in changes for field in self._indexes)
+                if reindex:
+                    self._index_remove(record_id, record)
+                record.update(changes)
+                if reindex:
+                    self._index_add(record_id, record)
+        elif op == 'delete':
+            record = self._records.pop(record_id, None)
+            if record is not None:
+                self._index_remove(record_id, record)
+                position = bisect.bisect_left(self._ids, record_id)
+                if position < len(self._ids) and self._ids[position] == record_id:
+                    del self._ids[position]
+
+    def _replay(self):
+        """从上次读取的位置继续重放日志"""
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        # 只处理完整的行，末尾未写完的行留到下次再读
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError) as e:
+                print(f"跳过损坏的日志记录: {e}")
+                continue
+            self._journal_entries += 1
+        self._journal_offset += end
+
+    def _refresh(self):
+        """确保内存状态与磁盘一致
+
+        快照被替换（其他进程合并了日志或导入了新文件）时整体重新加载，
+        否则只重放新增的日志。
+        """
+        snapshot_signature = self._signature(self.path)
+        journal_signature = self._signature(self.journal_path)
+        journal_size = journal_signature[1] if journal_signature else 0
+
+        if (not self._loaded or snapshot_signature != self._snapshot_signature
+                or journal_size < self._journal_offset):
+            self._load_snapshot()
+            self._loaded = True
+        if journal_size > self._journal_offset:
+            self._replay()
+
+    # ---- 写入 ----
+
+    @contextmanager
+    def exclusive(self):
+        """持有写锁执行一组读写操作（例如先查找再插入），锁内的读写方法可以重入"""
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            yield
+
+    def _append(self, entries):
+        """追加日志并应用到内存记录"""
+        lines = ''.join(
+            json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=str) + '\n'
+            for entry in entries
+        ).encode('utf-8')
+
+        directory = os.path.dirname(self.journal_path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(self.journal_path, 'ab+') as f:
+            # 上次写入中断留下的半行单独成行，重放时会被跳过，不影响新记录
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    lines = b'\n' + lines
+            f.write(lines)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            self._journal_offset = f.tell()
+
+        for entry in entries:
+            # 经过一次序列化，保证内存中的数据与重放结果一致
+            self._apply(json.loads(json.dumps(entry, default=str)))
+        self._journal_entries += len(entries)
+
+        if self._journal_entries >= self.compact_threshold:
+            self.compact()
+
+    def allocate_ids(self, count=1):
+        """分配一段新的记录ID（持久化、单调递增，不会复用已删除记录的ID）
+
+        Returns:
+            range对象，包含分配到的ID
+        """
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            return self._sequence.allocate(count, minimum=self._max_id + 1)
+
+    def next_id(self):
+        """分配一个新的记录ID"""
+        return self.allocate_ids(1)[0]
+
+    def insert(self, record):
+        """插入（或覆盖）一条记录"""
+        return self.insert_many([record])[0]
+
+    def insert_many(self, records):
+        """批量插入（或覆盖）记录，所有操作只追加一次日志
+
+        Returns:
+            插入后的记录列表
+        """
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            if records:
+                self._append([{'op': 'insert', 'id': record['id'], 'data': record} for record in records])
+            return [self._records.get(record['id']) for record in records]
+
+    def update(self, record_id, changes):
+        """更新记录的部分字段
+
+        Returns:
+            更新后的记录，记录不存在时返回None
+        """
+        return self.update_many({record_id: changes}).get(record_id)
+
+    def update_many(self, changes_by_id):
+        """批量更新记录的部分字段，不存在的记录会被忽略
+
+        Args:
+            changes_by_id: {记录ID: 要更新的字段} 字典
+
+        Returns:
+            {记录ID: 更新后的记录} 字典
+        """
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            entries = [
+                {'op': 'update', 'id': record_id, 'data': changes}
+                for record_id, changes in changes_by_id.items()
+                if record_id in self._records
+            ]
+            if entries:
+                self._append(entries)
+            return {entry['id']: self._records.get(entry['id']) for entry in entries}
+
+    def delete(self, record_id):
+        """删除记录
+
+        Returns:
+            被删除的记录，记录不存在时返回None
+        """
+        deleted = self.delete_many([record_id])
+        return deleted[0] if deleted else None
+
+    def delete_many(self, record_ids):
+        """批量删除记录，不存在的记录会被忽略
+
+        Returns:
+            被删除的记录列表
+        """
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            records = []
+            for record_id in dict.fromkeys(record_ids):
+                record = self._records.get(record_id)
+                if record is not None:
+                    records.append(record)
+            if records:
+                self._append([{'op': 'delete', 'id': record['id']} for record in records])
+            return records
+
+    def compact(self):
+        """把当前状态写成新的快照并清空日志
+
+        快照先写入临时文件再原子替换；替换后、清空日志前若进程崩溃，
+        由于所有日志操作都是幂等的，重放旧日志也不会产生错误结果。
+        """
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            write_snapshot(self.path, list(self._records.values()), tuple(self._indexes))
+            with open(self.journal_path, 'wb'):
+                pass
+
+            self._snapshot_signature = self._signature(self.path)
+            self._journal_offset = 0
+            self._journal_entries = 0
+
+    # ---- 读取 ----
+
+    def all(self):
+        """获取全部记录（按插入顺序）"""
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            return list(self._records.values())
+
+    def scan(self):
+        """按id升序逐条返回全部记录，快照中未解码的记录不会因此常驻内存
+
+        遍历期间持有读锁，调用方应一次遍历完，不要在遍历中写入。
+        """
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            if isinstance(self._records, LazyRecords):
+                yield from self._records.scan(list(self._ids))
+            else:
+                for record_id in list(self._ids):
+                    record = self._records.get(record_id)
+                    if record is not None:
+                        yield record
+
+    def get(self, record_id):
+        """按主键获取单条记录，记录不存在时返回None
+
+        内存中的记录以 id 为键保存在字典中，写入和重放日志时同步维护，
+        因此查找耗时与记录总数无关。
+        """
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            return self._records.get(record_id)
+
+    def _lookup(self, record_ids):
+        """按主键取出多条记录，快照中未解码的记录一次批量解码"""
+        if isinstance(self._records, LazyRecords):
+            self._records.prefetch(record_ids)
+        return [self._records[record_id] for record_id in record_ids if record_id in self._records]
+
+    def get_many(self, record_ids):
+        """按主键批量获取记录（保持传入顺序，忽略不存在的记录）"""
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            return self._lookup(list(record_ids))
+
+    def page(self, limit, after=None, field=None, value=None):
+        """按id升序分页读取记录
+
+        Args:
+            limit: 最多返回的记录数
+            after: 只返回id大于该值的记录
+            field/value: 可选的二级索引筛选条件
+
+        Returns:
+            记录列表
+        """
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            ids = self._indexes[field].get(value, []) if field is not None else self._ids
+            start = bisect.bisect_right(ids, after) if after is not None else 0
+            return self._lookup(ids[start:start + limit])
+
+    def has_index(self, field):
+        """字段是否已建立二级索引"""
+        return field in self._indexes
+
+    def add_index(self, field):
+        """为字段建立二级索引（已存在时不做处理）"""
+        with self._lock:
+            if field not in self._indexes:
+                self._indexes[field] = {}
+                self._rebuild_indexes()
+
+    def find(self, field, value):
+        """通过二级索引获取字段等于指定值的记录（按id排序）"""
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            return self._lookup(self._indexes[field].get(value, ()))
+
+    def match(self, field, values, match='all'):
+        """通过二级索引获取字段匹配多个值的记录ID（升序）
+
+        Args:
+            field: 已建立索引的字段，通常是列表字段（例如 tags）
+            values: 要匹配的值
+            match: 'all' 返回包含全部值的记录（各id列表求交集），'any' 返回包含任一值的记录（求并集）
+
+        Returns:
+            有序的记录ID列表
+        """
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            index = self._indexes[field]
+            postings = [index.get(value, ()) for value in dict.fromkeys(values)]
+            if not postings:
+                return []
+            if match == 'any':
+                return sorted(set().union(*postings))
+            # 从最短的id列表开始求交集，结果不会超过它的长度
+            postings.sort(key=len)
+            ids = set(postings[0])
+            for posting in postings[1:]:
+                if not ids:
+                    break
+                ids.intersection_update(posting)
+            return sorted(ids)
+
+    def count(self, field, value):
+        """通过二级索引统计字段等于指定值的记录数"""
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            return len(self._indexes[field].get(value, ()))
+
+    def counts(self, field):
+        """通过二级索引统计字段每个取值的记录数"""
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            return {value: len(ids) for value, ids in self._indexes[field].items()}
+
+    def __len__(self):
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            return len(self._records)
+
+    def generation(self):
+        """返回当前数据版本的标识，任何进程写入（包括合并日志）后都会改变"""
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            return (self._snapshot_signature, self._journal_offset)
+
+
+# 按快照路径共享的存储实例，保证同一进程内的所有调用方看到相同的数据
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(path, default=None, index_fields=()):
+    """获取指定路径的存储实例（同一路径只创建一次）
+
+    Args:
+        path: 快照JSON文件路径
+        default: 快照和日志都不存在时的初始记录列表
+        index_fields: 需要的二级索引字段，实例已存在时会补建缺少的索引
+    """
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = JournalStore(key, default=default, index_fields=index_fields)
+        for field in index_fields:
+            store.add_index(field)
+        return store
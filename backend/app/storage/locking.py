@@ -0,0 +1,144 @@
+# 文件锁与原子写入
+import os
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 下没有 fcntl，只能保证同一进程内的线程互斥
+    fcntl = None
+
+
+class FileLock:
+    """基于 fcntl.flock 的进程间读写锁
+
+    锁加在独立的 <路径>.lock 文件上，不会因为数据文件被原子替换而失效。
+    每个线程的最外层加锁各自打开锁文件并 flock，因此同一进程内的线程之间也是读写锁：
+    共享锁之间互不阻塞，排他锁与其他任何锁互斥。
+    同一线程可以重入；持有共享锁时不能再申请排他锁。
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path) + '.lock'
+        # 每个线程的加锁状态：重入深度、是否为共享锁、打开的锁文件
+        self._local = threading.local()
+        # 没有 fcntl 时用于线程间互斥（共享锁也互斥）
+        self._thread_lock = threading.RLock() if fcntl is None else None
+
+    @contextmanager
+    def acquire(self, shared=False):
+        """获取锁
+
+        Args:
+            shared: True 为共享锁（读），False 为排他锁（写）
+        """
+        state = self._local
+        depth = getattr(state, 'depth', 0)
+        if depth == 0:
+            directory = os.path.dirname(self.path)
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            if self._thread_lock is not None:
+                self._thread_lock.acquire()
+            lock_file = None
+            try:
+                lock_file = open(self.path, 'a+b')
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            except BaseException:
+                if lock_file is not None:
+                    lock_file.close()
+                if self._thread_lock is not None:
+                    self._thread_lock.release()
+                raise
+            state.file = lock_file
+            state.shared = shared
+        elif state.shared and not shared:
+            raise RuntimeError(f"持有共享锁时不能申请排他锁: {self.path}")
+
+        state.depth = depth + 1
+        try:
+            yield
+        finally:
+            state.depth -= 1
+            if state.depth == 0:
+                if fcntl:
+                    fcntl.flock(state.file.fileno(), fcntl.LOCK_UN)
+                state.file.close()
+                state.file = None
+                if self._thread_lock is not None:
+                    self._thread_lock.release()
+
+    def shared(self):
+        """获取共享锁（读）"""
+        return self.acquire(shared=True)
+
+    def exclusive(self):
+        """获取排他锁（写）"""
+        return self.acquire(shared=False)
+
+
+# 按路径共享的锁实例，保证同一进程内对同一文件的加锁可以重入
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def file_lock(path):
+    """获取指定数据文件对应的锁实例"""
+    key = os.path.abspath(path)
+    with _locks_lock:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = FileLock(key)
+        return lock
+
+
+# 进程的 umask（只能通过设置来读取，因此在导入时读取一次，避免运行中临时修改影响其他线程）
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _file_mode(path):
+    """目标文件已存在时返回其权限位，否则返回 open() 新建文件时的默认权限（0666 去掉 umask）"""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def atomic_write(path, content):
+    """原子地写入文件内容
+
+    先写入同目录下的临时文件并 fsync，再用 os.replace 替换目标文件，
+    读取方要么看到旧文件、要么看到完整的新文件，不会读到写了一半的内容。
+
+    Args:
+        path: 目标文件路径
+        content: 要写入的内容（bytes）
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            # mkstemp 创建的文件权限为 0600，替换后会沿用；改为与原文件相同，新文件按 umask 取默认权限
+            if hasattr(os, 'fchmod'):
+                os.fchmod(f.fileno(), _file_mode(path))
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def atomic_write_json(path, data, **dump_kwargs):
+    """原子地保存JSON文件（参数与 json.dump 相同）"""
+    atomic_write(path, json.dumps(data, **dump_kwargs).encode('utf-8'))
@@ -0,0 +1,89 @@
+# JSON元数据缓存
+import os
+import json
+import threading
+from .locking import file_lock
+
+
+class MetadataCache:
+    """按路径缓存已解析的JSON元数据
+
+    以文件的 (mtime, size, inode) 作为签名，只有签名变化时才重新解析文件，
+    其余情况直接返回内存中的数据。返回的是缓存中的同一个对象，调用方若修改后
+    未能成功写回文件，应调用 invalidate() 丢弃该条目。
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _signature(path):
+        """获取文件签名，文件不存在时返回None"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def load(self, path, default=None):
+        """加载JSON文件，命中缓存时不再读取磁盘
+
+        Args:
+            path: JSON文件路径
+            default: 文件不存在或解析失败时的返回值
+
+        Returns:
+            解析后的数据或默认值
+
+        Raises:
+            json.JSONDecodeError, IOError: 解析或读取失败（由调用方决定如何处理）
+        """
+        key = os.path.abspath(path)
+        signature = self._signature(key)
+        if signature is None:
+            self.invalidate(key)
+            return default
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                return entry[1]
+
+        # 写入方持有排他锁，这里持有共享锁读取
+        with file_lock(key).shared():
+            with open(key, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+        with self._lock:
+            self.misses += 1
+            # 读取期间文件可能被替换，只有签名未变时才缓存
+            if self._signature(key) == signature:
+                self._entries[key] = (signature, data)
+        return data
+
+    def invalidate(self, path=None):
+        """丢弃指定路径的缓存，未指定路径时清空全部缓存"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(path), None)
+
+    def stats(self):
+        """返回缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# 进程内共享的缓存实例
+metadata_cache = MetadataCache()
@@ -0,0 +1,165 @@
+# 图标文件的预压缩版本（gzip/brotli）
+import os
+import gzip
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.http import parse_accept_header
+from .locking import atomic_write
+from .icon_cache import icon_cache
+
+# brotli 为可选依赖，未安装时只生成 gzip 版本
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 预压缩版本的目录（位于图标存储目录下）
+PRECOMPRESS_DIR = '.compressed'
+
+# 需要预压缩的格式：SVG 是文本，ICO 通常包含未压缩的位图；PNG/JPEG/GIF/WEBP 本身已经压缩
+COMPRESSIBLE_EXTENSIONS = ('.svg', '.ico')
+
+# 可用的编码，按优先顺序排列：(Content-Encoding, 文件后缀, 压缩函数)
+ENCODINGS = [('gzip', '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+if brotli is not None:
+    ENCODINGS.insert(0, ('br', '.br', lambda data: brotli.compress(data, quality=11)))
+_SUFFIXES = {encoding: suffix for encoding, suffix, _ in ENCODINGS}
+
+# 压缩后至少要比原文件小这个比例才保存，否则直接发送原文件
+_MIN_SAVING = 0.1
+
+
+def is_compressible(path):
+    """文件是否属于需要预压缩的格式"""
+    return os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+
+def negotiate_encoding(environ, path):
+    """根据请求的 Accept-Encoding 选择内容编码，只解析请求头，不访问文件系统
+
+    Returns:
+        'br'、'gzip'，文件不需要压缩或客户端不接受任何可用编码时返回None
+    """
+    if not is_compressible(path):
+        return None
+    accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+    for encoding, _, _ in ENCODINGS:
+        if accept.quality(encoding) > 0:
+            return encoding
+    return None
+
+
+class PrecompressedStore:
+    """保存图标文件的预压缩版本，每个文件内容只压缩一次
+
+    压缩版本按内容的SHA-256（即图标文件的强ETag）保存在 <图标目录>/.compressed/<前两位>/<摘要><后缀>，
+    与原文件放在同一存储目录中；按内容而不是文件名命名，因此重命名、在分类间移动都无需处理，
+    内容相同的图标共用同一组压缩版本。压缩在后台线程中进行：上传后安排压缩，
+    发送时发现还没有压缩版本的文件（例如启用本功能之前上传的）也会被安排，本次先发送原文件。
+    """
+
+    def __init__(self, root, enabled=True):
+        """初始化
+
+        Args:
+            root: 图标存储目录
+            enabled: 为False时不生成也不使用压缩版本
+        """
+        self.enabled = enabled
+        self.root = os.path.abspath(root)
+        self.directory = os.path.join(self.root, PRECOMPRESS_DIR)
+        # 摘要 -> 已生成的编码集合，避免每次发送都检查文件是否存在
+        self._available = {}
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='precompress')
+
+    def negotiate(self, environ, path):
+        """为请求选择内容编码，未启用时返回None，见 negotiate_encoding()"""
+        return negotiate_encoding(environ, path) if self.enabled else None
+
+    def variant_path(self, digest, encoding):
+        """某个编码的压缩版本的文件路径"""
+        return os.path.join(self.directory, digest[:2], digest + _SUFFIXES[encoding])
+
+    def build(self, path, digest):
+        """生成文件的全部压缩版本，压缩效果不明显的编码不保存
+
+        Args:
+            path: 图标文件路径
+            digest: 文件内容的SHA-256
+
+        Returns:
+            已生成的编码集合
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        available = set()
+        for encoding, _, compress in ENCODINGS:
+            variant = self.variant_path(digest, encoding)
+            if not os.path.exists(variant):
+                compressed = compress(data)
+                if len(compressed) > len(data) * (1 - _MIN_SAVING):
+                    continue
+                atomic_write(variant, compressed)
+            available.add(encoding)
+        with self._lock:
+            self._available[digest] = frozenset(available)
+        return available
+
+    def schedule(self, path, digest):
+        """安排在后台生成压缩版本，同一内容只安排一次"""
+        if not self.enabled or not is_compressible(path):
+            return
+        with self._lock:
+            if digest in self._available or digest in self._scheduled:
+                return
+            self._scheduled.add(digest)
+        self._executor.submit(self._build_scheduled, path, digest)
+
+    def _build_scheduled(self, path, digest):
+        try:
+            if self.build(path, digest):
+                # 生成之前缓存的是原文件，丢弃后下次请求改为缓存压缩版本
+                icon_cache.invalidate(path)
+        except Exception as e:
+            print(f"生成压缩版本失败 {path}: {e}")
+        finally:
+            with self._lock:
+                self._scheduled.discard(digest)
+
+    def lookup(self, path, digest, encoding):
+        """获取指定编码的压缩版本路径
+
+        Args:
+            path: 图标文件路径，没有压缩版本时用于安排生成
+            digest: 文件内容的SHA-256
+            encoding: negotiate_encoding() 选出的编码
+
+        Returns:
+            压缩版本的路径，不存在时返回None
+        """
+        if not self.enabled or encoding is None:
+            return None
+        with self._lock:
+            available = self._available.get(digest)
+        if available is None:
+            # 本进程还没见过该内容：检查已有的压缩版本，一个都没有时安排生成
+            available = frozenset(name for name, _, _ in ENCODINGS
+                                  if os.path.exists(self.variant_path(digest, name)))
+            if available:
+                with self._lock:
+                    self._available[digest] = available
+            else:
+                self.schedule(path, digest)
+        return self.variant_path(digest, encoding) if encoding in available else None
+
+    def discard(self, digest):
+        """删除某个内容的全部压缩版本（最后一个使用该内容的图标被删除后调用）"""
+        with self._lock:
+            self._available.pop(digest, None)
+        for encoding, _, _ in ENCODINGS:
+            try:
+                os.remove(self.variant_path(digest, encoding))
+            except FileNotFoundError:
+                pass
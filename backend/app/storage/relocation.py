@@ -0,0 +1,394 @@
+# 图标文件的后台批量迁移
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from datetime import datetime
+from .icon_cache import icon_cache
+from .locking import atomic_write_json
+
+# 每批移动的文件数，每批结束后更新进度并回调
+DEFAULT_BATCH_SIZE = int(os.getenv('RELOCATION_BATCH_SIZE', '200'))
+
+# 状态为 running 的任务超过这么多秒没有更新进度，视为执行它的进程已经停止
+STALE_SECONDS = int(os.getenv('RELOCATION_STALE_SECONDS', '600'))
+
+# 保留的已结束任务数，更早的任务状态会被丢弃
+_KEEP_FINISHED = 100
+
+_jobs = {}
+# 目标路径 -> 源路径：本进程的任务中尚未移动的文件
+_pending = {}
+# 其他进程的任务保存的移动列表：文件路径 -> (修改时间, {目标路径: 源路径})
+_persisted = {}
+_lock = threading.Lock()
+
+
+def unique_filename(directory, filename, taken):
+    """在目标目录中为文件选择不冲突的文件名
+
+    Args:
+        directory: 目标目录
+        filename: 原文件名
+        taken: 已被占用（包括本次计划中已分配）的文件名集合，选中的文件名会加入其中
+
+    Returns:
+        文件名，与原文件名冲突时追加 _1、_2 ...
+    """
+    candidate = filename
+    base, ext = os.path.splitext(filename)
+    number = 1
+    while candidate in taken or os.path.exists(os.path.join(directory, candidate)):
+        candidate = f"{base}_{number}{ext}"
+        number += 1
+    taken.add(candidate)
+    return candidate
+
+
+def plan_relocation(entries, target_dir):
+    """为一组文件生成移动到目标目录的计划
+
+    Args:
+        entries: (记录ID, 源文件路径) 的可迭代对象，已在目标目录中的文件会被跳过
+        target_dir: 目标目录
+
+    Returns:
+        (移动列表 [(记录ID, 源路径, 目标路径)], 需要改名的记录 {记录ID: 新文件名})
+    """
+    try:
+        taken = set(os.listdir(target_dir))
+    except OSError:
+        taken = set()
+    moves, renamed = [], {}
+    for record_id, source in entries:
+        if os.path.abspath(os.path.dirname(source)) == os.path.abspath(target_dir):
+            continue
+        filename = os.path.basename(source)
+        new_filename = unique_filename(target_dir, filename, taken)
+        if new_filename != filename:
+            renamed[record_id] = new_filename
+        moves.append((record_id, source, os.path.join(target_dir, new_filename)))
+    return moves, renamed
+
+
+def _status_path(status_dir, job_id):
+    return os.path.join(status_dir, f'{job_id}.json')
+
+
+def _moves_path(status_dir, job_id):
+    return os.path.join(status_dir, f'{job_id}.moves.json')
+
+
+def _persisted_sources(status_dir):
+    """读取其他进程的任务保存的移动列表（按文件修改时间缓存），返回 {目标路径: 源路径}"""
+    try:
+        names = [name for name in os.listdir(status_dir) if name.endswith('.moves.json')]
+    except OSError:
+        return {}
+    sources = {}
+    for name in names:
+        path = os.path.join(status_dir, name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        with _lock:
+            cached = _persisted.get(path)
+        if cached is None or cached[0] != mtime:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    moves = json.load(f)['moves']
+            except (OSError, ValueError, KeyError):
+                continue
+            cached = (mtime, {target: source for _, source, target in moves})
+            with _lock:
+                _persisted[path] = cached
+        sources.update(cached[1])
+    return sources
+
+
+def pending_source(target_path, status_dir=None):
+    """目标路径对应的文件尚未移动时返回其当前（源）路径，否则返回None
+
+    先查本进程的任务；提供 status_dir 时再查其他进程（或已中断）的任务保存的移动列表，
+    因此元数据已经指向新位置、文件还在原位置时任何工作进程都能找到文件。
+    """
+    target = os.path.abspath(target_path)
+    with _lock:
+        source = _pending.get(target)
+    if source is None and status_dir:
+        source = _persisted_sources(status_dir).get(target)
+    return source if source and os.path.isfile(source) else None
+
+
+def _read_status(status_dir, job_id):
+    path = _status_path(status_dir, job_id)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            status = json.load(f)
+        updated = os.stat(path).st_mtime
+    except (OSError, ValueError):
+        return None
+    pid = status.pop('pid', None)
+    if status.get('status') == 'running' and (not _process_alive(pid) or time.time() - updated > STALE_SECONDS):
+        status['status'] = 'interrupted'
+    return status
+
+
+def _process_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (OSError, ValueError):
+        # 无权发送信号等情况，视为仍在运行
+        return True
+    return True
+
+
+def get_relocation(job_id, status_dir=None):
+    """获取迁移任务的进度，任务不存在时返回None
+
+    任务不在本进程中时从 status_dir 读取其他进程保存的进度；状态为 running
+    但执行任务的进程已经不存在或长时间没有更新进度时，状态报告为 interrupted
+    （resume_relocations() 会继续执行这样的任务）。
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job:
+            return job.to_dict()
+    if not status_dir or not all(c in '0123456789abcdef' for c in job_id):
+        return None
+    status = _read_status(status_dir, job_id)
+    if status:
+        status.pop('offset', None)
+    return status
+
+
+def _prune_status_files(status_dir):
+    """只保留最近的 _KEEP_FINISHED 个任务状态文件，仍有移动列表的任务不删除"""
+    try:
+        names = [name for name in os.listdir(status_dir) if name.endswith('.json')]
+    except OSError:
+        return
+    unfinished = {name[:-len('.moves.json')] for name in names if name.endswith('.moves.json')}
+    statuses = [os.path.join(status_dir, name) for name in names
+                if not name.endswith('.moves.json') and name[:-len('.json')] not in unfinished]
+    if len(statuses) <= _KEEP_FINISHED:
+        return
+    statuses.sort(key=os.path.getmtime)
+    for path in statuses[:len(statuses) - _KEEP_FINISHED]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def start_relocation(moves, on_batch=None, batch_size=None, cleanup_dirs=(), status_dir=None):
+    """在后台线程中分批移动文件
+
+    调用方通常在启动任务之前就把元数据改为目标位置（数据库中一条 UPDATE 语句），
+    迁移期间用 pending_source() 从原位置提供尚未移动的文件。
+
+    Args:
+        moves: [(记录ID, 源路径, 目标路径)]
+        on_batch: 每批结束后的回调 on_batch(moved)，moved 为 {记录ID: 实际的目标路径}，
+            包含本批成功移动的文件（目标路径在移动时被占用会另选文件名）以及源文件已不存在的记录
+            （目标为计划的路径）；移动失败的文件不包含在内
+        batch_size: 每批移动的文件数
+        cleanup_dirs: 全部移动完成后尝试删除的目录（只删除空目录）
+        status_dir: 保存任务进度和移动列表的目录，提供时其他进程可以查询进度、找到尚未移动的文件，
+            执行任务的进程停止后可以用 resume_relocations() 继续
+
+    Returns:
+        任务进度字典（见 get_relocation）
+    """
+    job = RelocationJob(moves, on_batch, batch_size or DEFAULT_BATCH_SIZE, cleanup_dirs, status_dir)
+    if status_dir:
+        _prune_status_files(status_dir)
+    return job.start()
+
+
+def resume_relocations(status_dir, make_on_batch=None, batch_size=None):
+    """继续执行已中断的迁移任务（应用启动时调用）
+
+    多个工作进程同时调用时，每个任务只会被其中一个进程接管（通过改名认领移动列表）。
+
+    Args:
+        status_dir: start_relocation() 使用的状态目录
+        make_on_batch: 为任务创建 on_batch 回调的函数 make_on_batch(moves)
+        batch_size: 每批移动的文件数
+
+    Returns:
+        新启动的任务进度字典列表
+    """
+    try:
+        names = [name for name in os.listdir(status_dir) if name.endswith('.moves.json')]
+    except OSError:
+        return []
+    resumed = []
+    for name in names:
+        job_id = name[:-len('.moves.json')]
+        status = _read_status(status_dir, job_id)
+        if status is None or status.get('status') != 'interrupted':
+            continue
+        job_id_new = uuid.uuid4().hex
+        try:
+            # 改名是原子的，只有一个进程能认领
+            os.rename(_moves_path(status_dir, job_id), _moves_path(status_dir, job_id_new))
+            with open(_moves_path(status_dir, job_id_new), 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            continue
+        # 只继续尚未完成的批次
+        moves = [tuple(move) for move in saved.get('moves', [])][status.pop('offset', 0):]
+        job = RelocationJob(moves, make_on_batch(moves) if make_on_batch else None,
+                            batch_size or DEFAULT_BATCH_SIZE, saved.get('cleanup_dirs', ()), status_dir,
+                            job_id=job_id_new)
+        status.update(status='resumed', resumed_by=job.id)
+        try:
+            atomic_write_json(_status_path(status_dir, job_id), status)
+        except OSError as e:
+            print(f"保存迁移任务 {job_id} 的进度失败: {e}")
+        print(f"继续执行中断的文件迁移任务 {job_id}（新任务 {job.id}）")
+        resumed.append(job.start())
+    return resumed
+
+
+class RelocationJob:
+    """一次文件迁移任务，进度保存在进程内存中（提供 status_dir 时同时保存到文件）"""
+
+    def __init__(self, moves, on_batch, batch_size, cleanup_dirs, status_dir=None, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.moves = [(record_id, os.path.abspath(source), os.path.abspath(target))
+                      for record_id, source, target in moves]
+        self.on_batch = on_batch
+        self.batch_size = batch_size
+        self.cleanup_dirs = [os.path.abspath(directory) for directory in cleanup_dirs]
+        self.status_dir = status_dir
+        self.status = 'running'
+        self.moved = 0
+        self.missing = 0
+        self.failed = 0
+        # 已完成（包括回调）的移动数，任务中断后从这里继续
+        self.offset = 0
+        self.error = None
+        self.started_at = datetime.now().isoformat()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total': len(self.moves),
+            'moved': self.moved,
+            'missing': self.missing,
+            'failed': self.failed,
+            'error': self.error,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+    def start(self):
+        with _lock:
+            finished = [job_id for job_id, other in _jobs.items() if other.status != 'running']
+            for job_id in finished[:max(0, len(finished) - _KEEP_FINISHED)]:
+                del _jobs[job_id]
+            _jobs[self.id] = self
+            for _, source, target in self.moves:
+                _pending[target] = source
+        if self.status_dir and self.moves:
+            try:
+                atomic_write_json(_moves_path(self.status_dir, self.id),
+                                  {'moves': self.moves, 'cleanup_dirs': self.cleanup_dirs})
+            except OSError as e:
+                print(f"保存迁移任务 {self.id} 的移动列表失败: {e}")
+        self.save_status()
+        if self.moves:
+            threading.Thread(target=self.run, name=f'relocation-{self.id}', daemon=True).start()
+        else:
+            self.finish()
+        return self.to_dict()
+
+    def save_status(self):
+        """把进度写入 status_dir，供其他进程查询"""
+        if not self.status_dir:
+            return
+        with _lock:
+            status = self.to_dict()
+            status['offset'] = self.offset
+        status['pid'] = os.getpid()
+        try:
+            atomic_write_json(_status_path(self.status_dir, self.id), status)
+        except OSError as e:
+            print(f"保存迁移任务 {self.id} 的进度失败: {e}")
+
+    def _move(self, source, target):
+        """移动单个文件，返回实际的目标路径；源文件不存在时返回None"""
+        if not os.path.exists(source):
+            return None
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(target):
+            # 计划之后目标目录中出现了同名文件
+            target = os.path.join(directory, unique_filename(directory, os.path.basename(target), set()))
+        shutil.move(source, target)
+        icon_cache.invalidate(source)
+        return target
+
+    def run(self):
+        try:
+            for start in range(0, len(self.moves), self.batch_size):
+                moved = {}
+                for record_id, source, target in self.moves[start:start + self.batch_size]:
+                    try:
+                        actual = self._move(source, target)
+                    except OSError as e:
+                        print(f"移动文件 {source} 失败: {e}")
+                        with _lock:
+                            self.failed += 1
+                        continue
+                    finally:
+                        with _lock:
+                            _pending.pop(target, None)
+                    with _lock:
+                        if actual is None:
+                            self.missing += 1
+                        else:
+                            self.moved += 1
+                    moved[record_id] = actual or target
+                if moved and self.on_batch:
+                    self.on_batch(moved)
+                with _lock:
+                    self.offset = min(start + self.batch_size, len(self.moves))
+                self.save_status()
+            for directory in self.cleanup_dirs:
+                try:
+                    if os.path.isdir(directory) and not os.listdir(directory):
+                        os.rmdir(directory)
+                except OSError as e:
+                    print(f"删除目录 {directory} 失败: {e}")
+            self.finish()
+        except Exception as e:
+            print(f"文件迁移任务 {self.id} 失败: {e}")
+            self.finish(error=str(e))
+
+    def finish(self, error=None):
+        with _lock:
+            for _, _, target in self.moves:
+                _pending.pop(target, None)
+            self.status = 'failed' if error else 'done'
+            self.error = error
+            self.finished_at = datetime.now().isoformat()
+            keep_moves = error is not None or self.failed > 0
+        # 移动失败的文件仍在原位置，保留移动列表以便 pending_source() 继续找到它们
+        if self.status_dir and not keep_moves:
+            try:
+                os.remove(_moves_path(self.status_dir, self.id))
+            except FileNotFoundError:
+                pass
+        self.save_status()
@@ -0,0 +1,73 @@
+# 查询结果缓存
+import os
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    """按键缓存查询结果的LRU缓存
+
+    键中应包含相关存储引擎的 generation()：数据被修改后生成新的键，旧条目不会再被命中，
+    随后按最近最少使用的顺序被淘汰，因此不需要在写入时主动失效。
+    返回的是缓存中的同一个对象，调用方不应修改。
+    """
+
+    def __init__(self, max_entries=128):
+        """初始化
+
+        Args:
+            max_entries: 最多缓存的条目数，为0时不缓存
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        """获取缓存的结果，未命中时调用 compute() 计算并缓存
+
+        Args:
+            key: 可哈希的缓存键，例如 (端点, 筛选条件, 数据版本)
+            compute: 无参数的函数，返回要缓存的结果
+
+        Returns:
+            缓存或新计算的结果
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # 在锁外计算，慢查询不阻塞其他请求读取缓存
+        value = compute()
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        """清空全部缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """返回缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# 进程内共享的缓存实例，RESULT_CACHE_SIZE=0 时关闭
+result_cache = ResultCache(int(os.getenv('RESULT_CACHE_SIZE', '128')))
@@ -0,0 +1,137 @@
+# 全文搜索的公共部分
+import os
+import re
+import sqlite3
+
+# 参与搜索的字段及其权重（文件名最重要，其次是标签）
+SEARCH_WEIGHTS = {'filename': 10.0, 'tags': 5.0, 'description': 1.0}
+
+# 匹配的记录很多时，只在最新的这么多条匹配中按相关度排序，避免对全部匹配计算bm25
+# （文件名匹配的记录另外单独排序，见 fts_search_ids）
+SEARCH_RANK_WINDOW = int(os.getenv('SEARCH_RANK_WINDOW', '1000'))
+
+# FTS5 表的定义参数：unicode61 分词，为2~4个字符的前缀建立前缀索引
+FTS5_OPTIONS = "tokenize = 'unicode61', prefix = '2 3 4'"
+
+# 与 FTS5 unicode61 分词器一致：连续的字母/数字为一个词，其余字符（包括下划线）都是分隔符
+_TOKEN = re.compile(r'[^\W_]+')
+
+
+def search_terms(query):
+    """把用户输入拆分为小写的搜索词"""
+    return [term.lower() for term in _TOKEN.findall(query or '')]
+
+
+def fts_query(terms, column=None, prefix=True):
+    """生成 FTS5 MATCH 表达式：每个词按前缀匹配，多个词之间为AND
+
+    每个词都加引号，用户输入中的 AND/OR/NEAR 等不会被当作查询语法。
+
+    Args:
+        terms: search_terms() 的结果
+        column: 只在该列中匹配，默认匹配全部列
+        prefix: 为False时每个词需要与某个词完整相同
+    """
+    scope = f'{column} : ' if column else ''
+    star = '*' if prefix else ''
+    return ' AND '.join(f'{scope}"{term}"{star}' for term in terms)
+
+
+def _ranked_ids(execute, table, query, limit):
+    """按 bm25 排序 MATCH 表达式的匹配，匹配数超过 SEARCH_RANK_WINDOW 时只排序最新的匹配
+
+    先按 rowid 倒序找到第 SEARCH_RANK_WINDOW 条匹配，再只对 rowid 不小于它的匹配排序；
+    FTS5 可以直接按 rowid 范围读取倒排列表，耗时与匹配总数基本无关。
+
+    Returns:
+        (rowid 列表, 是否对全部匹配排序)
+    """
+    params = {'query': query, 'limit': limit, 'floor': -(2 ** 63)}
+    row = execute(f'SELECT rowid FROM "{table}" WHERE "{table}" MATCH :query ORDER BY rowid DESC '
+                  f'LIMIT 1 OFFSET :offset', dict(params, offset=SEARCH_RANK_WINDOW - 1)).fetchone()
+    if row is not None:
+        params['floor'] = row[0]
+    weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS.values())
+    rows = execute(f'SELECT rowid FROM "{table}" WHERE "{table}" MATCH :query AND rowid >= :floor '
+                   f'ORDER BY bm25("{table}", {weights}), rowid LIMIT :limit', params)
+    return [row[0] for row in rows], row is None
+
+
+def fts_search_ids(execute, table, terms, limit):
+    """在 FTS5 表中搜索，返回按相关度排序的 rowid 列表
+
+    匹配数超过 SEARCH_RANK_WINDOW 时（例如很短或很常见的词）只对最新的匹配计算bm25（见 _ranked_ids），
+    较早的记录可能排不进结果，因此这时先列出文件名匹配的记录：文件名中完整包含每个词的记录、
+    再是文件名中以每个词为前缀的记录（每组同样按 bm25 排序），不足 limit 条时再用最新匹配的排序结果补足。
+    这样搜索 arrow 时较早的 arrow.svg 仍然排在前面。
+
+    Args:
+        execute: 执行SQL的函数 execute(sql, params)，params 为命名参数字典
+        table: FTS5 表名，rowid 即记录ID
+        terms: search_terms() 的结果
+        limit: 最多返回的数量
+    """
+    if not terms:
+        return []
+    ranked, complete = _ranked_ids(execute, table, fts_query(terms), limit)
+    if complete:
+        return ranked
+    name_field = next(iter(SEARCH_WEIGHTS))
+    ids = {}
+    for query in (fts_query(terms, name_field, prefix=False), fts_query(terms, name_field)):
+        ids.update(dict.fromkeys(_ranked_ids(execute, table, query, limit)[0]))
+        if len(ids) >= limit:
+            return list(ids)[:limit]
+    ids.update(dict.fromkeys(ranked))
+    return list(ids)[:limit]
+
+
+def search_text(value):
+    """把字段值转换为用于分词的文本，列表（例如 tags）以空格连接"""
+    if isinstance(value, list):
+        return ' '.join(str(item) for item in value)
+    return '' if value is None else str(value)
+
+
+def fts5_available(connection):
+    """SQLite 是否编译了 FTS5 扩展"""
+    try:
+        connection.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+        connection.execute('DROP TABLE temp.fts5_probe')
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def scan_search(records, terms, limit, weights=None):
+    """不依赖索引的搜索：逐条记录分词并按前缀匹配
+
+    每个搜索词都要以某个字段中的某个词为前缀，得分为匹配到的字段权重之和，
+    结果按得分从高到低、ID从小到大排序。
+
+    Args:
+        records: 记录的可迭代对象
+        terms: search_terms() 的结果
+        limit: 最多返回的记录数
+        weights: 字段 -> 权重，默认使用 SEARCH_WEIGHTS
+
+    Returns:
+        记录列表
+    """
+    weights = weights or SEARCH_WEIGHTS
+    if not terms:
+        return []
+    scored = []
+    for record in records:
+        tokens = {field: search_terms(search_text(record.get(field))) for field in weights}
+        score = 0.0
+        for term in terms:
+            matched = [weights[field] for field, field_tokens in tokens.items()
+                       if any(token.startswith(term) for token in field_tokens)]
+            if not matched:
+                break
+            score += sum(matched)
+        else:
+            scored.append((-score, record['id'], record))
+    scored.sort(key=lambda item: item[:2])
+    return [record for _, _, record in scored[:limit]]
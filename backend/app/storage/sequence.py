@@ -0,0 +1,56 @@
+# 持久化ID分配器
+import os
+import threading
+from .locking import file_lock, atomic_write
+
+
+class SequenceAllocator:
+    """单调递增的ID分配器
+
+    下一个可用ID保存在独立的小文件中，每次分配都先把新的高水位写入磁盘（临时文件 + 原子替换），
+    再把ID交给调用方。进程崩溃最多留下未使用的空号，已分配过的ID永远不会被重新使用，
+    即使对应的记录已被删除。分配过程持有排他文件锁，多个进程同时分配也不会拿到相同的ID。
+    """
+
+    def __init__(self, path):
+        """初始化
+
+        Args:
+            path: 保存下一个可用ID的文件路径
+        """
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        self._file_lock = file_lock(self.path)
+
+    def _read(self):
+        """读取下一个可用ID，文件不存在或损坏时返回1"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return max(int(f.read().strip() or 1), 1)
+        except (IOError, ValueError):
+            return 1
+
+    def _write(self, next_id):
+        atomic_write(self.path, f"{next_id}\n".encode('utf-8'))
+
+    def allocate(self, count=1, minimum=1):
+        """分配一段连续的ID
+
+        Args:
+            count: 需要的ID数量，批量插入时一次分配整块
+            minimum: 分配的最小ID，用于跳过已导入数据中存在的ID
+
+        Returns:
+            range对象，包含分配到的ID
+        """
+        if count < 1:
+            return range(0)
+        with self._lock, self._file_lock.exclusive():
+            start = max(self._read(), minimum)
+            self._write(start + count)
+            return range(start, start + count)
+
+    def peek(self):
+        """查看下一个可用ID（不分配）"""
+        with self._lock, self._file_lock.shared():
+            return self._read()
@@ -0,0 +1,128 @@
+# 图标文件的HTTP发送
+import os
+import mimetypes
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import is_resource_modified
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+from .precompress import is_compressible
+
+# 常见图标格式的MIME类型，其余扩展名按标准库猜测
+ICON_MIMETYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.svg': 'image/svg+xml',
+    '.gif': 'image/gif',
+    '.ico': 'image/x-icon',
+    '.webp': 'image/webp',
+}
+
+
+def icon_mimetype(path):
+    """根据文件扩展名获取MIME类型，无法识别时返回 application/octet-stream"""
+    ext = os.path.splitext(path)[1].lower()
+    return ICON_MIMETYPES.get(ext) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def send_icon_file(environ, path, mimetype=None, response_class=Response, validators=None, cache_control=None,
+                   etag=None, cache=None, variants=None, encoding=None):
+    """流式发送图标文件
+
+    文件内容通过 wsgi.file_wrapper 发送（WSGI服务器支持时使用 sendfile），不读入内存；
+    Content-Length 和 Last-Modified 来自一次 stat。支持 Range 请求（206/416）；
+    HEAD 请求以及 If-None-Match/If-Modified-Since 命中（304）时只 stat，不打开文件。
+    提供 variants 时，SVG/ICO 在有对应的预压缩版本时发送压缩后的内容（Content-Encoding），
+    并带有 Vary: Accept-Encoding。
+
+    Args:
+        environ: WSGI environ（Flask 中为 request.environ）
+        path: 文件路径
+        mimetype: Content-Type，默认根据扩展名确定
+        response_class: 响应类，Flask 应用传入 app.response_class
+        validators: FileValidators 实例，提供时发送基于文件内容的强ETag
+        cache_control: Cache-Control 响应头，为空时不发送
+        etag: 已知的强ETag（例如内容寻址文件的摘要），提供时不再使用 validators
+        cache: IconCache 实例，提供时小文件在完整读取时被放入缓存，之后可用 send_cached_icon() 发送
+        variants: PrecompressedStore 实例，提供时可以发送预压缩版本
+        encoding: variants.negotiate() 为本次请求选出的内容编码
+
+    Returns:
+        响应对象
+
+    Raises:
+        OSError: 文件不存在或无法读取
+        RequestedRangeNotSatisfiable: 请求的范围超出文件大小
+    """
+    stat = os.stat(path)
+    content_type = mimetype or icon_mimetype(path)
+    last_modified = stat.st_mtime
+    if etag is None and validators is not None:
+        etag = validators.etag(path, stat)
+
+    # 客户端接受且已有预压缩版本时发送压缩版本，不同编码使用不同的ETag
+    source, headers = path, []
+    if variants is not None and is_compressible(path):
+        headers.append(('Vary', 'Accept-Encoding'))
+        variant = variants.lookup(path, etag, encoding) if etag else None
+        if variant is not None:
+            try:
+                stat = os.stat(variant)
+            except OSError:
+                # 压缩版本刚被删除，发送原文件
+                pass
+            else:
+                source, etag = variant, f'{etag}-{encoding}'
+                headers.append(('Content-Encoding', encoding))
+
+    # 直接设置 content_type，避免 werkzeug 给 image/svg+xml 追加 charset
+    response = response_class(None, content_type=content_type, direct_passthrough=True)
+    response.content_length = stat.st_size
+    response.last_modified = last_modified
+    if etag:
+        response.set_etag(etag)
+    for name, value in headers:
+        response.headers[name] = value
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+
+    file = None
+    if environ.get('REQUEST_METHOD') != 'HEAD' and is_resource_modified(
+            environ, etag, last_modified=response.last_modified):
+        if cache is not None and cache.accepts(stat.st_size):
+            # 小文件整体读入并缓存，之后的请求不再访问文件系统
+            entry = cache.load(path, stat.st_size, content_type, etag, last_modified,
+                               encoding=encoding, headers=headers, source=source)
+            if entry is not None:
+                return send_cached_icon(environ, entry, response_class, cache_control)
+        file = open(source, 'rb')
+        response.response = wrap_file(environ, file)
+    try:
+        return response.make_conditional(environ, accept_ranges=True, complete_length=stat.st_size)
+    except RequestedRangeNotSatisfiable:
+        if file is not None:
+            file.close()
+        raise
+
+
+def send_cached_icon(environ, entry, response_class=Response, cache_control=None):
+    """发送内存缓存中的图标，响应头与 send_icon_file() 相同，不访问文件系统
+
+    Args:
+        environ: WSGI environ
+        entry: IconCache 中的 CachedIcon
+        response_class: 响应类
+        cache_control: Cache-Control 响应头，为空时不发送
+
+    Returns:
+        响应对象
+    """
+    response = response_class(entry.body, content_type=entry.content_type)
+    response.last_modified = entry.last_modified
+    if entry.etag:
+        response.set_etag(entry.etag)
+    for name, value in entry.headers:
+        response.headers[name] = value
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(environ, accept_ranges=True, complete_length=len(entry.body))
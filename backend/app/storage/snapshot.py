@@ -0,0 +1,201 @@
+# 带偏移表的快照格式
+import os
+import json
+from .locking import atomic_write
+
+OFFSETS_VERSION = 1
+
+# 快照中尚未解码的记录
+_PENDING = object()
+
+
+def offsets_path(path):
+    """快照对应的偏移表文件路径"""
+    return path + '.offsets'
+
+
+def index_keys(value):
+    """字段值对应的二级索引键
+
+    列表字段（例如 tags）按每个元素建立索引，相当于倒排索引；重复元素和不可哈希的元素被忽略。
+    """
+    if isinstance(value, list):
+        return list(dict.fromkeys(item for item in value if not isinstance(item, (list, dict))))
+    return (value,)
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+
+
+def write_snapshot(path, records, index_fields=()):
+    """写入快照及其偏移表
+
+    快照仍是合法的JSON数组（可直接用于导入/导出），但每条记录单独占一行，
+    偏移表 <快照路径>.offsets 记录每条记录在文件中的字节范围，以及二级索引字段的
+    索引键 -> id列表（见 index_keys），加载时不需要解析任何记录。两个文件都原子替换；
+    偏移表保存快照的文件签名，快照被替换或手工修改后偏移表自动失效。
+
+    Args:
+        path: 快照JSON文件路径
+        records: 记录列表
+        index_fields: 需要写入偏移表的二级索引字段
+    """
+    parts = [b'[\n']
+    position = 2
+    ids, offsets, lengths = [], [], []
+    indexes = {field: {} for field in index_fields}
+
+    for number, record in enumerate(records):
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+        separator = b',\n' if number < len(records) - 1 else b'\n'
+        ids.append(record['id'])
+        offsets.append(position)
+        lengths.append(len(line))
+        parts.append(line + separator)
+        position += len(line) + len(separator)
+        for field, index in indexes.items():
+            for key in index_keys(record.get(field)):
+                index.setdefault(json.dumps(key, default=str), []).append(record['id'])
+    parts.append(b']\n')
+
+    atomic_write(path, b''.join(parts))
+    table = {
+        'version': OFFSETS_VERSION,
+        'snapshot': _signature(path),
+        'ids': ids,
+        'offsets': offsets,
+        'lengths': lengths,
+        'max_id': max([record_id for record_id in ids if isinstance(record_id, int)], default=0),
+        # 字段值可能不是字符串，以JSON文本作为键
+        'indexes': {field: [[json.loads(key), record_ids] for key, record_ids in index.items()]
+                    for field, index in indexes.items()},
+    }
+    atomic_write(offsets_path(path), json.dumps(table, separators=(',', ':')).encode('utf-8'))
+
+
+def load_snapshot(path):
+    """通过偏移表加载快照
+
+    Returns:
+        (LazyRecords, {字段: {字段值: 有序id列表}}, 最大整数ID)；偏移表不存在或已失效时返回None
+    """
+    try:
+        with open(offsets_path(path), 'r', encoding='utf-8') as f:
+            table = json.load(f)
+        if table.get('version') != OFFSETS_VERSION or table.get('snapshot') != _signature(path):
+            return None
+    except (OSError, ValueError):
+        return None
+
+    records = LazyRecords(path, table['ids'], table['offsets'], table['lengths'])
+    indexes = {
+        field: {value: sorted(record_ids) for value, record_ids in pairs}
+        for field, pairs in table.get('indexes', {}).items()
+    }
+    return records, indexes, table.get('max_id', 0)
+
+
+class LazyRecords(dict):
+    """id -> 记录 的字典，快照中的记录在第一次被访问时才解码
+
+    未解码的记录只保存字节范围；按键访问时只读取并解析对应的那一行，
+    values()/items() 一次读取整个文件后解码剩余的全部记录。
+    调用方需要保证访问期间快照文件没有被替换（JournalStore 在持有文件锁并确认
+    快照签名未变化后才会访问）。
+    """
+
+    def __init__(self, path, ids, offsets, lengths):
+        super().__init__()
+        self.path = path
+        # 都用内置函数批量构建，加载耗时只与偏移表大小有关
+        self._spans = dict(zip(ids, zip(offsets, lengths)))
+        dict.update(self, dict.fromkeys(ids, _PENDING))
+
+    @property
+    def pending(self):
+        """尚未解码的记录数"""
+        return len(self._spans)
+
+    def _decode(self, record_id):
+        offset, length = self._spans.pop(record_id)
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            record = json.loads(f.read(length))
+        dict.__setitem__(self, record_id, record)
+        return record
+
+    def prefetch(self, record_ids):
+        """批量解码指定的记录，只打开一次文件并按偏移顺序读取"""
+        spans = sorted((self._spans.pop(record_id), record_id) for record_id in record_ids if record_id in self._spans)
+        if not spans:
+            return
+        with open(self.path, 'rb') as f:
+            for (offset, length), record_id in spans:
+                f.seek(offset)
+                dict.__setitem__(self, record_id, json.loads(f.read(length)))
+
+    def scan(self, record_ids):
+        """按指定顺序逐条返回记录，未解码的记录临时解码、不保存在字典中
+
+        遍历结束后内存中仍只有偏移表。
+        """
+        content = None
+        for record_id in record_ids:
+            record = dict.get(self, record_id, _PENDING)
+            if record is not _PENDING:
+                yield record
+                continue
+            span = self._spans.get(record_id)
+            if span is None:
+                continue
+            if content is None:
+                with open(self.path, 'rb') as f:
+                    content = f.read()
+            offset, length = span
+            yield json.loads(content[offset:offset + length])
+
+    def _decode_all(self):
+        if not self._spans:
+            return
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        if len(self._spans) * 2 > len(self):
+            # 大部分记录都未解码时，一次解析整个文件比逐行解析更快
+            for record in json.loads(content):
+                if self._spans.pop(record['id'], None) is not None:
+                    dict.__setitem__(self, record['id'], record)
+        for record_id, (offset, length) in self._spans.items():
+            dict.__setitem__(self, record_id, json.loads(content[offset:offset + length]))
+        self._spans.clear()
+
+    def __getitem__(self, record_id):
+        record = dict.__getitem__(self, record_id)
+        if record is _PENDING:
+            record = self._decode(record_id)
+        return record
+
+    def get(self, record_id, default=None):
+        if record_id in self:
+            return self[record_id]
+        return default
+
+    def __setitem__(self, record_id, record):
+        self._spans.pop(record_id, None)
+        dict.__setitem__(self, record_id, record)
+
+    def pop(self, record_id, *default):
+        if record_id in self:
+            record = self[record_id]
+            dict.pop(self, record_id)
+            return record
+        return dict.pop(self, record_id, *default)
+
+    def values(self):
+        self._decode_all()
+        return dict.values(self)
+
+    def items(self):
+        self._decode_all()
+        return dict.items(self)
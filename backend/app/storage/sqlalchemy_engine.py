@@ -0,0 +1,198 @@
+# SQLAlchemy存储引擎
+from datetime import datetime
+from .engine import StorageEngine, _page
+
+# 数据库中保存共享数据版本的行（storage_generation 表与 SQLiteEngine 的结构相同）
+GENERATION_NAME = 'database'
+
+
+def install_generation_tracking(db):
+    """让数据库的每个写事务在提交前把共享的数据版本加一
+
+    版本号与数据在同一个事务中提交，因此共用同一数据库的所有工作进程都能通过
+    database_generation() 看到任何进程的写入（包括 bulk_update_mappings、query.update() 等批量写入）。
+    需在应用上下文中调用，会创建 storage_generation 表。
+
+    Args:
+        db: Flask-SQLAlchemy 实例
+    """
+    from sqlalchemy import event, text
+    from sqlalchemy.exc import IntegrityError
+
+    engine = db.engine
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE IF NOT EXISTS storage_generation '
+                                '(name VARCHAR(64) PRIMARY KEY, generation INTEGER NOT NULL)'))
+    try:
+        with engine.begin() as connection:
+            row = connection.execute(text('SELECT 1 FROM storage_generation WHERE name = :name'),
+                                     {'name': GENERATION_NAME}).first()
+            if row is None:
+                connection.execute(text('INSERT INTO storage_generation (name, generation) VALUES (:name, 0)'),
+                                   {'name': GENERATION_NAME})
+    except IntegrityError:
+        # 另一个工作进程同时插入了该行
+        pass
+
+    bump = text('UPDATE storage_generation SET generation = generation + 1 WHERE name = :name')
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _mark_write(connection, cursor, statement, parameters, context, executemany):
+        if context is not None and (context.isinsert or context.isupdate or context.isdelete):
+            connection.info['storage_written'] = True
+
+    @event.listens_for(engine, 'commit')
+    @event.listens_for(engine, 'rollback')
+    def _clear_write(connection):
+        connection.info.pop('storage_written', None)
+
+    @event.listens_for(db.session, 'before_commit')
+    def _bump_generation(session):
+        # 先刷新未写入的修改，再根据本事务是否执行过写语句决定是否递增版本
+        session.flush()
+        connection = session.connection()
+        if connection.info.get('storage_written'):
+            connection.execute(bump, {'name': GENERATION_NAME})
+
+
+def database_generation(db):
+    """读取数据库中共享的数据版本，见 install_generation_tracking()"""
+    from sqlalchemy import text
+    return db.session.execute(text('SELECT generation FROM storage_generation WHERE name = :name'),
+                              {'name': GENERATION_NAME}).scalar() or 0
+
+
+class SQLAlchemyEngine(StorageEngine):
+    """基于 Flask-SQLAlchemy 模型的存储引擎
+
+    记录通过模型的 to_dict() 转换为字典，模型定义了 to_dict_many(objects) 类方法时
+    多条记录一次性转换（用于批量查询关联数据，避免N+1查询）；写入时只设置模型上存在的属性
+    （列或带setter的属性，例如 Icon.tags），日期列接受ISO格式字符串。
+    批量操作在一个事务内完成。
+
+    generation() 读取数据库中共享的数据版本，需先调用 install_generation_tracking()；
+    任何工作进程、以及不经过本引擎的写入都会使其改变。
+    """
+
+    def __init__(self, db, model):
+        """初始化
+
+        Args:
+            db: Flask-SQLAlchemy 实例
+            model: 模型类，需要有 id 主键和 to_dict() 方法
+        """
+        self.db = db
+        self.model = model
+
+    def _to_dicts(self, objects):
+        to_dict_many = getattr(self.model, 'to_dict_many', None)
+        if to_dict_many is not None:
+            return to_dict_many(objects)
+        return [obj.to_dict() for obj in objects]
+
+    def _assign(self, obj, values):
+        """把字典中的字段写到模型对象上"""
+        columns = self.model.__table__.columns
+        for key, value in values.items():
+            if key == 'id' or not hasattr(self.model, key):
+                continue
+            column = columns.get(key)
+            if column is not None and isinstance(value, str) and isinstance(column.type, self.db.DateTime):
+                value = datetime.fromisoformat(value)
+            setattr(obj, key, value)
+
+    def _query(self):
+        return self.model.query
+
+    def _commit(self):
+        self.db.session.commit()
+
+    def generation(self):
+        return database_generation(self.db)
+
+    def get_many(self, record_ids):
+        record_ids = list(record_ids)
+        if not record_ids:
+            return []
+        objects = {obj.id: obj for obj in self._query().filter(self.model.id.in_(record_ids)).all()}
+        return self._to_dicts([objects[record_id] for record_id in record_ids if record_id in objects])
+
+    def list_all(self):
+        return self._to_dicts(self._query().all())
+
+    def list_page(self, limit, after=None, category_id=None):
+        query = self._query()
+        if after is not None:
+            query = query.filter(self.model.id > after)
+        if category_id is not None:
+            query = query.filter(getattr(self.model, self.category_field) == category_id)
+        objects = query.order_by(self.model.id).limit(limit + 1).all()
+        return _page(self._to_dicts(objects), limit)
+
+    def tagged_ids(self, tags, match='all'):
+        # 模型提供 tagged_ids(tags, match) 类方法时（例如通过标签关联表查询）直接使用
+        tagged_ids = getattr(self.model, 'tagged_ids', None)
+        if tagged_ids is not None:
+            return tagged_ids(tags, match)
+        return super().tagged_ids(tags, match)
+
+    def search(self, query, limit=50):
+        # 模型提供 search_ids(query, limit) 类方法时（例如 FTS5 全文索引）使用它返回的ID顺序，
+        # 返回None表示全文索引不可用
+        search_ids = getattr(self.model, 'search_ids', None)
+        if search_ids is not None:
+            record_ids = search_ids(query, limit)
+            if record_ids is not None:
+                return self.get_many(record_ids)
+        return super().search(query, limit)
+
+    def find(self, field, value):
+        return self._to_dicts(self._query().filter_by(**{field: value}).all())
+
+    def count_by_category(self):
+        column = getattr(self.model, self.category_field)
+        rows = self.db.session.query(column, self.db.func.count(self.model.id)).group_by(column).all()
+        return {category_id: count for category_id, count in rows}
+
+    def insert_many(self, records):
+        objects = []
+        for record in records:
+            obj = self.model()
+            self._assign(obj, record)
+            objects.append(obj)
+        self.db.session.add_all(objects)
+        self._commit()
+        return self._to_dicts(objects)
+
+    def update_many(self, changes_by_id):
+        if not changes_by_id:
+            return []
+        objects = self._query().filter(self.model.id.in_(list(changes_by_id))).all()
+        for obj in objects:
+            self._assign(obj, changes_by_id[obj.id])
+        self._commit()
+        return self._to_dicts(objects)
+
+    def update_where(self, field, value, changes):
+        columns = self.model.__table__.columns
+        if field not in columns or not hasattr(self.model, field):
+            return super().update_where(field, value, changes)
+        # 只更新模型上的列（例如 Icon 没有 category_name 列，分类名称通过关系获得）
+        values = {key: change for key, change in changes.items()
+                  if key != 'id' and key in columns and hasattr(self.model, key)}
+        if not values:
+            return self._query().filter(getattr(self.model, field) == value).count()
+        count = self._query().filter(getattr(self.model, field) == value).update(values, synchronize_session=False)
+        self._commit()
+        return count
+
+    def delete_many(self, record_ids):
+        record_ids = list(record_ids)
+        if not record_ids:
+            return []
+        objects = self._query().filter(self.model.id.in_(record_ids)).all()
+        deleted = self._to_dicts(objects)
+        for obj in objects:
+            self.db.session.delete(obj)
+        self._commit()
+        return deleted
@@ -0,0 +1,408 @@
+# 基于标准库 sqlite3 的存储引擎
+import os
+import json
+import sqlite3
+import threading
+from contextlib import nullcontext
+from .engine import StorageEngine, _page
+from .journal import JournalStore
+from .snapshot import index_keys
+from .search import SEARCH_WEIGHTS, FTS5_OPTIONS, search_terms, search_text, fts_search_ids, fts5_available
+from .sequence import SequenceAllocator
+from .sqlite_tuning import BUSY_TIMEOUT, apply_sqlite_pragmas
+
+# IN (...) 查询每批的参数个数，低于 SQLite 默认的变量数上限
+_BATCH_SIZE = 500
+
+
+def _chunks(values, size=_BATCH_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class SQLiteEngine(StorageEngine):
+    """基于标准库 sqlite3 的存储引擎，用于 Flask-SQLAlchemy 不可用时的降级模式
+
+    每条记录保存为一行：id 为 INTEGER PRIMARY KEY，其余字段以JSON保存在 data 列中，
+    因此返回给前端的JSON结构与文件存储完全一致；index_fields 中的字段另外保存为独立的列并建立索引，
+    按分类查询和统计直接走索引；index_fields 包含 tags 时，标签另外保存在 <表名>_tags 表中
+    （主键为 (标签, 记录ID)），按标签筛选由 SQLite 对各标签的ID集合求交集/并集；
+    full_text 为True时文件名、标签和描述另外写入 FTS5 表 <表名>_fts，search() 按 bm25 排序。
+    连接参数见 sqlite_tuning（默认WAL模式，读写互不阻塞）；所有SQL都是固定文本加参数，
+    由 sqlite3 的语句缓存复用预编译结果。每个线程使用独立的连接。
+
+    首次打开且 import_path 指向的JSON快照（及其日志）存在时自动导入原有数据，只导入一次。
+    """
+
+    def __init__(self, db_path, table, index_fields=('category_id',), default=None, import_path=None,
+                 full_text=False):
+        """初始化
+
+        Args:
+            db_path: SQLite数据库文件路径
+            table: 表名
+            index_fields: 需要建立索引的字段
+            default: 首次打开且没有可导入的数据时写入的初始记录
+            import_path: 需要导入的JSON快照路径
+            full_text: 是否为 SEARCH_WEIGHTS 中的字段建立 FTS5 全文索引
+        """
+        self.db_path = os.path.abspath(db_path)
+        self.table = table
+        index_fields = tuple(index_fields or ())
+        # 标签字段的值是列表，不能保存为一列，改为保存在单独的 (标签, 记录ID) 表中
+        self.tag_index = self.tag_field in index_fields
+        self.tag_table = f'{table}_{self.tag_field}'
+        self.index_fields = tuple(field for field in index_fields if field != self.tag_field)
+        self.full_text = full_text
+        self.fts_table = f'{table}_fts'
+        self._local = threading.local()
+
+        directory = os.path.dirname(self.db_path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # 固定的SQL文本，配合连接的语句缓存只编译一次
+        columns = ', '.join(['id', 'data'] + [self._column(field) for field in self.index_fields])
+        placeholders = ', '.join(['?'] * (2 + len(self.index_fields)))
+        assignments = ', '.join(['data = ?'] + [f'{self._column(field)} = ?' for field in self.index_fields])
+        self._sql_insert = f'INSERT INTO "{table}" ({columns}) VALUES ({placeholders})'
+        self._sql_update = f'UPDATE "{table}" SET {assignments} WHERE id = ?'
+        self._sql_all = f'SELECT id, data FROM "{table}" ORDER BY id'
+        search_fields = ', '.join(SEARCH_WEIGHTS)
+        self._sql_insert_fts = (f'INSERT INTO "{self.fts_table}" (rowid, {search_fields}) '
+                                f'VALUES (?{", ?" * len(SEARCH_WEIGHTS)})')
+        self._sql_insert_tag = f'INSERT OR IGNORE INTO "{self.tag_table}" (tag, record_id) VALUES (?, ?)'
+        self._sql_generation = 'SELECT generation FROM storage_generation WHERE name = ?'
+        self._sql_bump = ('INSERT INTO storage_generation (name, generation) VALUES (?, 1) '
+                          'ON CONFLICT(name) DO UPDATE SET generation = generation + 1')
+
+        self._create_schema()
+        self._initialize(default, import_path)
+
+    # ---- 连接与表结构 ----
+
+    @staticmethod
+    def _column(field):
+        return f'"idx_{field}"'
+
+    def _connection(self):
+        """获取当前线程的数据库连接"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT,
+                                         isolation_level=None, cached_statements=256)
+            apply_sqlite_pragmas(connection)
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self):
+        """开始一个写事务（BEGIN IMMEDIATE，避免读后升级写锁时死锁），已在写事务中时沿用外层事务"""
+        connection = self._connection()
+        if connection.in_transaction:
+            return nullcontext(connection)
+        return _Transaction(connection)
+
+    def exclusive(self):
+        return self._transaction()
+
+    def _bump_generation(self, connection):
+        """在当前写事务内递增表的数据版本"""
+        connection.execute(self._sql_bump, (self.table,))
+
+    def _create_schema(self):
+        connection = self._connection()
+        connection.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" '
+                           f'(id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL)')
+        connection.execute('CREATE TABLE IF NOT EXISTS storage_generation '
+                           '(name TEXT PRIMARY KEY, generation INTEGER NOT NULL)')
+        connection.execute('CREATE TABLE IF NOT EXISTS storage_initialized (name TEXT PRIMARY KEY)')
+
+        for field in self.index_fields:
+            if f'idx_{field}' in self._columns(connection):
+                continue
+            # 新增的索引字段：加列后用已有数据回填。多个进程可能同时启动，
+            # 在写事务内重新检查，只有第一个进程加列，其余进程看到列已存在后跳过
+            with self._transaction():
+                if f'idx_{field}' in self._columns(connection):
+                    continue
+                connection.execute(f'ALTER TABLE "{self.table}" ADD COLUMN {self._column(field)}')
+                rows = connection.execute(f'SELECT id, data FROM "{self.table}"').fetchall()
+                connection.executemany(
+                    f'UPDATE "{self.table}" SET {self._column(field)} = ? WHERE id = ?',
+                    [(json.loads(data).get(field), record_id) for record_id, data in rows]
+                )
+        for field in self.index_fields:
+            connection.execute(f'CREATE INDEX IF NOT EXISTS "{self.table}_{field}" '
+                               f'ON "{self.table}" ({self._column(field)})')
+
+        if self.tag_index:
+            with self._transaction():
+                exists = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                            (self.tag_table,)).fetchone()
+                if not exists:
+                    connection.execute(f'CREATE TABLE "{self.tag_table}" (tag NOT NULL, record_id INTEGER NOT NULL, '
+                                       f'PRIMARY KEY (tag, record_id)) WITHOUT ROWID')
+                    connection.execute(f'CREATE INDEX "{self.tag_table}_record_id" ON "{self.tag_table}" (record_id)')
+                    # 新建的标签表：用已有数据回填
+                    for record_id, data in connection.execute(f'SELECT id, data FROM "{self.table}"').fetchall():
+                        self._insert_tags(connection, record_id, json.loads(data))
+
+        if self.full_text and not fts5_available(connection):
+            print(f"警告: SQLite 不支持 FTS5，{self.table} 的搜索将逐条匹配")
+            self.full_text = False
+        if self.full_text:
+            with self._transaction():
+                exists = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                            (self.fts_table,)).fetchone()
+                if not exists:
+                    connection.execute(f'CREATE VIRTUAL TABLE "{self.fts_table}" USING fts5('
+                                       f'{", ".join(SEARCH_WEIGHTS)}, {FTS5_OPTIONS})')
+                    for record_id, data in connection.execute(f'SELECT id, data FROM "{self.table}"').fetchall():
+                        self._insert_fts(connection, record_id, json.loads(data))
+
+    def _columns(self, connection):
+        """表中现有的列名"""
+        return {row[1] for row in connection.execute(f'PRAGMA table_info("{self.table}")')}
+
+    def _initialized(self, connection):
+        """表是否已经初始化过：有初始化标记，或者（标记出现之前创建的数据库）已有数据或写入过"""
+        return bool(
+            connection.execute('SELECT 1 FROM storage_initialized WHERE name = ?', (self.table,)).fetchone()
+            or connection.execute(f'SELECT 1 FROM "{self.table}" LIMIT 1').fetchone()
+            or connection.execute(self._sql_generation, (self.table,)).fetchone()
+        )
+
+    def _initialize(self, default, import_path):
+        """首次打开时导入原有JSON数据或写入初始记录，只进行一次
+
+        是否已初始化由 storage_initialized 表中的标记决定，而不是表是否为空，
+        因此删除全部记录后重启不会再次导入。
+        """
+        if self._connection().execute('SELECT 1 FROM storage_initialized WHERE name = ?',
+                                      (self.table,)).fetchone():
+            return
+
+        # 在写事务内检查，避免多个进程同时导入
+        with self._transaction() as connection:
+            if not self._initialized(connection):
+                if import_path and (os.path.exists(import_path) or os.path.exists(import_path + '.journal')):
+                    records = JournalStore(import_path).all()
+                    print(f"从 {import_path} 导入 {len(records)} 条记录到 {self.db_path}")
+                    self._insert_rows(connection, records)
+                    # 沿用原有的ID高水位，已删除记录的ID不会被重新分配
+                    next_id = SequenceAllocator(import_path + '.seq').peek()
+                    connection.execute('DELETE FROM sqlite_sequence WHERE name = ?', (self.table,))
+                    connection.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)',
+                                       (self.table, max([next_id - 1] + [record['id'] for record in records])))
+                else:
+                    self._insert_rows(connection, default or [])
+            connection.execute('INSERT OR IGNORE INTO storage_initialized (name) VALUES (?)', (self.table,))
+
+    # ---- 记录转换 ----
+
+    @staticmethod
+    def _to_record(record_id, data):
+        record = {'id': record_id}
+        record.update(json.loads(data))
+        return record
+
+    def _row_values(self, record):
+        data = json.dumps({key: value for key, value in record.items() if key != 'id'},
+                          ensure_ascii=False, default=str)
+        return [data] + [record.get(field) for field in self.index_fields]
+
+    def _insert_tags(self, connection, record_id, record):
+        tags = index_keys(record.get(self.tag_field) or [])
+        connection.executemany(self._sql_insert_tag, [(tag, record_id) for tag in tags])
+
+    def _delete_tags(self, connection, record_ids):
+        for chunk in _chunks(list(record_ids)):
+            connection.execute(f'DELETE FROM "{self.tag_table}" WHERE record_id IN ({", ".join("?" * len(chunk))})',
+                               chunk)
+
+    def _insert_fts(self, connection, record_id, record):
+        connection.execute(self._sql_insert_fts,
+                           [record_id] + [search_text(record.get(field)) for field in SEARCH_WEIGHTS])
+
+    def _delete_fts(self, connection, record_ids):
+        for chunk in _chunks(list(record_ids)):
+            connection.execute(f'DELETE FROM "{self.fts_table}" WHERE rowid IN ({", ".join("?" * len(chunk))})',
+                               chunk)
+
+    def _fetch(self, sql, params=()):
+        return [self._to_record(record_id, data)
+                for record_id, data in self._connection().execute(sql, params)]
+
+    def _fetch_by_ids(self, record_ids):
+        records = {}
+        for chunk in _chunks(list(record_ids)):
+            sql = f'SELECT id, data FROM "{self.table}" WHERE id IN ({", ".join("?" * len(chunk))})'
+            for record in self._fetch(sql, chunk):
+                records[record['id']] = record
+        return records
+
+    # ---- 读取 ----
+
+    def generation(self):
+        row = self._connection().execute(self._sql_generation, (self.table,)).fetchone()
+        return row[0] if row else 0
+
+    def get_many(self, record_ids):
+        record_ids = list(record_ids)
+        records = self._fetch_by_ids(record_ids)
+        return [records[record_id] for record_id in record_ids if record_id in records]
+
+    def list_all(self):
+        return self._fetch(self._sql_all)
+
+    def scan(self):
+        for record_id, data in self._connection().execute(self._sql_all):
+            yield self._to_record(record_id, data)
+
+    def list_page(self, limit, after=None, category_id=None):
+        if category_id is not None and self.category_field not in self.index_fields:
+            return super().list_page(limit, after, category_id)
+        conditions, params = ['id > ?'], [after if after is not None else -(2 ** 63)]
+        if category_id is not None:
+            conditions.append(f'{self._column(self.category_field)} = ?')
+            params.append(category_id)
+        params.append(limit + 1)
+        records = self._fetch(f'SELECT id, data FROM "{self.table}" WHERE {" AND ".join(conditions)} '
+                              f'ORDER BY id LIMIT ?', params)
+        return _page(records, limit)
+
+    def tagged_ids(self, tags, match='all'):
+        if not self.tag_index:
+            return super().tagged_ids(tags, match)
+        tags = list(dict.fromkeys(tags))
+        if not tags:
+            return []
+        if match == 'any':
+            sql = (f'SELECT DISTINCT record_id FROM "{self.tag_table}" '
+                   f'WHERE tag IN ({", ".join("?" * len(tags))}) ORDER BY record_id')
+        else:
+            sql = ' INTERSECT '.join([f'SELECT record_id FROM "{self.tag_table}" WHERE tag = ?'] * len(tags))
+            sql += ' ORDER BY record_id'
+        return [row[0] for row in self._connection().execute(sql, tags)]
+
+    def search(self, query, limit=50):
+        if not self.full_text:
+            return super().search(query, limit)
+        ids = fts_search_ids(self._connection().execute, self.fts_table, search_terms(query), limit)
+        return self.get_many(ids)
+
+    def find(self, field, value):
+        if field == 'id':
+            return self.get_many([value])
+        if field in self.index_fields:
+            return self._fetch(f'SELECT id, data FROM "{self.table}" WHERE {self._column(field)} = ? ORDER BY id',
+                               (value,))
+        return [record for record in self.list_all() if record.get(field) == value]
+
+    def count_by_category(self):
+        if self.category_field in self.index_fields:
+            column = self._column(self.category_field)
+            rows = self._connection().execute(f'SELECT {column}, COUNT(*) FROM "{self.table}" GROUP BY {column}')
+            return dict(rows.fetchall())
+        counts = {}
+        for record in self.list_all():
+            value = record.get(self.category_field)
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+    # ---- 写入 ----
+
+    def _insert_rows(self, connection, records):
+        """在当前事务内插入记录，没有 'id' 的记录由 AUTOINCREMENT 分配（不会复用已删除的ID）"""
+        inserted = []
+        for record in records:
+            cursor = connection.execute(self._sql_insert, [record.get('id')] + self._row_values(record))
+            result = {'id': cursor.lastrowid}
+            result.update((key, value) for key, value in record.items() if key != 'id')
+            if self.tag_index:
+                self._insert_tags(connection, result['id'], result)
+            if self.full_text:
+                self._insert_fts(connection, result['id'], result)
+            inserted.append(result)
+        if inserted:
+            self._bump_generation(connection)
+        return inserted
+
+    def insert_many(self, records):
+        with self._transaction() as connection:
+            return self._insert_rows(connection, records)
+
+    def update_many(self, changes_by_id):
+        if not changes_by_id:
+            return []
+        with self._transaction() as connection:
+            records = self._fetch_by_ids(list(changes_by_id))
+            updated = []
+            for record_id, record in records.items():
+                record.update(changes_by_id[record_id])
+                record['id'] = record_id
+                connection.execute(self._sql_update, self._row_values(record) + [record_id])
+                if self.tag_index and self.tag_field in changes_by_id[record_id]:
+                    self._delete_tags(connection, [record_id])
+                    self._insert_tags(connection, record_id, record)
+                if self.full_text and any(field in changes_by_id[record_id] for field in SEARCH_WEIGHTS):
+                    self._delete_fts(connection, [record_id])
+                    self._insert_fts(connection, record_id, record)
+                updated.append(record)
+            if updated:
+                self._bump_generation(connection)
+        return updated
+
+    def update_where(self, field, value, changes):
+        changes = {key: change for key, change in changes.items() if key != 'id'}
+        derived = [key for key in changes if key == self.tag_field or (self.full_text and key in SEARCH_WEIGHTS)]
+        if field not in self.index_fields or not changes or derived:
+            return super().update_where(field, value, changes)
+        # 一条 UPDATE 语句：json_set 修改 data 中的字段，同时更新对应的索引列
+        paths = ''.join(', ?, json(?)' for _ in changes)
+        assignments = [f'data = json_set(data{paths})']
+        params = []
+        for key, change in changes.items():
+            params += ['$."' + key.replace('"', '""') + '"', json.dumps(change, ensure_ascii=False, default=str)]
+        for key in changes:
+            if key in self.index_fields:
+                assignments.append(f'{self._column(key)} = ?')
+                params.append(changes[key])
+        params.append(value)
+        with self._transaction() as connection:
+            count = connection.execute(f'UPDATE "{self.table}" SET {", ".join(assignments)} '
+                                       f'WHERE {self._column(field)} = ?', params).rowcount
+            if count:
+                self._bump_generation(connection)
+        return count
+
+    def delete_many(self, record_ids):
+        record_ids = list(record_ids)
+        if not record_ids:
+            return []
+        with self._transaction() as connection:
+            records = self._fetch_by_ids(record_ids)
+            for chunk in _chunks(list(records)):
+                connection.execute(f'DELETE FROM "{self.table}" WHERE id IN ({", ".join("?" * len(chunk))})', chunk)
+            if self.tag_index:
+                self._delete_tags(connection, records)
+            if self.full_text:
+                self._delete_fts(connection, records)
+            if records:
+                self._bump_generation(connection)
+        return [records[record_id] for record_id in record_ids if record_id in records]
+
+
+class _Transaction:
+    """写事务上下文：正常退出时提交，出现异常时回滚"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
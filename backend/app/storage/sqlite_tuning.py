@@ -0,0 +1,103 @@
+# SQLite 连接性能参数
+import os
+
+# 数据库连接的忙等待超时（秒），多进程同时写入时等待而不是直接报错
+BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '5'))
+
+_JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+_SYNCHRONOUS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+def _choice(name, default, allowed):
+    value = os.getenv(name, default).upper()
+    if value not in allowed:
+        print(f"警告: {name}={value} 无效，使用默认值 {default}")
+        return default
+    return value
+
+
+# 每个新连接执行的 PRAGMA：
+# WAL 模式下读写互不阻塞，批量上传时的并发读取不再等待写锁；
+# WAL 下 synchronous=NORMAL 只在检查点时fsync，仍能保证数据库不损坏；
+# cache_size 为负数时单位是KiB；mmap_size 让读取直接走内存映射，为0时关闭
+SQLITE_PRAGMAS = {
+    'journal_mode': _choice('SQLITE_JOURNAL_MODE', 'WAL', _JOURNAL_MODES),
+    'synchronous': _choice('SQLITE_SYNCHRONOUS', 'NORMAL', _SYNCHRONOUS),
+    'busy_timeout': int(BUSY_TIMEOUT * 1000),
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-20000')),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'temp_store': 'MEMORY',
+}
+
+
+def apply_sqlite_pragmas(connection, pragmas=None):
+    """在DB-API连接（sqlite3.Connection）上执行性能参数
+
+    Args:
+        connection: sqlite3 连接
+        pragmas: PRAGMA 名称 -> 值，默认使用 SQLITE_PRAGMAS
+    """
+    cursor = connection.cursor()
+    try:
+        for name, value in (pragmas or SQLITE_PRAGMAS).items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def _is_sqlite(database_uri):
+    return database_uri.startswith('sqlite')
+
+
+def _is_memory(database_uri):
+    return database_uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in database_uri
+
+
+def sqlalchemy_engine_options(database_uri):
+    """生成 SQLALCHEMY_ENGINE_OPTIONS
+
+    SQLite 文件数据库使用连接池（SQLAlchemy 2 的默认行为），连接可以在线程间复用，
+    等待锁的超时与 PRAGMA busy_timeout 一致；内存数据库只有一个连接，不设置连接池参数。
+
+    Args:
+        database_uri: 数据库连接URI
+
+    Returns:
+        传给 create_engine 的参数字典
+    """
+    options = {}
+    if _is_sqlite(database_uri):
+        if _is_memory(database_uri):
+            return options
+        options['connect_args'] = {'timeout': BUSY_TIMEOUT, 'check_same_thread': False}
+
+    options['pool_size'] = int(os.getenv('SQLALCHEMY_POOL_SIZE', '10'))
+    options['max_overflow'] = int(os.getenv('SQLALCHEMY_MAX_OVERFLOW', '20'))
+    options['pool_timeout'] = float(os.getenv('SQLALCHEMY_POOL_TIMEOUT', '30'))
+    options['pool_recycle'] = int(os.getenv('SQLALCHEMY_POOL_RECYCLE', '-1' if _is_sqlite(database_uri) else '3600'))
+    # 网络数据库的连接可能被服务端断开，取出前先检查
+    options['pool_pre_ping'] = os.getenv('SQLALCHEMY_POOL_PRE_PING',
+                                         'false' if _is_sqlite(database_uri) else 'true').lower() == 'true'
+    return options
+
+
+def install_sqlite_tuning(engine, pragmas=None):
+    """让 SQLAlchemy 引擎的每个新连接都执行性能参数
+
+    Args:
+        engine: SQLAlchemy Engine（Flask-SQLAlchemy 的 db.engine，需在应用上下文中获取）
+        pragmas: PRAGMA 名称 -> 值，默认使用 SQLITE_PRAGMAS
+
+    Returns:
+        是否已注册（非SQLite数据库返回False）
+    """
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+    return True
@@ -0,0 +1,146 @@
+# 图标文件的缓存验证信息（强ETag）
+import os
+import hashlib
+import threading
+
+# 计算哈希时每次读取的字节数
+_CHUNK_SIZE = 64 * 1024
+
+
+def file_digest(path):
+    """分块读取文件并计算内容的SHA-256，返回十六进制字符串"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileValidators:
+    """为图标文件提供强ETag，每个文件的内容只计算一次哈希
+
+    以相对于图标存储目录的路径为键，把 {'path', 'etag', 'size', 'mtime_ns'} 保存在存储引擎中
+    （与图标元数据放在同一数据目录，重启后无需重新计算）；文件大小或修改时间与记录不一致时
+    重新计算。进程内另有字典缓存，命中时只需要调用方已有的一次 stat，不打开文件。
+    每个路径只有一条记录（通过引擎的 upsert() 写入）；文件被重命名或移动后调用 move()/move_tree()
+    把记录转到新路径，否则旧路径的记录会一直让 in_use() 认为内容仍被使用。
+    """
+
+    # 存储引擎需要建立索引的字段：按路径查找记录，按ETag判断内容是否仍被使用
+    INDEX_FIELDS = ('path', 'etag')
+
+    def __init__(self, engine, root):
+        """初始化
+
+        Args:
+            engine: 保存验证信息的存储引擎，需要对 INDEX_FIELDS 中的字段建立索引
+            root: 图标存储目录
+        """
+        self.engine = engine
+        self.root = os.path.abspath(root)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _key(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, '/')
+
+    def etag(self, path, stat=None):
+        """获取文件的强ETag（内容的SHA-256）
+
+        Args:
+            path: 文件路径
+            stat: 文件的 os.stat() 结果，调用方已经获取时传入以免重复 stat
+
+        Returns:
+            ETag 值（不含引号）
+        """
+        stat = stat or os.stat(path)
+        key = self._key(path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+
+        record = self.engine.find_first('path', key)
+        if record is not None and (record.get('size'), record.get('mtime_ns')) == signature:
+            etag = record['etag']
+            with self._lock:
+                self._entries[key] = (signature, etag)
+            return etag
+        return self._save(key, stat, file_digest(path))
+
+    def remember(self, path, etag, stat=None):
+        """保存已知的ETag（例如上传时边写入边计算的SHA-256），之后不必再读取文件计算"""
+        return self._save(self._key(path), stat or os.stat(path), etag)
+
+    def _save(self, key, stat, etag):
+        # 多个工作进程可能同时为同一文件计算ETag，upsert 保证只留下一条记录
+        self.engine.upsert('path', key, {'etag': etag, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+        with self._lock:
+            self._entries[key] = ((stat.st_size, stat.st_mtime_ns), etag)
+        return etag
+
+    def move(self, old_path, new_path):
+        """文件被重命名或移动后把验证信息转到新路径（内容、大小和修改时间不变，不必重新计算）
+
+        Returns:
+            新路径上原有记录的ETag（被覆盖的文件），没有时返回None
+        """
+        old_key, new_key = self._key(old_path), self._key(new_path)
+        if old_key == new_key:
+            return None
+        with self._lock:
+            entry = self._entries.pop(old_key, None)
+            replaced = self._entries.pop(new_key, None)
+        replaced = replaced[1] if replaced is not None else None
+        with self.engine.exclusive():
+            existing = self.engine.find('path', new_key)
+            if existing:
+                replaced = replaced or existing[0].get('etag')
+                self.engine.delete_many([record['id'] for record in existing])
+            records = self.engine.find('path', old_key)
+            if records:
+                self.engine.delete_many([record['id'] for record in records[1:]])
+                self.engine.update(records[0]['id'], {'path': new_key})
+        if entry is not None:
+            with self._lock:
+                self._entries[new_key] = entry
+        return replaced
+
+    def move_tree(self, old_dir, new_dir):
+        """目录被重命名后把其中所有文件的验证信息转到新目录
+
+        按新目录中现有的文件逐个通过 path 索引查找原记录，不需要读取全部记录。
+        """
+        old_prefix = self._key(old_dir) + '/'
+        new_prefix = self._key(new_dir) + '/'
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(old_prefix)]:
+                self._entries[new_prefix + key[len(old_prefix):]] = self._entries.pop(key)
+        names = [self._key(os.path.join(directory, filename))[len(new_prefix):]
+                 for directory, _, filenames in os.walk(new_dir) for filename in filenames]
+        with self.engine.exclusive():
+            self.engine.update_many({record['id']: {'path': new_prefix + name}
+                                     for name in names
+                                     for record in self.engine.find('path', old_prefix + name)})
+
+    def forget(self, path):
+        """文件被删除后丢弃它的验证信息
+
+        Returns:
+            该文件记录的ETag，没有记录时返回None
+        """
+        key = self._key(path)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        etag = entry[1] if entry is not None else None
+        records = self.engine.find('path', key)
+        if records:
+            etag = etag or records[0].get('etag')
+            self.engine.delete_many([record['id'] for record in records])
+        return etag
+
+    def in_use(self, etag):
+        """是否还有其他文件记录了相同的ETag（内容相同）"""
+        return self.engine.find_first('etag', etag) is not None
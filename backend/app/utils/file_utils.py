@@ -2,7 +2,6 @@
 import os
 import shutil
 import re
-import json
 from werkzeug.utils import secure_filename
 
 class FileUtils:
@@ -46,51 +45,6 @@ class FileUtils:
         """
         return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
     
-    @staticmethod
-    def load_json_file(file_path, default=None):
-        """加载JSON文件
-        
-        Args:
-            file_path: JSON文件路径
-            default: 文件不存在时的默认返回值
-            
-        Returns:
-            JSON数据或默认值
-        """
-        if default is None:
-            default = {}
-            
-        try:
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return default
-        except (json.JSONDecodeError, IOError):
-            return default
-    
-    @staticmethod
-    def save_json_file(file_path, data, ensure_directories=True):
-        """保存数据到JSON文件
-        
-        Args:
-            file_path: JSON文件路径
-            data: 要保存的数据
-            ensure_directories: 是否确保目录存在
-            
-        Returns:
-            布尔值，表示操作是否成功
-        """
-        try:
-            if ensure_directories:
-                directory = os.path.dirname(file_path)
-                FileUtils.ensure_directory_exists(directory)
-                
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            return True
-        except IOError:
-            return False
-    
     @staticmethod
     def move_file(source_path, destination_path):
         """移动文件
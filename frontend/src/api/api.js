@@ -19,6 +19,17 @@ const api = {
         return await this.request(url, 'GET');
     },
     
+    /**
+     * Search icons by filename, tags and description (server-side, ranked)
+     * @param {string} query - Search keywords, each matched as a prefix
+     * @param {number} limit - Maximum number of results
+     * @returns {Promise}
+     */
+    async searchIcons(query, limit = 50) {
+        const params = new URLSearchParams({ q: query, limit: String(limit) });
+        return await this.request(`${API_BASE_URL}/icons/search?${params}`, 'GET');
+    },
+    
     /**
      * Get single icon information
      * @param {string} iconId - Icon ID